@@ -0,0 +1,253 @@
+# agent_cache.py
+import asyncio
+import concurrent.futures
+import itertools
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger("agent-cache")
+
+# Firestore advises ~100 listeners per client, and the config and KB caches share one
+AGENT_CACHE_MAX_WATCHES = int(os.getenv("AGENT_CACHE_MAX_WATCHES", "30"))
+
+# Resolves an in-flight load whose owner was cancelled; waiters retry and one becomes the new owner
+_ABANDONED = object()
+
+_versions = itertools.count(1)
+
+
+class _Entry:
+    __slots__ = ("value", "size", "loaded_at", "version")
+
+    def __init__(self, value, size, loaded_at):
+        self.value = value
+        self.size = size
+        self.loaded_at = loaded_at
+        self.version = next(_versions)
+
+
+class AgentCache:
+    """
+    Per-agent async cache with TTL, LRU eviction under entry and byte budgets
+    and single-flight loading: concurrent misses for one key share one load.
+
+    Entries past their TTL but within `stale_seconds` are served as-is while
+    one background refresh runs (stale-while-revalidate). Invalidated entries
+    are never served stale.
+
+    State is guarded by a thread lock and in-flight loads are
+    concurrent.futures.Future objects, so the cache can be used from several
+    event loops and invalidated from Firestore listener threads.
+
+    With `watch_ref`, at most `max_watches` loaded entries also get a snapshot
+    listener that invalidates them on change; past that, the least recently
+    used watched entry gives up its listener and relies on its TTL.
+    """
+
+    def __init__(self, name, loader, ttl_seconds, max_bytes, sizeof=None, watch_ref=None,
+                 max_entries=None, stale_seconds=0, on_invalidate=None, max_watches=AGENT_CACHE_MAX_WATCHES):
+        self.name = name
+        self.loader = loader
+        self.ttl_seconds = ttl_seconds
+        self.stale_seconds = stale_seconds
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.sizeof = sizeof or (lambda value: len(str(value)))
+        self.watch_ref = watch_ref
+        self.max_watches = max_watches
+        self.on_invalidate = on_invalidate
+        self.total_bytes = 0
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._generations = {}
+        self._watches = {}
+        self._refresh_tasks = set()
+        self._lock = threading.Lock()
+        self.stats = {
+            "hits": 0,
+            "stale_hits": 0,
+            "misses": 0,
+            "coalesced": 0,
+            "refreshes": 0,
+            "load_errors": 0,
+            "evictions": 0,
+            "invalidations": 0,
+            "watch_evictions": 0,
+        }
+
+    def _fresh(self, entry):
+        return time.monotonic() - entry.loaded_at < self.ttl_seconds
+
+    def _servable_stale(self, entry):
+        return time.monotonic() - entry.loaded_at < self.ttl_seconds + self.stale_seconds
+
+    def snapshot(self):
+        with self._lock:
+            return {**self.stats, "entries": len(self._entries), "bytes": self.total_bytes, "watches": len(self._watches)}
+
+    def peek(self, key):
+        """Return the cached value without loading, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and self._fresh(entry):
+                self._entries.move_to_end(key)
+                return entry.value
+        return None
+
+    def version_of(self, key, value):
+        """
+        Version number of the cached `value` for `key` (unique across caches and
+        reloads), or None when `value` is not what the cache currently holds.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.value is value:
+                return entry.version
+        return None
+
+    async def get(self, key):
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry and self._fresh(entry):
+                    self._entries.move_to_end(key)
+                    self.stats["hits"] += 1
+                    return entry.value
+                future = self._inflight.get(key)
+                owner = future is None
+                if owner:
+                    future = concurrent.futures.Future()
+                    self._inflight[key] = future
+                    generation = self._generations.get(key, 0)
+                serve_stale = entry is not None and self._servable_stale(entry)
+                if serve_stale:
+                    self._entries.move_to_end(key)
+                    self.stats["stale_hits"] += 1
+                    if owner:
+                        self.stats["refreshes"] += 1
+                else:
+                    self.stats["misses" if owner else "coalesced"] += 1
+            if serve_stale:
+                if owner:
+                    task = asyncio.get_running_loop().create_task(self._load(key, future, generation))
+                    self._refresh_tasks.add(task)
+                    task.add_done_callback(self._refresh_tasks.discard)
+                return entry.value
+            if owner:
+                await self._load(key, future, generation)
+            value = await asyncio.wrap_future(future)
+            if value is not _ABANDONED:
+                return value
+
+    async def _load(self, key, future, generation):
+        try:
+            value = await self.loader(key)
+        except asyncio.CancelledError:
+            # The owner's job is going away, not the load failing: let a waiter take over
+            with self._lock:
+                self._inflight.pop(key, None)
+            future.set_result(_ABANDONED)
+            raise
+        except BaseException as e:
+            with self._lock:
+                self._inflight.pop(key, None)
+                self.stats["load_errors"] += 1
+            future.set_exception(e)
+            logger.warning(f"{self.name} load error for {key}: {e}")
+            return
+        with self._lock:
+            self._inflight.pop(key, None)
+            # An invalidation that landed mid-load means this value may be stale
+            evicted = self._store(key, value) if self._generations.get(key, 0) == generation else []
+        future.set_result(value)
+        for evicted_key in evicted:
+            self._unwatch(evicted_key)
+        self._watch(key)
+
+    def _store(self, key, value):
+        size = self.sizeof(value)
+        if size > self.max_bytes:
+            return []
+        self._drop(key)
+        self._entries[key] = _Entry(value, size, time.monotonic())
+        self.total_bytes += size
+        evicted = []
+        while self.total_bytes > self.max_bytes or (self.max_entries and len(self._entries) > self.max_entries):
+            evicted_key = next(iter(self._entries))
+            self._drop(evicted_key)
+            evicted.append(evicted_key)
+            self.stats["evictions"] += 1
+        return evicted
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry:
+            self.total_bytes -= entry.size
+
+    def invalidate(self, key):
+        # Expire in place so the entry (and its watch) still ages out through LRU
+        with self._lock:
+            self._generations[key] = self._generations.get(key, 0) + 1
+            self.stats["invalidations"] += 1
+            entry = self._entries.get(key)
+            if entry:
+                entry.loaded_at = float("-inf")
+
+    def _watch(self, key):
+        if not self.watch_ref or not self.max_watches:
+            return
+        released = None
+        with self._lock:
+            if key in self._watches or key not in self._entries:
+                return
+            if len(self._watches) >= self.max_watches:
+                oldest = next((watched for watched in self._entries if watched in self._watches), None)
+                if oldest is None:
+                    return
+                released = self._watches.pop(oldest)
+                self.stats["watch_evictions"] += 1
+            self._watches[key] = None
+        if released:
+            self._unsubscribe(released)
+        initial = [True]
+
+        def on_snapshot(*_):
+            # Firestore delivers the current state once on subscribe
+            if initial[0]:
+                initial[0] = False
+                return
+            logger.info(f"🔄 {self.name} changed for {key}, invalidating")
+            self.invalidate(key)
+            if self.on_invalidate:
+                self.on_invalidate(key)
+
+        try:
+            watch = self.watch_ref(key).on_snapshot(on_snapshot)
+        except Exception as e:
+            logger.debug(f"{self.name} watch error: {e}")
+            with self._lock:
+                self._watches.pop(key, None)
+            return
+        with self._lock:
+            if key in self._watches:
+                self._watches[key] = watch
+                return
+        self._unsubscribe(watch)
+
+    def _unwatch(self, key):
+        with self._lock:
+            if key in self._entries:
+                return
+            watch = self._watches.pop(key, None)
+        if watch:
+            self._unsubscribe(watch)
+
+    @staticmethod
+    def _unsubscribe(watch):
+        try:
+            watch.unsubscribe()
+        except Exception:
+            pass
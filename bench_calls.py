@@ -0,0 +1,605 @@
+# bench_calls.py
+"""
+Offline load test for server.py + summary_script.py.
+
+Runs N concurrent `entrypoint` jobs against in-process stand-ins, so no
+LiveKit, OpenAI, Firestore, S3 or MongoDB is needed:
+
+  - FakeJobContext / FakeRoom: job + room metadata, a participant that joins
+    after a simulated browser connect delay, shutdown callbacks
+  - FakeRealtimeSession: replaces the Realtime AgentSession; emits agent
+    state changes and scripted user/agent turns with a simulated LLM delay
+  - FakeFirestore: in-memory agents/knowledge_base/call_analytics
+  - FakeS3 / FakeMongoCollection: in-memory summary upload and metadata insert
+  - FakeOpenAI: chat.completions.create with a simulated delay; greeting
+    TTS renders are a blocking sleep that returns silence
+
+    python bench_calls.py --calls 200 --ramp 5 --turns 6
+    python bench_calls.py --calls 500 --agents 50 --no-hint
+    python bench_calls.py --calls 200 --greeting-cache        # greetings from the TTS render cache
+    python bench_calls.py --reconnect-rate 0.3 --drop-session # participants rejoin mid-call
+    python bench_calls.py --calls 200 --executor process      # calls only spool; the pipeline polls
+    SUMMARY_BATCH_SIZE=20 python bench_calls.py --calls 500   # batching mode
+    ANALYTICS_FLUSH_SIZE=1 python bench_calls.py --calls 500  # one analytics commit per call
+    ROLLING_SUMMARY_TURNS=4 python bench_calls.py --turns 12  # summaries folded during the call
+
+Reports setup latency percentiles, memory per session, thread count,
+event-loop lag and summary throughput.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+
+# Keep the run self-contained: no metrics port, no shared cache daemon, throwaway journals
+os.environ["METRICS_PORT"] = "0"
+os.environ["SHARED_CACHE_SOCKET"] = ""
+os.environ.setdefault("TRANSCRIPT_JOURNAL_DIR", tempfile.mkdtemp(prefix="bench-journal-"))
+os.environ.setdefault("GREETING_CACHE_DIR", tempfile.mkdtemp(prefix="bench-greetings-"))
+os.environ.setdefault("POST_CALL_SPOOL_PATH", os.path.join(tempfile.mkdtemp(prefix="bench-spool-"), "post_call.db"))
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+os.environ.setdefault("S3_BUCKET_NAME", "bench-bucket")
+
+try:
+    import psutil
+    PSUTIL_AVAILABLE = True
+except ImportError:
+    PSUTIL_AVAILABLE = False
+
+from livekit import rtc
+from livekit.agents import llm
+
+import clients
+import server
+import rolling_summary
+import summary_script
+from greeting_audio import FRAME_BYTES, GREETING_AUDIO_ENABLED
+from mock_openai import mock_completion_content
+from bench_token_server import percentile
+
+WORDS = ("pricing plan support hours refund policy delivery order account email phone "
+         "appointment booking service premium basic upgrade cancel invoice warranty").split()
+
+
+def sentence(rng, words=12):
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+# ---------------------------------------------------------------- Firestore
+
+class FakeSnapshot:
+    def __init__(self, data):
+        self._data = data
+        self.exists = data is not None
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+
+class FakeWatch:
+    def unsubscribe(self):
+        pass
+
+
+class FakeDocument:
+    def __init__(self, store, path, latency):
+        self.store = store
+        self.path = path
+        self.latency = latency
+
+    def get(self):
+        time.sleep(self.latency)
+        return FakeSnapshot(self.store.get(self.path))
+
+    def set(self, data):
+        time.sleep(self.latency)
+        self.store[self.path] = data
+
+    def collection(self, name):
+        return FakeCollection(self.store, f"{self.path}/{name}", self.latency)
+
+    def on_snapshot(self, callback):
+        return FakeWatch()
+
+
+class FakeCollection:
+    def __init__(self, store, path, latency):
+        self.store = store
+        self.path = path
+        self.latency = latency
+
+    def document(self, doc_id):
+        return FakeDocument(self.store, f"{self.path}/{doc_id}", self.latency)
+
+    def stream(self):
+        time.sleep(self.latency)
+        prefix = self.path + "/"
+        return [
+            FakeSnapshot(data) for path, data in list(self.store.items())
+            if path.startswith(prefix) and "/" not in path[len(prefix):]
+        ]
+
+    def on_snapshot(self, callback):
+        return FakeWatch()
+
+
+class FakeWriteBatch:
+    def __init__(self, firestore):
+        self.firestore = firestore
+        self.writes = []
+
+    def set(self, reference, data):
+        self.writes.append((reference.path, data))
+
+    def commit(self):
+        # One round trip, plus a little per document
+        time.sleep(self.firestore.latency + 0.001 * len(self.writes))
+        self.firestore.store.update(self.writes)
+        self.firestore.commits += 1
+
+
+class FakeFirestore:
+    """Blocking, like google-cloud-firestore; server.py calls it on executor threads."""
+
+    def __init__(self, latency):
+        self.store = {}
+        self.latency = latency
+        self.commits = 0
+
+    def collection(self, name):
+        return FakeCollection(self.store, name, self.latency)
+
+    def batch(self):
+        return FakeWriteBatch(self)
+
+    def seed_agents(self, count, kb_docs, rng):
+        for i in range(count):
+            agent_id = f"agent-{i}"
+            self.store[f"agents/{agent_id}"] = {
+                "name": f"Bench Agent {i}",
+                "voice": "alloy",
+                "greeting_message": "Hello, thanks for calling. How can I help?",
+                "system_prompt": sentence(rng, 60),
+            }
+            for d in range(kb_docs):
+                self.store[f"agents/{agent_id}/knowledge_base/doc-{d}"] = {
+                    "content": " ".join(sentence(rng) for _ in range(30))
+                }
+
+
+# ------------------------------------------------------- OpenAI / S3 / Mongo
+
+class FakeOpenAI:
+    def __init__(self, latency, latency_per_kchar=0.0):
+        self.latency = latency
+        self.latency_per_kchar = latency_per_kchar
+        self.prompt_chars = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, messages, **kwargs):
+        # Longer prompts take longer to process, like the real model
+        chars = sum(len(message["content"]) for message in messages)
+        self.prompt_chars.append(chars)
+        await asyncio.sleep(self.latency + self.latency_per_kchar * chars / 1000)
+        content = mock_completion_content(messages)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+class FakeS3:
+    def __init__(self, latency):
+        self.latency = latency
+        self.objects = {}
+
+    async def put_object(self, Bucket, Key, Body, ContentType=None, **headers):
+        await asyncio.sleep(self.latency)
+        self.objects[(Bucket, Key)] = Body
+
+
+class FakeMongoCollection:
+    def __init__(self, latency):
+        self.latency = latency
+        self.documents = []
+        self.indexed_at = {}
+
+    async def insert_one(self, document):
+        await asyncio.sleep(self.latency)
+        self.documents.append(document)
+
+    async def insert_many(self, documents, ordered=True):
+        await asyncio.sleep(self.latency)
+        self.documents.extend(documents)
+
+    async def bulk_write(self, operations, ordered=True):
+        await asyncio.sleep(self.latency)
+        for operation in operations:
+            document = operation._doc["$setOnInsert"]
+            self.documents.append(document)
+            self.indexed_at[document["callId"]] = time.perf_counter()
+
+
+class FakeSummaryClients:
+    """Stands in for summary_script._AsyncClients on every loop."""
+
+    def __init__(self, llm_latency, storage_latency, latency_per_kchar=0.0):
+        self.openai = FakeOpenAI(llm_latency, latency_per_kchar)
+        self.summary_collection = FakeMongoCollection(storage_latency)
+        self._s3 = FakeS3(storage_latency)
+
+    async def s3(self):
+        return self._s3
+
+
+# ------------------------------------------------------------ LiveKit stand-ins
+
+class FakeParticipant:
+    def __init__(self, identity, metadata):
+        self.identity = identity
+        self.metadata = metadata
+        self.disconnect_reason = None
+
+
+class FakeRoom:
+    def __init__(self, name, metadata):
+        self.name = name
+        self.metadata = metadata
+        self.session = None  # set by FakeRealtimeSession.start
+        self.handlers = {}
+
+    def on(self, event, callback):
+        self.handlers.setdefault(event, []).append(callback)
+        return callback
+
+    def emit(self, event, *args):
+        for callback in self.handlers.get(event, []):
+            callback(*args)
+
+
+class FakeJobContext:
+    def __init__(self, room_name, metadata, hint, connect_delay, join_delay):
+        self.room = FakeRoom(room_name, metadata if hint else "")
+        self.job = SimpleNamespace(metadata="", room=SimpleNamespace(metadata=self.room.metadata))
+        self.participant = FakeParticipant(f"user_{room_name}", metadata)
+        self.connect_delay = connect_delay
+        self.join_delay = join_delay
+        self.shutdown_callbacks = []
+        self.shutdown_task = None
+
+    async def connect(self):
+        await asyncio.sleep(self.connect_delay)
+
+    async def wait_for_participant(self):
+        await asyncio.sleep(self.join_delay)
+        return self.participant
+
+    def add_shutdown_callback(self, callback):
+        self.shutdown_callbacks.append(callback)
+
+    def shutdown(self, reason=""):
+        # Like JobContext.shutdown: returns at once, callbacks run in the background
+        if self.shutdown_task is None:
+            self.shutdown_task = asyncio.ensure_future(self._run_shutdown())
+        return self.shutdown_task
+
+    async def _run_shutdown(self):
+        for callback in self.shutdown_callbacks:
+            await callback()
+
+    async def reconnect(self, offline, drop_session):
+        """Participant drops, then rejoins with a new identity for the same call; None if the call ended."""
+        self.participant.disconnect_reason = rtc.DisconnectReason.SIGNAL_CLOSE
+        self.room.emit("participant_disconnected", self.participant)
+        if drop_session:
+            self.room.session.emit("close", SimpleNamespace(reason="error"))
+            self.room.session.emit_state("idle")
+        await asyncio.sleep(offline)
+        self.participant = FakeParticipant(f"{self.participant.identity}_r", self.participant.metadata)
+        rejoined = time.perf_counter()
+        self.room.emit("participant_connected", self.participant)
+        while self.room.name in server.held_calls or self.room.session.state != "listening":
+            if self.shutdown_task is not None or time.perf_counter() - rejoined > 5:
+                return None
+            await asyncio.sleep(0.005)
+        return time.perf_counter() - rejoined
+
+
+class FakeRealtimeSession:
+    """
+    Replaces the AgentSession returned by server.create_realtime_session.
+    generate_reply waits `llm_latency`, then "speaks" and reports the agent
+    turn the way the assistant's turn hooks expect.
+    """
+
+    def __init__(self, llm_latency, rng):
+        self.llm_latency = llm_latency
+        self.rng = rng
+        self.handlers = {}
+        self.agent = None
+        self.state = "initializing"
+        self.room_io = SimpleNamespace(set_participant=lambda identity: None)
+
+    def on(self, event):
+        def register(handler):
+            self.handlers.setdefault(event, []).append(handler)
+            return handler
+        return register
+
+    def emit(self, event, ev):
+        for handler in self.handlers.get(event, []):
+            handler(ev)
+
+    def emit_state(self, state):
+        ev = SimpleNamespace(old_state=self.state, new_state=state)
+        self.state = state
+        self.emit("agent_state_changed", ev)
+
+    async def start(self, room, agent, **options):
+        await asyncio.sleep(self.llm_latency / 2)  # Realtime websocket handshake
+        self.agent = agent
+        room.session = self
+        self.emit_state("listening")
+
+    async def generate_reply(self, instructions=None):
+        await asyncio.sleep(self.llm_latency)
+        self.emit_state("speaking")
+        message = llm.ChatMessage(role="assistant", content=[sentence(self.rng)])
+        await self.agent.on_agent_turn_completed(None, message)
+        self.emit_state("listening")
+
+    async def say(self, text, audio=None, **kwargs):
+        # Pre-rendered audio: playback starts as soon as the first frame is pushed
+        self.emit_state("speaking")
+        async for _ in audio:
+            pass
+        message = llm.ChatMessage(role="assistant", content=[text])
+        await self.agent.on_agent_turn_completed(None, message)
+        self.emit_state("listening")
+
+    async def user_says(self, text):
+        message = llm.ChatMessage(role="user", content=[text])
+        await self.agent.on_user_turn_completed(None, message)
+        await self.generate_reply()
+
+    async def aclose(self):
+        if self.state != "idle":
+            self.emit_state("idle")
+
+
+# ---------------------------------------------------------------- harness
+
+class LoopLagProbe:
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.samples = []
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - expected))
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        self._task.cancel()
+
+
+def rss_bytes():
+    if PSUTIL_AVAILABLE:
+        return psutil.Process().memory_info().rss
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+class ResourceSampler:
+    """Peak RSS, threads and concurrent sessions while the calls run."""
+
+    def __init__(self, interval=0.1):
+        self.interval = interval
+        self.baseline_rss = rss_bytes()
+        self.peak_rss = self.baseline_rss
+        self.peak_threads = threading.active_count()
+        self.peak_sessions = 0
+        self._task = None
+
+    async def _run(self):
+        while True:
+            self.sample()
+            await asyncio.sleep(self.interval)
+
+    def sample(self):
+        sessions = len(server.call_sessions)
+        rss = rss_bytes()
+        if sessions >= self.peak_sessions:
+            self.peak_sessions = sessions
+            self.peak_rss = max(self.peak_rss, rss)
+        self.peak_threads = max(self.peak_threads, threading.active_count())
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        self._task.cancel()
+
+
+async def run_call(index, args, rng, results):
+    agent_id = f"agent-{index % args.agents}"
+    room_name = f"bench_{index}"
+    metadata = json.dumps({"agent_id": agent_id, "language": "en", "call_id": room_name})
+    ctx = FakeJobContext(room_name, metadata, args.hint, args.connect_delay, args.join_delay)
+
+    started = time.perf_counter()
+    try:
+        await server.entrypoint(ctx)
+    except Exception as e:
+        results["errors"].append(repr(e))
+        return
+    results["setup"].append(time.perf_counter() - started)
+
+    session_data = server.call_sessions.get(room_name, {})
+    stages = session_data.get("startup_timings_ms", {})
+    if "first_audio" in stages:
+        results["first_audio"].append(stages["first_audio"] / 1000)
+
+    reconnect_at = args.turns // 2 if rng.random() < args.reconnect_rate else None
+    for turn in range(args.turns):
+        if turn == reconnect_at:
+            resumed = await ctx.reconnect(args.offline, args.drop_session)
+            if resumed is None:
+                results["not_resumed"] += 1
+                break
+            results["resume"].append(resumed)
+        await asyncio.sleep(args.turn_interval * rng.uniform(0.5, 1.5))
+        await ctx.room.session.user_says(sentence(rng))
+
+    results["ended"].append(time.perf_counter())
+    results["ended_at"][room_name] = results["ended"][-1]
+    await ctx.shutdown()
+
+
+def install_fakes(args, rng):
+    firestore = FakeFirestore(args.firestore_latency)
+    firestore.seed_agents(args.agents, args.kb_docs, rng)
+    clients.firestore.set(firestore)
+
+    sinks = FakeSummaryClients(args.summary_latency, args.storage_latency, args.summary_latency_per_kchar)
+    summary_script.get_async_clients = lambda: sinks
+    rolling_summary.get_async_clients = lambda: sinks
+
+    # entrypoint picks this up through the module global
+    def create_realtime_session(voice):
+        return FakeRealtimeSession(args.llm_latency, rng)
+
+    server.create_realtime_session = create_realtime_session
+
+    def render_greeting(text, voice, language):
+        time.sleep(args.tts_latency)
+        return bytes(FRAME_BYTES * 100)  # 2 s of silence
+
+    server.greeting_audio.render = render_greeting
+    server.GREETING_AUDIO_ENABLED = args.greeting_cache
+    return firestore, sinks
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=100)
+    parser.add_argument("--ramp", type=float, default=2.0, help="seconds over which calls arrive")
+    parser.add_argument("--agents", type=int, default=10, help="distinct agent ids (cache hit ratio)")
+    parser.add_argument("--kb-docs", type=int, default=20)
+    parser.add_argument("--turns", type=int, default=4)
+    parser.add_argument("--turn-interval", type=float, default=0.5)
+    parser.add_argument("--connect-delay", type=float, default=0.05)
+    parser.add_argument("--join-delay", type=float, default=0.3, help="browser connect time after dispatch")
+    parser.add_argument("--llm-latency", type=float, default=0.3)
+    parser.add_argument("--firestore-latency", type=float, default=0.08)
+    parser.add_argument("--summary-latency", type=float, default=1.0)
+    parser.add_argument("--summary-latency-per-kchar", type=float, default=0.05, help="added per 1000 prompt chars")
+    parser.add_argument("--storage-latency", type=float, default=0.05)
+    parser.add_argument("--tts-latency", type=float, default=0.6, help="greeting render time on a cache miss")
+    parser.add_argument("--greeting-cache", action=argparse.BooleanOptionalAction, default=GREETING_AUDIO_ENABLED,
+                        help="play pre-rendered greetings (default: GREETING_AUDIO_ENABLED)")
+    parser.add_argument("--reconnect-rate", type=float, default=0.0, help="share of calls whose participant drops mid-call")
+    parser.add_argument("--offline", type=float, default=1.0, help="seconds a dropped participant stays away")
+    parser.add_argument("--drop-session", action="store_true", help="the Realtime session also closes on a drop")
+    parser.add_argument("--no-hint", dest="hint", action="store_false", help="no room-metadata prefetch hint")
+    parser.add_argument("--executor", choices=("thread", "process"), default="thread",
+                        help="process: calls only spool post-call jobs, as job processes do, and the pipeline picks "
+                             "them up on its poll")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    if not args.verbose:
+        logging.disable(logging.WARNING)
+    rng = random.Random(args.seed)
+    firestore, sinks = install_fakes(args, rng)
+
+    results = {"setup": [], "first_audio": [], "ended": [], "ended_at": {}, "resume": [], "not_resumed": 0, "errors": []}
+    lag = LoopLagProbe()
+    sampler = ResourceSampler()
+    lag.start()
+    sampler.start()
+
+    server.post_call.start()
+    if args.executor == "process":
+        # Entrypoints then see the pipeline as running in another process
+        server.post_call.runs_here = lambda: False
+    started = time.perf_counter()
+
+    async def arrive(index):
+        await asyncio.sleep(rng.uniform(0, args.ramp))
+        await run_call(index, args, rng, results)
+
+    await asyncio.gather(*(arrive(i) for i in range(args.calls)))
+    # Jobs spooled since the last poll aren't queued yet
+    while server.post_call.spool.due():
+        await asyncio.sleep(0.05)
+    await server.post_call.close(timeout=None)
+    finished = time.perf_counter()
+
+    sampler.sample()
+    sampler.stop()
+    lag.stop()
+
+    summary = server.post_call.snapshot()
+    summary_window = finished - min(results["ended"]) if results["ended"] else 0
+    lags = sorted(lag.samples)
+    setup = sorted(results["setup"])
+    first_audio = sorted(results["first_audio"])
+    per_session = (sampler.peak_rss - sampler.baseline_rss) / max(1, sampler.peak_sessions)
+
+    print(f"Calls:            {args.calls} over {args.ramp}s ({len(results['errors'])} errors, hint={'on' if args.hint else 'off'})")
+    print(f"Wall time:        {finished - started:.2f} s")
+    resume = sorted(results["resume"])
+    for label, values in (("Setup", setup), ("First audio", first_audio), ("Resume", resume)):
+        if values:
+            print(f"{label + ':':<17} p50 {percentile(values, 50) * 1000:.0f} ms  "
+                  f"p95 {percentile(values, 95) * 1000:.0f} ms  p99 {percentile(values, 99) * 1000:.0f} ms")
+    if results["not_resumed"]:
+        print(f"Not resumed:      {results['not_resumed']} calls ended before the participant rejoined")
+    if args.greeting_cache:
+        greetings = server.greeting_audio.snapshot()
+        print(f"Greeting audio:   {greetings['memory_hits']} memory hits, {greetings['disk_hits']} disk hits, "
+              f"{greetings['misses']} misses, {greetings['renders']} renders")
+    print(f"Peak sessions:    {sampler.peak_sessions}")
+    print(f"Memory/session:   {per_session / 1024:.0f} KiB (peak RSS {sampler.peak_rss / 2**20:.0f} MiB)")
+    print(f"Peak threads:     {sampler.peak_threads}")
+    if lags:
+        print(f"Loop lag:         p50 {percentile(lags, 50) * 1000:.1f} ms  "
+              f"p99 {percentile(lags, 99) * 1000:.1f} ms  max {lags[-1] * 1000:.1f} ms")
+    print(f"Post-call stages: {summary['completed']} done in {summary['batches']} batches, "
+          f"{summary['stage_failures']} failed, {summary['dead_lettered']} dead-lettered; "
+          f"avg wait {summary['wait_seconds_avg'] * 1000:.0f} ms")
+    print(f"Summaries:        {len(sinks.summary_collection.documents)} indexed, "
+          f"{len(sinks.summary_collection.documents) / summary_window if summary_window else 0:.1f}/s")
+    summary_lag = sorted(
+        indexed - results["ended_at"][call_id]
+        for call_id, indexed in sinks.summary_collection.indexed_at.items() if call_id in results["ended_at"]
+    )
+    if summary_lag:
+        print(f"Hangup->indexed:  p50 {percentile(summary_lag, 50) * 1000:.0f} ms  "
+              f"p99 {percentile(summary_lag, 99) * 1000:.0f} ms")
+    prompt_chars = sinks.openai.prompt_chars
+    if prompt_chars:
+        print(f"Summary prompts:  {len(prompt_chars)} requests, avg {sum(prompt_chars) / len(prompt_chars):.0f} chars, "
+              f"max {max(prompt_chars)} chars")
+    writer = server.analytics_writer.snapshot()
+    print(f"Analytics writes: {writer['written']} docs in {writer['flushes']} commits "
+          f"(max batch {writer['max_batch']}, {writer['retries']} retries, {writer['failed']} failed)")
+    print(f"Stored:           {len(firestore.store)} Firestore docs, {len(sinks._s3.objects)} S3 objects, "
+          f"{len(sinks.summary_collection.documents)} Mongo docs")
+    if results["errors"]:
+        print(f"First error:      {results['errors'][0]}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,159 @@
+# bench_logging.py
+"""
+Event-loop lag from logging under a high turn rate.
+
+Simulated calls log every utterance (plus a couple of per-turn lines) on
+one event loop while a probe measures how late the loop wakes up. Output
+goes to a pipe drained at a fixed rate, like a container stdout whose log
+shipper falls behind. Two setups are compared:
+
+    sync   basicConfig-style StreamHandler, utterances in full at INFO (the old server.py)
+    queue  log_pipeline: QueueHandler + listener thread, JSON, log_utterance truncation/sampling
+
+    python bench_logging.py
+    python bench_logging.py --calls 300 --turn-interval 0.2 --drain-kbps 128
+    python bench_logging.py --max-chars 0 --sample-rate 1     # queue mode logging utterances in full
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+
+import log_pipeline
+from bench_token_server import percentile
+from log_pipeline import bind_log_context, log_utterance
+
+UTTERANCE_WORDS = "yes I would like to book an appointment for next tuesday afternoon if there is a slot available please".split()
+
+
+def utterance(chars):
+    words, length = [], 0
+    while length < chars:
+        word = random.choice(UTTERANCE_WORDS)
+        words.append(word)
+        length += len(word) + 1
+    return " ".join(words)
+
+
+class ThrottledPipe:
+    """Write end of a pipe whose reader drains at most `kbps` KB/s."""
+
+    def __init__(self, kbps):
+        read_fd, write_fd = os.pipe()
+        self.reader = os.fdopen(read_fd, "rb", buffering=0)
+        self.stream = os.fdopen(write_fd, "w", buffering=1)
+        self.kbps = kbps
+        self.drained = 0
+        self._thread = threading.Thread(target=self._drain, name="log-shipper", daemon=True)
+        self._thread.start()
+
+    def _drain(self):
+        chunk = max(1024, self.kbps * 1024 // 50)
+        while True:
+            data = self.reader.read(chunk)
+            if not data:
+                return
+            self.drained += len(data)
+            time.sleep(len(data) / (self.kbps * 1024))
+
+
+async def run_calls(logger, log_turn, calls, turn_interval, chars, seconds, bind=None):
+    lags = []
+    stop = time.perf_counter() + seconds
+    turns = 0
+
+    async def probe():
+        while time.perf_counter() < stop:
+            started = time.perf_counter()
+            await asyncio.sleep(0.01)
+            lags.append(time.perf_counter() - started - 0.01)
+
+    async def call(index):
+        nonlocal turns
+        if bind:
+            bind(index)
+        await asyncio.sleep(random.uniform(0, turn_interval))
+        while time.perf_counter() < stop:
+            log_turn(logger, index, utterance(chars), utterance(chars * 2))
+            turns += 1
+            await asyncio.sleep(turn_interval)
+
+    started = time.perf_counter()
+    await asyncio.gather(probe(), *(call(i) for i in range(calls)))
+    return sorted(lags), turns / (time.perf_counter() - started)
+
+
+def sync_turn(logger, index, user_text, agent_text):
+    logger.info(f"👤 User: {user_text}")
+    logger.info(f"🤖 Agent: {agent_text}")
+    logger.info(f"⏱️ Turn response for bench-{index}: 412ms")
+
+
+def queue_turn(logger, index, user_text, agent_text):
+    log_utterance(logger, "User", user_text, icon="👤")
+    log_utterance(logger, "Agent", agent_text, icon="🤖")
+    logger.info("⏱️ Turn response: 412ms")
+
+
+def bind_call(index):
+    # Each call task binds its context once, as entrypoint does
+    bind_log_context(session_id=f"bench-{index}", agent_id="bench-agent")
+
+
+def report(name, lags, turn_rate, pipe, finished_in):
+    print(
+        f"{name:<6} loop lag p50 {percentile(lags, 50) * 1000:7.1f}ms  p99 {percentile(lags, 99) * 1000:7.1f}ms  "
+        f"max {lags[-1] * 1000:7.1f}ms | {turn_rate:6.0f} turns/s | "
+        f"{pipe.drained / 1024:7.0f} KB shipped | output done {finished_in:.1f}s after the calls"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--turn-interval", type=float, default=0.25, help="seconds between turns per call")
+    parser.add_argument("--chars", type=int, default=300, help="user utterance length; agent replies are twice that")
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--drain-kbps", type=int, default=256, help="how fast the log shipper reads stdout")
+    parser.add_argument("--max-chars", type=int, default=200, help="LOG_TRANSCRIPT_MAX_CHARS for queue mode")
+    parser.add_argument("--sample-rate", type=float, default=1.0, help="LOG_TRANSCRIPT_SAMPLE_RATE for queue mode")
+    parser.add_argument("--mode", choices=["both", "sync", "queue"], default="both")
+    args = parser.parse_args()
+
+    log_pipeline.LOG_TRANSCRIPT_MAX_CHARS = args.max_chars
+    log_pipeline.LOG_TRANSCRIPT_SAMPLE_RATE = args.sample_rate
+
+    print(
+        f"{args.calls} calls, a turn every {args.turn_interval}s each, {args.chars}/{args.chars * 2} char utterances, "
+        f"stdout drained at {args.drain_kbps} KB/s\n"
+    )
+    logger = logging.getLogger("streaming-voice-assistant")
+    root = logging.getLogger()
+
+    if args.mode in ("both", "sync"):
+        pipe = ThrottledPipe(args.drain_kbps)
+        handler = logging.StreamHandler(pipe.stream)
+        handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+        root.addHandler(handler)
+        root.setLevel(logging.INFO)
+        lags, turn_rate = asyncio.run(run_calls(logger, sync_turn, args.calls, args.turn_interval, args.chars, args.seconds))
+        root.removeHandler(handler)
+        # Everything is already in the pipe: sync writes returned only once the shipper made room
+        report("sync", lags, turn_rate, pipe, 0.0)
+
+    if args.mode in ("both", "queue"):
+        pipe = ThrottledPipe(args.drain_kbps)
+        log_pipeline.setup_queue_logging(handler=logging.StreamHandler(pipe.stream))
+        lags, turn_rate = asyncio.run(
+            run_calls(logger, queue_turn, args.calls, args.turn_interval, args.chars, args.seconds, bind=bind_call)
+        )
+        started = time.perf_counter()
+        log_pipeline.stop_queue_logging()
+        report("queue", lags, turn_rate, pipe, time.perf_counter() - started)
+
+
+if __name__ == "__main__":
+    main()
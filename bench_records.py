@@ -0,0 +1,122 @@
+# bench_records.py
+"""
+Bytes and CPU time per stored record: today's format (indented summary JSON,
+verbose call_analytics document) against each record codec setting.
+
+    python bench_records.py --records 2000 --turns 30
+"""
+import argparse
+import json
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+from record_codec import RecordCodec, compact_call_document, decode, MSGPACK_AVAILABLE, ZSTD_AVAILABLE
+
+WORDS = ("pricing plan support hours refund policy delivery order account email phone "
+         "appointment booking service premium basic upgrade cancel invoice warranty").split()
+
+
+def sentence(rng, words=14):
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def make_summary(rng):
+    return {
+        "requestedData": sentence(rng, 20),
+        "responseData": sentence(rng, 40),
+        "contactInfo": {"email": f"user{rng.randint(1, 10**6)}@example.com", "phone": "None"},
+        "deliveryChannels": ["email"],
+    }
+
+
+def make_call_document(rng, turns):
+    start = datetime(2026, 10, 17, 9, 0, tzinfo=timezone.utc) + timedelta(seconds=rng.randint(0, 86400))
+    records = {"user": [], "agent": []}
+    at = start
+    for i in range(turns):
+        at += timedelta(seconds=rng.uniform(2, 12))
+        source = "user" if i % 2 == 0 else "agent"
+        records[source].append({"text": sentence(rng), "timestamp_utc": at.isoformat(), "source": source})
+    return {
+        "session_id": f"room_{rng.getrandbits(32):08x}",
+        "room_name": f"room_{rng.getrandbits(32):08x}",
+        "call_id": f"call_{rng.getrandbits(48):012x}",
+        "agent_id": f"agent-{rng.randint(1, 50)}",
+        "start_time_utc": start.isoformat(),
+        "end_time_utc": (at + timedelta(seconds=5)).isoformat(),
+        "duration_seconds": (at - start).total_seconds() + 5,
+        "language": "en",
+        "client_info": {"ip": "203.0.113.7", "device_type": "mobile", "user_agent": "Mozilla/5.0 (iPhone)"},
+        "user_transcripts": records["user"],
+        "agent_transcripts": records["agent"],
+        "total_user_messages": len(records["user"]),
+        "total_agent_responses": len(records["agent"]),
+    }
+
+
+def firestore_size(value):
+    """Rough Firestore storage size: strings/bytes by length, datetimes and numbers 8 bytes."""
+    if isinstance(value, dict):
+        return sum(len(key) + 1 + firestore_size(item) for key, item in value.items()) + 32
+    if isinstance(value, list):
+        return sum(firestore_size(item) for item in value)
+    if isinstance(value, (str, bytes)):
+        return len(value) + (1 if isinstance(value, str) else 0)
+    return 8
+
+
+def measure(label, records, encode, decode_fn=None):
+    started = time.perf_counter()
+    blobs = [encode(record) for record in records]
+    encode_us = (time.perf_counter() - started) / len(records) * 1e6
+    decode_us = 0.0
+    if decode_fn:
+        started = time.perf_counter()
+        for blob in blobs:
+            decode_fn(blob)
+        decode_us = (time.perf_counter() - started) / len(records) * 1e6
+    size = sum(len(blob) if isinstance(blob, (bytes, str)) else firestore_size(blob) for blob in blobs) / len(blobs)
+    return label, size, encode_us, decode_us
+
+
+def codecs():
+    formats = ["json"] + (["msgpack"] if MSGPACK_AVAILABLE else [])
+    compressions = ["none", "gzip"] + (["zstd"] if ZSTD_AVAILABLE else [])
+    return [RecordCodec(fmt, compression) for fmt in formats for compression in compressions]
+
+
+def report(title, rows):
+    baseline = rows[0][1]
+    print(f"\n{title}")
+    print(f"{'format':<24}{'bytes/rec':>10}{'vs today':>10}{'encode µs':>11}{'decode µs':>11}")
+    for label, size, encode_us, decode_us in rows:
+        print(f"{label:<24}{size:>10,.0f}{size / baseline:>9.0%} {encode_us:>10.1f}{decode_us:>11.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=2000)
+    parser.add_argument("--turns", type=int, default=30)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    summaries = [make_summary(rng) for _ in range(args.records)]
+    documents = [make_call_document(rng, args.turns) for _ in range(args.records)]
+
+    rows = [measure("today (indent=2 JSON)", summaries, lambda s: json.dumps(s, indent=2).encode("utf-8"), json.loads)]
+    for codec in codecs():
+        rows.append(measure(f"{codec.format}+{codec.compression}", summaries,
+                            lambda s, codec=codec: codec.encode("summary", s, agentId="agent-1", callId="call-1"), decode))
+    report(f"S3 summary objects ({args.records} records)", rows)
+
+    rows = [measure("today (v1 document)", documents, lambda d: d)]
+    for codec in codecs():
+        rows.append(measure(f"v2 turns {codec.format}+{codec.compression}", documents,
+                            lambda d, codec=codec: compact_call_document(d, codec), lambda d: decode(d["turns"])))
+    report(f"call_analytics documents, estimated Firestore bytes ({args.turns} turns)", rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# bench_token_server.py
+"""
+Load test for the token server.
+
+    python bench_token_server.py                      # in-process (ASGI), no network
+    python bench_token_server.py --url http://localhost:3000 --requests 20000 --concurrency 200
+
+Reports tokens/sec and p50/p95/p99 latency.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import time
+
+import httpx
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+async def run(client, total, concurrency):
+    latencies = []
+    errors = 0
+    remaining = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for i in remaining:
+            body = {"agent_id": "bench-agent", "language": "en", "call_id": f"bench_{i}"}
+            started = time.perf_counter()
+            try:
+                response = await client.post("/token", json=body)
+                if response.status_code != 200 or "token" not in response.json():
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return latencies, errors, elapsed
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="token server base URL; omit to benchmark the app in-process")
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    args = parser.parse_args()
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    if args.url:
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        client = httpx.AsyncClient(base_url=args.url, limits=limits, timeout=30)
+        target = args.url
+    else:
+        os.environ.setdefault("LIVEKIT_API_KEY", "bench-key")
+        os.environ.setdefault("LIVEKIT_API_SECRET", "bench-secret-bench-secret-bench-secret")
+        os.environ.setdefault("TOKEN_PREFETCH_HINTS", "0")
+        from token_server import app
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench")
+        target = "in-process ASGI"
+
+    async with client:
+        await run(client, min(200, args.requests), min(20, args.concurrency))  # warm-up
+        latencies, errors, elapsed = await run(client, args.requests, args.concurrency)
+
+    latencies.sort()
+    print(f"Target:       {target}")
+    print(f"Requests:     {len(latencies)} (concurrency {args.concurrency}, errors {errors})")
+    print(f"Throughput:   {len(latencies) / elapsed:,.0f} tokens/sec")
+    print(f"Latency mean: {statistics.mean(latencies) * 1000:.2f} ms")
+    for pct in (50, 95, 99):
+        print(f"Latency p{pct}:  {percentile(latencies, pct) * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,238 @@
+# clients.py
+"""
+Process-wide service clients (Firestore, MongoDB, S3, OpenAI), created on first use
+instead of at import time. `prewarm()` builds them in parallel, e.g. from
+the worker's prewarm_fnc, so a job never pays for the slowest one serially.
+
+    python clients.py --profile    # import-time report for server.py + client init times
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger("clients")
+
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+CLIENT_PREWARM_TIMEOUT_SECONDS = float(os.getenv("CLIENT_PREWARM_TIMEOUT_SECONDS", "10"))
+# A factory that raised (DNS, network, auth endpoint) is tried again after this long
+CLIENT_RETRY_SECONDS = float(os.getenv("CLIENT_RETRY_SECONDS", "30"))
+
+
+class LazyClient:
+    """
+    Thread-safe factory, run once it succeeds. A factory that returns None
+    means the service is not installed or configured, which is final
+    (`is_disabled()`). One that raises leaves the client as None for
+    CLIENT_RETRY_SECONDS and is then tried again, so a transient failure
+    at startup doesn't disable the service for the life of the process.
+    """
+
+    def __init__(self, name, factory, retry_seconds=CLIENT_RETRY_SECONDS):
+        self.name = name
+        self.factory = factory
+        self.retry_seconds = retry_seconds
+        self._lock = threading.Lock()
+        self._ready = False
+        self._value = None
+        self._retry_at = 0.0
+        self.init_seconds = None
+
+    @property
+    def ready(self):
+        return self._ready
+
+    def get(self):
+        if self._ready:
+            return self._value
+        if time.monotonic() < self._retry_at:
+            return None
+        with self._lock:
+            if not self._ready and time.monotonic() >= self._retry_at:
+                started = time.perf_counter()
+                try:
+                    self._value = self.factory()
+                    self._ready = True
+                except Exception as e:
+                    logger.warning(f"{self.name} unavailable, retrying in {self.retry_seconds:.0f}s: {e}")
+                    self._retry_at = time.monotonic() + self.retry_seconds
+                self.init_seconds = time.perf_counter() - started
+        return self._value
+
+    async def aget(self):
+        """get() that initializes on a worker thread instead of blocking the event loop."""
+        if self._ready or time.monotonic() < self._retry_at:
+            return self._value
+        return await asyncio.to_thread(self.get)
+
+    def require(self):
+        """get() for work that must not be skipped: raises while the client is missing, so it is retried."""
+        value = self.get()
+        if value is None:
+            raise RuntimeError(f"{self.name} unavailable")
+        return value
+
+    def is_disabled(self):
+        """True once the factory has returned None: the service is not installed or configured here."""
+        self.get()
+        return self._ready and self._value is None
+
+    def set(self, value):
+        """Install a ready-made client (tests, benchmarks)."""
+        with self._lock:
+            self._value = value
+            self._ready = True
+
+
+def _create_firestore():
+    try:
+        import firebase_admin
+        from firebase_admin import credentials, firestore
+    except ImportError:
+        logger.warning("Firestore not available")
+        return None
+
+    if not firebase_admin._apps:
+        cred_path = os.getenv('GOOGLE_APPLICATION_CREDENTIALS')
+        if cred_path:
+            cred = credentials.Certificate(cred_path)
+            firebase_admin.initialize_app(cred)
+            logger.info("✅ Firestore initialized")
+        else:
+            fb_private_key = os.getenv('FIREBASE_PRIVATE_KEY')
+            if fb_private_key:
+                if fb_private_key.startswith('"') and fb_private_key.endswith('"'):
+                    fb_private_key = fb_private_key[1:-1]
+                fb_private_key = fb_private_key.replace('\\\\n', '\n')
+
+                cred_dict = {
+                    'type': os.getenv('FIREBASE_TYPE', 'service_account'),
+                    'project_id': os.getenv('FIREBASE_PROJECT_ID'),
+                    'private_key_id': os.getenv('FIREBASE_PRIVATE_KEY_ID'),
+                    'private_key': fb_private_key,
+                    'client_email': os.getenv('FIREBASE_CLIENT_EMAIL'),
+                    'client_id': os.getenv('FIREBASE_CLIENT_ID'),
+                    'auth_uri': os.getenv('FIREBASE_AUTH_URI', 'https://accounts.google.com/o/oauth2/auth'),
+                    'token_uri': os.getenv('FIREBASE_TOKEN_URI', 'https://oauth2.googleapis.com/token'),
+                    'auth_provider_x509_cert_url': os.getenv('FIREBASE_AUTH_PROVIDER_X509_CERT_URL', 'https://www.googleapis.com/oauth2/v1/certs'),
+                    'client_x509_cert_url': os.getenv('FIREBASE_CLIENT_X509_CERT_URL')
+                }
+                cred = credentials.Certificate(cred_dict)
+                firebase_admin.initialize_app(cred)
+                logger.info("✅ Firestore initialized from env")
+
+    return firestore.client()
+
+
+def _create_mongo():
+    from pymongo import MongoClient
+    # mongodb+srv URIs resolve DNS here, which is why this no longer runs at import
+    return MongoClient(os.getenv("MONGO_URI"), maxPoolSize=MONGO_MAX_POOL_SIZE)
+
+
+def _create_s3():
+    import boto3
+    return boto3.client(
+        "s3",
+        aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
+        aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
+        region_name=os.getenv("AWS_REGION")
+    )
+
+
+def _create_openai():
+    from openai import OpenAI
+    # Sync client for thread-pool work such as greeting TTS renders
+    return OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+
+
+firestore = LazyClient("Firestore", _create_firestore)
+mongo = LazyClient("MongoDB", _create_mongo)
+s3 = LazyClient("S3", _create_s3)
+openai = LazyClient("OpenAI", _create_openai)
+
+ALL = (firestore, mongo, s3, openai)
+
+
+def get_firestore():
+    return firestore.get()
+
+
+def get_summary_collection():
+    client = mongo.get()
+    return client["test"]["summaries"] if client is not None else None
+
+
+def require_summary_collection():
+    return mongo.require()["test"]["summaries"]
+
+
+def get_s3():
+    return s3.get()
+
+
+def get_openai():
+    return openai.get()
+
+
+def prewarm(targets=ALL, timeout=CLIENT_PREWARM_TIMEOUT_SECONDS):
+    """Create the given clients in parallel; returns {name: seconds} for the ones that finished."""
+    pending = [client for client in targets if not client.ready]
+    if pending:
+        executor = ThreadPoolExecutor(max_workers=len(pending), thread_name_prefix="client-init")
+        futures = [executor.submit(client.get) for client in pending]
+        deadline = time.monotonic() + timeout
+        for future in futures:
+            try:
+                future.result(max(0, deadline - time.monotonic()))
+            except Exception:
+                pass
+        # A hung init keeps its thread; later get() calls wait on its lock
+        executor.shutdown(wait=False)
+    return {client.name: client.init_seconds for client in targets if client.ready}
+
+
+def import_profile(module="server", top=15):
+    """Top modules by cumulative import time, from `python -X importtime -c 'import <module>'`."""
+    import subprocess
+    import sys
+
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        # Indent depth: 1 is the profiled module, 3 its direct imports, deeper is nested
+        depth = len(name) - len(name.lstrip())
+        rows.append((int(cumulative_us), int(self_us), name.strip(), depth))
+    total = next((cumulative for cumulative, _, name, _ in rows if name == module), 0)
+    top_level = [(cumulative, self_us, name) for cumulative, self_us, name, depth in rows if depth <= 3]
+    return total, sorted(top_level, reverse=True)[:top]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profile", action="store_true")
+    parser.add_argument("--module", default="server")
+    args = parser.parse_args()
+
+    if args.profile:
+        total, rows = import_profile(args.module)
+        print(f"import {args.module}: {total / 1000:.0f} ms")
+        for cumulative, self_us, name in rows:
+            print(f"  {cumulative / 1000:8.1f} ms  {name}")
+
+    started = time.perf_counter()
+    timings = prewarm()
+    wall = time.perf_counter() - started
+    print(f"client prewarm: {wall * 1000:.0f} ms in parallel ({sum(t or 0 for t in timings.values()) * 1000:.0f} ms serial)")
+    for name, seconds in timings.items():
+        print(f"  {seconds * 1000:8.1f} ms  {name}")
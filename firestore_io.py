@@ -0,0 +1,212 @@
+# firestore_io.py
+"""
+Firestore I/O on dedicated thread pools.
+
+Reads (agent config, knowledge base) go through `firestore_read` on their
+own executor, and call_analytics writes go through `AnalyticsWriter`,
+which has a separate bounded executor, so a burst of hangups can never
+queue ahead of the config loads of new calls.
+
+AnalyticsWriter coalesces writes into WriteBatch commits: a batch is sent
+as soon as a commit slot is free, after waiting up to
+ANALYTICS_FLUSH_INTERVAL_SECONDS for more writes or until
+ANALYTICS_FLUSH_SIZE documents (or ANALYTICS_FLUSH_MAX_BYTES) are waiting.
+Under load that turns one RPC per call into one per batch; when idle a
+write costs one commit. Commits rejected for rate limits or availability
+are retried with backoff; a batch rejected for anything else is written
+document by document, so only the bad document fails.
+
+Batches only form within one process. The writer's caller is the post-call
+analytics stage, which runs in the worker's main process (see
+post_call_spool), so hangups from every job process share its batches.
+"""
+import asyncio
+import concurrent.futures
+import json
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+from clients import firestore
+
+try:
+    from google.api_core import exceptions as google_exceptions
+    RETRYABLE_ERRORS = (
+        google_exceptions.ResourceExhausted,
+        google_exceptions.ServiceUnavailable,
+        google_exceptions.DeadlineExceeded,
+        google_exceptions.Aborted,
+        google_exceptions.InternalServerError,
+    )
+except ImportError:
+    RETRYABLE_ERRORS = (ConnectionError, TimeoutError)
+
+logger = logging.getLogger("firestore-io")
+
+FIRESTORE_READ_THREADS = int(os.getenv("FIRESTORE_READ_THREADS", "8"))
+ANALYTICS_WRITE_THREADS = int(os.getenv("ANALYTICS_WRITE_THREADS", "2"))
+# Firestore caps a batch at 500 writes
+ANALYTICS_FLUSH_SIZE = min(500, int(os.getenv("ANALYTICS_FLUSH_SIZE", "100")))
+# Firestore caps a request at 10 MiB and a document at 1 MiB
+ANALYTICS_FLUSH_MAX_BYTES = int(os.getenv("ANALYTICS_FLUSH_MAX_BYTES", str(8 * 1024 * 1024)))
+MAX_DOCUMENT_BYTES = 1024 * 1024
+ANALYTICS_FLUSH_INTERVAL_SECONDS = float(os.getenv("ANALYTICS_FLUSH_INTERVAL_SECONDS", "0.05"))
+ANALYTICS_MAX_PENDING = int(os.getenv("ANALYTICS_MAX_PENDING", "5000"))
+ANALYTICS_COMMIT_ATTEMPTS = int(os.getenv("ANALYTICS_COMMIT_ATTEMPTS", "5"))
+ANALYTICS_RETRY_BASE_SECONDS = float(os.getenv("ANALYTICS_RETRY_BASE_SECONDS", "0.5"))
+ANALYTICS_RETRY_MAX_SECONDS = float(os.getenv("ANALYTICS_RETRY_MAX_SECONDS", "10"))
+
+ANALYTICS_FLUSH_SECONDS = metrics.Histogram("analytics_flush_seconds", "call_analytics batch commit time, retries included")
+
+read_executor = ThreadPoolExecutor(max_workers=FIRESTORE_READ_THREADS, thread_name_prefix="firestore-read")
+
+
+async def firestore_read(fn, *args):
+    """Run a blocking Firestore read on the read pool."""
+    return await asyncio.get_running_loop().run_in_executor(read_executor, fn, *args)
+
+
+class AnalyticsWriter:
+    def __init__(self, collection="call_analytics", flush_size=ANALYTICS_FLUSH_SIZE,
+                 flush_interval=ANALYTICS_FLUSH_INTERVAL_SECONDS, threads=ANALYTICS_WRITE_THREADS,
+                 max_pending=ANALYTICS_MAX_PENDING, attempts=ANALYTICS_COMMIT_ATTEMPTS,
+                 max_bytes=ANALYTICS_FLUSH_MAX_BYTES):
+        self.collection = collection
+        self.flush_size = max(1, flush_size)
+        self.max_bytes = max_bytes
+        self.flush_interval = flush_interval
+        self.threads = max(1, threads)
+        self.max_pending = max_pending
+        # At least one try: with none, _with_retries would report success without committing
+        self.attempts = max(1, attempts)
+        self._pending = []
+        self._pending_bytes = 0
+        self._in_flight = 0
+        self._cond = threading.Condition()
+        self._executor = None
+        self._thread = None
+        self.stats = {"written": 0, "flushes": 0, "retries": 0, "failed": 0, "rejected": 0, "max_batch": 0, "split_batches": 0}
+
+    def _ensure_started(self):
+        # Called with self._cond held
+        if self._thread is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="analytics-write")
+            self._thread = threading.Thread(target=self._run, name="analytics-flush", daemon=True)
+            self._thread.start()
+
+    def write(self, doc_id, document):
+        """Queue a document set; the returned concurrent.futures.Future resolves once it is committed."""
+        future = concurrent.futures.Future()
+        # Approximate encoded size; the caller is a post-call stage, not a call's event loop
+        size = len(json.dumps(document, default=str))
+        if size > MAX_DOCUMENT_BYTES:
+            self.stats["rejected"] += 1
+            future.set_exception(ValueError(f"analytics document {doc_id} is ~{size} bytes, over Firestore's 1 MiB limit"))
+            return future
+        with self._cond:
+            if len(self._pending) >= self.max_pending:
+                self.stats["rejected"] += 1
+                future.set_exception(RuntimeError(f"analytics writer full ({len(self._pending)} pending)"))
+                return future
+            self._pending.append((doc_id, document, future, time.monotonic(), size))
+            self._pending_bytes += size
+            self._ensure_started()
+            self._cond.notify()
+        return future
+
+    async def awrite(self, doc_id, document):
+        await asyncio.wrap_future(self.write(doc_id, document))
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending or self._in_flight >= self.threads:
+                    self._cond.wait()
+                # Give a burst a moment to fill the batch
+                deadline = self._pending[0][3] + self.flush_interval
+                while len(self._pending) < self.flush_size and self._pending_bytes < self.max_bytes:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                count, size = 0, 0
+                for item in self._pending[:self.flush_size]:
+                    if count and size + item[4] > self.max_bytes:
+                        break
+                    count, size = count + 1, size + item[4]
+                batch, self._pending = self._pending[:count], self._pending[count:]
+                self._pending_bytes -= size
+                self._in_flight += 1
+            self._executor.submit(self._commit, batch)
+
+    def _with_retries(self, commit, description):
+        for attempt in range(self.attempts):
+            try:
+                return commit()
+            except RETRYABLE_ERRORS as e:
+                if attempt == self.attempts - 1:
+                    raise
+                self.stats["retries"] += 1
+                delay = random.uniform(0, min(ANALYTICS_RETRY_MAX_SECONDS, ANALYTICS_RETRY_BASE_SECONDS * 2 ** attempt))
+                logger.warning(f"⚠️ {description} failed ({e}), retry in {delay:.1f}s")
+                time.sleep(delay)
+
+    def _commit_batch(self, batch):
+        db = firestore.require()
+        write_batch = db.batch()
+        for doc_id, document, _, _, _ in batch:
+            write_batch.set(db.collection(self.collection).document(doc_id), document)
+        write_batch.commit()
+
+    def _commit_one(self, doc_id, document):
+        firestore.require().collection(self.collection).document(doc_id).set(document)
+
+    def _commit(self, batch):
+        started = time.perf_counter()
+        try:
+            self._with_retries(lambda: self._commit_batch(batch), f"Analytics commit of {len(batch)}")
+        except Exception as e:
+            if len(batch) == 1 or isinstance(e, RETRYABLE_ERRORS):
+                self.stats["failed"] += len(batch)
+                for _, _, future, _, _ in batch:
+                    future.set_exception(e)
+            else:
+                # One bad document (too large, invalid) rejects the whole batch; don't fail the others with it
+                logger.warning(f"⚠️ Analytics batch of {len(batch)} rejected ({e}), writing documents one by one")
+                self.stats["split_batches"] += 1
+                self._commit_each(batch)
+        else:
+            ANALYTICS_FLUSH_SECONDS.observe(time.perf_counter() - started)
+            self.stats["written"] += len(batch)
+            self.stats["flushes"] += 1
+            self.stats["max_batch"] = max(self.stats["max_batch"], len(batch))
+            for _, _, future, _, _ in batch:
+                future.set_result(None)
+        finally:
+            with self._cond:
+                self._in_flight -= 1
+                self._cond.notify()
+
+    def _commit_each(self, batch):
+        for doc_id, document, future, _, _ in batch:
+            try:
+                self._with_retries(lambda: self._commit_one(doc_id, document), f"Analytics write of {doc_id}")
+            except Exception as e:
+                self.stats["failed"] += 1
+                future.set_exception(e)
+            else:
+                self.stats["written"] += 1
+                self.stats["flushes"] += 1
+                future.set_result(None)
+
+    def snapshot(self):
+        with self._cond:
+            pending, pending_bytes, in_flight = len(self._pending), self._pending_bytes, self._in_flight
+        return {**self.stats, "pending": pending, "pending_bytes": pending_bytes, "in_flight": in_flight}
+
+
+analytics_writer = AnalyticsWriter()
@@ -0,0 +1,199 @@
+# greeting_audio.py
+"""
+Pre-rendered greeting audio.
+
+An agent's greeting_message is the same few words on every call, so it is
+rendered once with TTS per (agent_id, greeting, voice, language) and played
+from cache on join instead of costing a Realtime model round trip. Renders
+live in an in-memory LRU and on disk, so restarts and sibling workers on the
+node reuse them. A miss falls back to the model and renders in the
+background for the next call.
+
+Off by default: GREETING_AUDIO_ENABLED=1 turns it on. The greeting is then
+spoken by GREETING_TTS_MODEL rather than the Realtime model, so its voice
+and delivery can differ slightly from the rest of the call, and the model
+only sees the greeting as text in its context.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from livekit import rtc
+
+from agent_cache import AgentCache
+from clients import get_openai
+from instructions import get_language_metadata
+
+logger = logging.getLogger("greeting-audio")
+
+GREETING_AUDIO_ENABLED = os.getenv("GREETING_AUDIO_ENABLED", "0") == "1"
+GREETING_TTS_MODEL = os.getenv("GREETING_TTS_MODEL", "gpt-4o-mini-tts")
+GREETING_CACHE_DIR = os.getenv("GREETING_CACHE_DIR", "./greeting_cache")
+GREETING_CACHE_TTL_SECONDS = int(os.getenv("GREETING_CACHE_TTL_SECONDS", "86400"))
+GREETING_CACHE_MAX_BYTES = int(os.getenv("GREETING_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+GREETING_CACHE_DISK_MAX_BYTES = int(os.getenv("GREETING_CACHE_DISK_MAX_BYTES", str(512 * 1024 * 1024)))
+# Renders block for the whole TTS request; keep them off the default executor
+GREETING_RENDER_THREADS = int(os.getenv("GREETING_RENDER_THREADS", "2"))
+# After a failed render the model keeps greeting for this long before another try
+GREETING_RENDER_RETRY_SECONDS = float(os.getenv("GREETING_RENDER_RETRY_SECONDS", "600"))
+
+# OpenAI "pcm" speech output: 24 kHz, 16-bit, mono (the Realtime output format too)
+SAMPLE_RATE = 24000
+FRAME_MS = 20
+FRAME_BYTES = SAMPLE_RATE * FRAME_MS // 1000 * 2
+
+
+def render_greeting(text, voice, language):
+    """Blocking TTS render of `text`; returns raw PCM."""
+    client = get_openai()
+    if client is None:
+        raise RuntimeError("OpenAI client unavailable")
+    label = get_language_metadata(language)["label"]
+    response = client.audio.speech.create(
+        model=GREETING_TTS_MODEL,
+        voice=voice,
+        input=text,
+        instructions=f"Speak {label} in a warm, friendly tone, as the opening line of a phone call.",
+        response_format="pcm",
+    )
+    pcm = response.read()
+    if len(pcm) < FRAME_BYTES:
+        raise ValueError(f"TTS returned {len(pcm)} bytes")
+    return pcm
+
+
+async def pcm_frames(pcm):
+    """20 ms AudioFrames over `pcm`, for AgentSession.say(audio=...)."""
+    pcm = pcm[:len(pcm) // 2 * 2]
+    for offset in range(0, len(pcm), FRAME_BYTES):
+        chunk = pcm[offset:offset + FRAME_BYTES]
+        yield rtc.AudioFrame(chunk, SAMPLE_RATE, 1, len(chunk) // 2)
+
+
+class GreetingAudioCache:
+    """
+    Memory tier is an AgentCache (LRU under a byte budget, single-flight
+    loads); its loader reads the disk tier and renders only when that misses.
+    Disk files are written atomically and pruned oldest-first past
+    `disk_max_bytes`.
+    """
+
+    def __init__(self, directory=GREETING_CACHE_DIR, ttl_seconds=GREETING_CACHE_TTL_SECONDS,
+                 max_bytes=GREETING_CACHE_MAX_BYTES, disk_max_bytes=GREETING_CACHE_DISK_MAX_BYTES,
+                 render=render_greeting, threads=GREETING_RENDER_THREADS):
+        self.directory = directory
+        self.disk_max_bytes = disk_max_bytes
+        self.render = render
+        self.memory = AgentCache("Greeting audio", self._load, ttl_seconds=ttl_seconds, max_bytes=max_bytes, sizeof=len)
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="greeting-render")
+        self._failed = {}
+        self._warm_tasks = set()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "renders": 0, "render_errors": 0}
+
+    @staticmethod
+    def key(agent_id, greeting, voice, language):
+        return (agent_id, greeting, voice, (language or "en").lower())
+
+    def path(self, key):
+        digest = hashlib.sha256(json.dumps(key).encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, f"{digest}.pcm")
+
+    async def lookup(self, key):
+        """Cached PCM for `key`, or None after starting a background render."""
+        pcm = self.memory.peek(key)
+        if pcm is not None:
+            self.stats["memory_hits"] += 1
+            return pcm
+        if os.path.exists(self.path(key)):
+            self.stats["disk_hits"] += 1
+            try:
+                return await self.memory.get(key)
+            except Exception as e:
+                logger.warning(f"⚠️ Greeting audio read failed: {e}")
+                return None
+        self.stats["misses"] += 1
+        self.warm(key)
+        return None
+
+    def warm(self, key):
+        """Render `key` in the background unless a recent attempt failed."""
+        failed_at = self._failed.get(key)
+        if failed_at is not None and time.monotonic() - failed_at < GREETING_RENDER_RETRY_SECONDS:
+            return
+        task = asyncio.get_running_loop().create_task(self._warm(key))
+        self._warm_tasks.add(task)
+        task.add_done_callback(self._warm_tasks.discard)
+
+    async def _warm(self, key):
+        try:
+            await self.memory.get(key)
+            self._failed.pop(key, None)
+        except Exception as e:
+            self._failed[key] = time.monotonic()
+            self.stats["render_errors"] += 1
+            logger.warning(f"⚠️ Greeting render failed for agent {key[0]}: {e}")
+
+    async def _load(self, key):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, self._load_blocking, key)
+
+    def _load_blocking(self, key):
+        path = self.path(key)
+        try:
+            with open(path, "rb") as f:
+                pcm = f.read()
+            os.utime(path)  # Recency for disk pruning
+            return pcm
+        except FileNotFoundError:
+            pass
+
+        agent_id, greeting, voice, language = key
+        started = time.perf_counter()
+        pcm = self.render(greeting, voice, language)
+        self.stats["renders"] += 1
+        logger.info(
+            f"🔊 Greeting rendered for agent {agent_id}: {len(pcm) / 2 / SAMPLE_RATE:.1f}s audio "
+            f"in {(time.perf_counter() - started) * 1000:.0f}ms"
+        )
+        self._write(path, pcm)
+        return pcm
+
+    def _write(self, path, pcm):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(pcm)
+            os.replace(tmp, path)
+            self._prune()
+        except OSError as e:
+            # Memory tier still has it; only restarts and sibling workers lose out
+            logger.warning(f"⚠️ Greeting audio not written to disk: {e}")
+
+    def _prune(self):
+        files = []
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.name.endswith(".pcm"):
+                    stat = entry.stat()
+                    files.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.disk_max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def snapshot(self):
+        memory = self.memory.snapshot()
+        return {**self.stats, "entries": memory["entries"], "bytes": memory["bytes"]}
+
+
+greeting_audio = GreetingAudioCache()
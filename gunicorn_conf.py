@@ -0,0 +1,16 @@
+# gunicorn_conf.py
+# Production launch profile for the token server:
+#   gunicorn -c gunicorn_conf.py token_server:app
+import multiprocessing
+import os
+
+bind = f"{os.getenv('TOKEN_SERVER_HOST', '0.0.0.0')}:{os.getenv('TOKEN_SERVER_PORT', '3000')}"
+workers = int(os.getenv("TOKEN_SERVER_WORKERS", str(multiprocessing.cpu_count())))
+worker_class = "uvicorn.workers.UvicornWorker"
+keepalive = 30
+backlog = 2048
+graceful_timeout = 20
+# Token issuing is stateless, so workers can be recycled to cap memory drift
+max_requests = 50000
+max_requests_jitter = 5000
+accesslog = None
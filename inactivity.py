@@ -0,0 +1,68 @@
+# inactivity.py
+import asyncio
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+logger = logging.getLogger("inactivity")
+
+
+class DeadlineScheduler:
+    """
+    One heap of per-session deadlines for the whole process, serviced by a
+    single thread that sleeps until the earliest deadline. Rescheduling a key
+    replaces its previous deadline; stale heap entries are skipped lazily.
+    Callbacks run on the event loop that scheduled them.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._tokens = {}
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def __len__(self):
+        with self._cond:
+            return len(self._tokens)
+
+    def schedule(self, key, delay, callback, loop=None):
+        loop = loop or asyncio.get_running_loop()
+        token = next(self._seq)
+        with self._cond:
+            self._tokens[key] = token
+            heapq.heappush(self._heap, (time.monotonic() + delay, token, key, loop, callback))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="deadline-scheduler", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def cancel(self, key):
+        with self._cond:
+            self._tokens.pop(key, None)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    while self._heap and self._tokens.get(self._heap[0][2]) != self._heap[0][1]:
+                        heapq.heappop(self._heap)
+                    if not self._heap:
+                        self._cond.wait()
+                        continue
+                    wait = self._heap[0][0] - time.monotonic()
+                    if wait <= 0:
+                        _, _, key, loop, callback = heapq.heappop(self._heap)
+                        del self._tokens[key]
+                        break
+                    self._cond.wait(wait)
+            try:
+                loop.call_soon_threadsafe(callback)
+            except RuntimeError:
+                # The scheduling loop has closed; nothing left to notify
+                pass
+
+
+scheduler = DeadlineScheduler()
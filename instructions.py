@@ -0,0 +1,157 @@
+# instructions.py
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from kb_index import estimate_tokens
+
+logger = logging.getLogger("instructions")
+
+KB_INSTRUCTIONS_TOKEN_BUDGET = int(os.getenv("KB_INSTRUCTIONS_TOKEN_BUDGET", "1500"))
+INSTRUCTION_CACHE_MAX_ENTRIES = int(os.getenv("INSTRUCTION_CACHE_MAX_ENTRIES", "4000"))
+
+LANGUAGE_METADATA = {
+    "en": {"label": "English", "trigger": "Hello!", "code": "en-US"},
+    "es": {"label": "Spanish", "trigger": "Hola!", "code": "es-ES"},
+    "fr": {"label": "French", "trigger": "Bonjour!", "code": "fr-FR"},
+    "de": {"label": "German", "trigger": "Hallo!", "code": "de-DE"},
+    "hi": {"label": "Hindi", "trigger": "Namaste!", "code": "hi-IN"},
+    "pt": {"label": "Portuguese", "trigger": "Ola!", "code": "pt-PT"},
+    "zh": {"label": "Chinese", "trigger": "Ni hao!", "code": "zh-CN"},
+    "ja": {"label": "Japanese", "trigger": "Konnichiwa!", "code": "ja-JP"},
+    "ko": {"label": "Korean", "trigger": "Annyeonghaseyo!", "code": "ko-KR"},
+    "ar": {"label": "Arabic", "trigger": "Marhaban!", "code": "ar-SA"},
+    "ru": {"label": "Russian", "trigger": "Privet!", "code": "ru-RU"},
+    "it": {"label": "Italian", "trigger": "Ciao!", "code": "it-IT"},
+    "nl": {"label": "Dutch", "trigger": "Hallo!", "code": "nl-NL"},
+    "pl": {"label": "Polish", "trigger": "Czesc!", "code": "pl-PL"},
+    "tr": {"label": "Turkish", "trigger": "Merhaba!", "code": "tr-TR"},
+}
+
+def get_language_metadata(language_code):
+    key = (language_code or "en").lower().split('-')[0]
+    return LANGUAGE_METADATA.get(key, LANGUAGE_METADATA["en"])
+
+def load_knowledge_base():
+    knowledge = {}
+    data_dir = os.path.join(os.path.dirname(__file__), 'data')
+    
+    for file_name, key in [
+        ('base_knowledge.json', 'base'),
+        ('faqs.json', 'faqs'),
+        ('use_cases.json', 'use_cases')
+    ]:
+        try:
+            with open(os.path.join(data_dir, file_name), 'r', encoding='utf-8') as f:
+                knowledge[key] = json.load(f)
+        except Exception as e:
+            logger.debug(f"Could not load {file_name}: {e}")
+            knowledge[key] = {}
+    
+    return knowledge
+
+@functools.lru_cache(maxsize=1)
+def build_system_instructions():
+    kb = load_knowledge_base()
+    
+    instructions = (
+        "You are a helpful, concise, and professional AI assistant. "
+        "Keep responses natural and brief (1-3 sentences)."
+    )
+    
+    if kb.get('base'):
+        base = kb['base']
+        about_text = base.get('description', '')
+        if about_text:
+            instructions += f"\n\nABOUT: {about_text}"
+    
+    return instructions
+
+
+def render_knowledge(kb, query):
+    # Only the chunks most relevant to what the agent is for, within budget
+    knowledge_text = kb.select(query, KB_INSTRUCTIONS_TOKEN_BUDGET) if kb else ""
+    if knowledge_text:
+        return f"\n\nKNOWLEDGE:\n{knowledge_text}"
+    return ""
+
+def build_instructions(agent_config, kb, language):
+    instructions_text = build_system_instructions()
+    voice = "sage"
+    
+    if agent_config:
+        voice = agent_config.get('voice', voice)
+        if agent_config.get('custom_instructions'):
+            instructions_text = agent_config['custom_instructions']
+        
+        query = " ".join(str(agent_config.get(key, '')) for key in ('name', 'description', 'custom_instructions', 'greeting_message'))
+        instructions_text += render_knowledge(kb, query)
+        
+        gender = agent_config.get('gender', '').lower()
+        if gender in ['male', 'female', 'neutral']:
+            instructions_text += f"\n\nYou are a {gender} AI agent."
+    
+    lang_meta = get_language_metadata(language)
+    instructions_text += f"\n\nRespond in {lang_meta['label']}."
+    return instructions_text, voice
+
+
+@dataclass(frozen=True)
+class PromptArtifact:
+    agent_id: str
+    language: str
+    text: str
+    voice: str
+    token_count: int
+    built_at: float
+
+
+class InstructionCompiler:
+    """
+    Memoizes compiled session instructions per (agent_id, language) and the
+    version of the config and KB they were built from.
+
+    Callers pass the AgentCache versions of the objects they hold; entries
+    keep only those numbers, so a KB the cache has evicted is not kept alive
+    here. Without a version (objects that are not cached) nothing is memoized.
+    """
+
+    def __init__(self, max_entries=INSTRUCTION_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def compile(self, agent_id, agent_config, kb, language, version=None):
+        key = (agent_id, (language or "en").lower())
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and version is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return entry[1]
+            self.stats["misses"] += 1
+        
+        text, voice = build_instructions(agent_config, kb, language)
+        artifact = PromptArtifact(agent_id, key[1], text, voice, estimate_tokens(text), time.time())
+        
+        if agent_id and version is not None:
+            with self._lock:
+                self._entries[key] = (version, artifact)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self.stats["evictions"] += 1
+        return artifact
+
+    def artifacts(self):
+        with self._lock:
+            return [entry[1] for entry in self._entries.values()]
+
+
+instruction_compiler = InstructionCompiler()
@@ -0,0 +1,130 @@
+# kb_index.py
+import math
+import os
+import re
+from collections import Counter
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+KB_CHUNK_TOKENS = int(os.getenv("KB_CHUNK_TOKENS", "160"))
+KB_TOP_K = int(os.getenv("KB_TOP_K", "8"))
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+|\n+")
+
+
+def estimate_tokens(text):
+    # ~4 characters per token for English-like text; good enough for budgeting
+    return max(1, len(text) // 4) if text else 0
+
+
+def tokenize(text):
+    return [token for token in _TOKEN_RE.findall(text.lower()) if len(token) > 1]
+
+
+def chunk_text(text, max_tokens=KB_CHUNK_TOKENS):
+    """Split on sentence boundaries into chunks of roughly max_tokens."""
+    chunks = []
+    current = []
+    current_tokens = 0
+    for sentence in _SENTENCE_RE.split(text):
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+        tokens = estimate_tokens(sentence)
+        if current and current_tokens + tokens > max_tokens:
+            chunks.append(" ".join(current))
+            current, current_tokens = [], 0
+        current.append(sentence)
+        current_tokens += tokens
+    if current:
+        chunks.append(" ".join(current))
+    return chunks
+
+
+class KnowledgeBase:
+    """
+    An agent's knowledge base split into chunks with a BM25 index, so callers
+    can pick the chunks most relevant to a query within a token budget.
+    """
+
+    def __init__(self, contents, chunk_tokens=KB_CHUNK_TOKENS):
+        self.text = " ".join(contents)
+        self.chunks = [chunk for content in contents if content for chunk in chunk_text(content, chunk_tokens)]
+        self.chunk_tokens = [estimate_tokens(chunk) for chunk in self.chunks]
+        self.total_tokens = sum(self.chunk_tokens)
+        self._postings = self._build(self.chunks)
+        self.size_bytes = len(self.text.encode("utf-8")) * 3
+
+    def __bool__(self):
+        return bool(self.chunks)
+
+    @staticmethod
+    def _build(chunks):
+        # BM25 weights don't depend on the query, so each term keeps
+        # (chunk indices, precomputed weights) and scoring is a scatter-add
+        term_counts = [Counter(tokenize(chunk)) for chunk in chunks]
+        lengths = [sum(counts.values()) for counts in term_counts]
+        avg_length = (sum(lengths) / len(lengths)) if lengths else 0.0
+        postings = {}
+        for index, counts in enumerate(term_counts):
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[index] / avg_length) if avg_length else BM25_K1
+            for term, tf in counts.items():
+                postings.setdefault(term, ([], []))
+                postings[term][0].append(index)
+                postings[term][1].append(tf * (BM25_K1 + 1) / (tf + norm))
+        total = len(chunks)
+        index = {}
+        for term, (chunk_ids, weights) in postings.items():
+            idf = math.log(1 + (total - len(chunk_ids) + 0.5) / (len(chunk_ids) + 0.5))
+            if NUMPY_AVAILABLE:
+                index[term] = (np.asarray(chunk_ids, dtype=np.int32), np.asarray(weights, dtype=np.float32) * idf)
+            else:
+                index[term] = (chunk_ids, [weight * idf for weight in weights])
+        return index
+
+    def scores(self, query):
+        terms = Counter(tokenize(query))
+        if NUMPY_AVAILABLE:
+            scores = np.zeros(len(self.chunks), dtype=np.float32)
+            for term, count in terms.items():
+                posting = self._postings.get(term)
+                if posting:
+                    scores[posting[0]] += posting[1] * count
+            return scores
+        scores = [0.0] * len(self.chunks)
+        for term, count in terms.items():
+            posting = self._postings.get(term)
+            if posting:
+                for chunk_id, weight in zip(*posting):
+                    scores[chunk_id] += weight * count
+        return scores
+
+    def select(self, query, token_budget, top_k=KB_TOP_K):
+        """Best-matching chunks within token_budget, joined in document order."""
+        if not self.chunks or token_budget <= 0:
+            return ""
+        if self.total_tokens <= token_budget:
+            return " ".join(self.chunks)
+        scores = self.scores(query or "")
+        if NUMPY_AVAILABLE:
+            ranked = [int(i) for i in np.argsort(-scores, kind="stable")]
+        else:
+            ranked = sorted(range(len(scores)), key=lambda i: -scores[i])
+        # With no matching terms, stable ordering falls back to the start of the KB
+        picked = []
+        used = 0
+        for chunk_id in ranked:
+            if len(picked) >= top_k:
+                break
+            if used + self.chunk_tokens[chunk_id] > token_budget:
+                continue
+            picked.append(chunk_id)
+            used += self.chunk_tokens[chunk_id]
+        return " ".join(self.chunks[i] for i in sorted(picked))
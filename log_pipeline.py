@@ -0,0 +1,192 @@
+# log_pipeline.py
+"""
+Non-blocking logging: callers only enqueue records, and a background
+listener thread formats and writes them. Records carry the session_id /
+agent_id bound with `bind_log_context` for the current task, and
+transcript text goes through `log_utterance`, which can demote, sample or
+truncate it (LOG_TRANSCRIPT_LEVEL, LOG_TRANSCRIPT_SAMPLE_RATE,
+LOG_TRANSCRIPT_MAX_CHARS).
+
+The listener's handler is the only console writer: console handlers that
+the LiveKit CLI adds to the root logger later are dropped as soon as they
+appear, so the format chosen at setup (LOG_FORMAT) applies and each record
+is written once. In a job process LiveKit's forwarder (LogQueueHandler)
+takes the console's place, so records, with their bound fields, reach the
+main process and are written there. Other root handlers (telemetry export)
+are moved behind the queue.
+"""
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+from datetime import datetime, timezone
+
+try:
+    from livekit.agents.ipc.log_queue import LogQueueHandler
+except ImportError:
+    LogQueueHandler = None
+
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+LOG_TRANSCRIPT_LEVEL = logging.getLevelName(os.getenv("LOG_TRANSCRIPT_LEVEL", "INFO").upper())
+LOG_TRANSCRIPT_SAMPLE_RATE = float(os.getenv("LOG_TRANSCRIPT_SAMPLE_RATE", "1"))
+# 0 logs utterances in full
+LOG_TRANSCRIPT_MAX_CHARS = int(os.getenv("LOG_TRANSCRIPT_MAX_CHARS", "200"))
+
+_listener = None
+_queue_handler = None
+_console_handler = None
+_adopt_lock = threading.Lock()
+_log_context = contextvars.ContextVar("log_context", default=None)
+
+
+def bind_log_context(**fields):
+    """
+    Tag records logged from the current task, and tasks it creates from now
+    on, with `fields`. Returns the context dict; updating it in place (e.g.
+    agent_id once known) reaches tasks that were created earlier too.
+    """
+    context = {**(_log_context.get() or {}), **fields}
+    _log_context.set(context)
+    return context
+
+
+class ContextFilter(logging.Filter):
+    """Copies the bound log context onto records, on the logging thread, before they are queued."""
+
+    def filter(self, record):
+        context = _log_context.get()
+        if context:
+            for key, value in context.items():
+                if not hasattr(record, key):
+                    setattr(record, key, value)
+        return True
+
+
+def log_utterance(logger, speaker, text, icon=""):
+    """Log one transcript line under the transcript level, sample rate and length cap."""
+    if not logger.isEnabledFor(LOG_TRANSCRIPT_LEVEL):
+        return
+    if LOG_TRANSCRIPT_SAMPLE_RATE < 1 and random.random() >= LOG_TRANSCRIPT_SAMPLE_RATE:
+        return
+    shown = text
+    if LOG_TRANSCRIPT_MAX_CHARS and len(text) > LOG_TRANSCRIPT_MAX_CHARS:
+        shown = text[:LOG_TRANSCRIPT_MAX_CHARS] + "…"
+    logger.log(LOG_TRANSCRIPT_LEVEL, "%s%s: %s", f"{icon} " if icon else "", speaker, shown,
+               extra={"speaker": speaker, "chars": len(text)})
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record; `extra=` fields become top-level keys."""
+
+    def format(self, record):
+        payload = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED and not key.startswith("_"):
+                payload[key] = value
+        if record.exc_info:
+            payload["exc"] = self.formatException(record.exc_info)
+        return json.dumps(payload, default=str, ensure_ascii=False)
+
+
+class _RootQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that adopts handlers added to the root logger after setup before they see a record."""
+
+    def handle(self, record):
+        if len(logging.getLogger().handlers) > 1:
+            adopt_root_handlers()
+        return super().handle(record)
+
+
+def _is_forwarder(handler):
+    return LogQueueHandler is not None and isinstance(handler, LogQueueHandler)
+
+
+def _is_console_handler(handler):
+    return (isinstance(handler, logging.StreamHandler) and not isinstance(handler, logging.FileHandler)
+            and handler.stream in (sys.stdout, sys.stderr, sys.__stdout__, sys.__stderr__))
+
+
+def setup_queue_logging(level=logging.INFO, json_format=True, handler=None):
+    """
+    Route the root logger through a QueueHandler so callers only enqueue;
+    formatting and the stream write happen on a background listener thread.
+    """
+    global _listener, _queue_handler, _console_handler
+    if _listener:
+        return _listener
+    handler = _console_handler = handler or logging.StreamHandler()
+    handler.setFormatter(
+        JsonFormatter() if json_format
+        else logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    )
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    _listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+    _queue_handler = _RootQueueHandler(log_queue)
+    _queue_handler.addFilter(ContextFilter())
+    root.handlers.insert(0, _queue_handler)
+    adopt_root_handlers()
+    root.setLevel(level)
+    _listener.start()
+    atexit.register(stop_queue_logging)
+    if hasattr(os, "register_at_fork"):
+        os.register_at_fork(after_in_child=_restart_after_fork)
+    return _listener
+
+
+def _restart_after_fork():
+    # Only the forking thread survives: the listener thread is gone and the queue may be mid-put
+    global _listener, _adopt_lock
+    if not _listener:
+        return
+    _adopt_lock = threading.Lock()
+    log_queue = queue.SimpleQueue()
+    _queue_handler.queue = log_queue
+    _listener = logging.handlers.QueueListener(log_queue, *_listener.handlers, respect_handler_level=True)
+    _listener.start()
+
+
+def stop_queue_logging():
+    """Write out everything still queued and stop the listener thread."""
+    global _listener
+    if _listener:
+        listener, _listener = _listener, None
+        listener.stop()
+
+
+def adopt_root_handlers():
+    """
+    Take every other handler off the root logger: console writers (the
+    LiveKit CLI's stdout handler) are dropped in favour of the listener's
+    handler, a job process's log forwarder replaces that handler, and the
+    rest are moved behind the queue. Runs automatically whenever a handler
+    shows up on root.
+    """
+    if not _listener:
+        return 0
+    root = logging.getLogger()
+    with _adopt_lock:
+        others = [handler for handler in root.handlers if handler is not _queue_handler]
+        for handler in others:
+            # Called from inside root's handler loop; removing later entries means they're skipped for this record
+            root.removeHandler(handler)
+        adopted = [handler for handler in others if not _is_console_handler(handler)]
+        if adopted:
+            handlers = _listener.handlers
+            if any(_is_forwarder(handler) for handler in adopted):
+                # The main process writes this process's records; printing them here too would double them
+                handlers = tuple(handler for handler in handlers if handler is not _console_handler)
+            _listener.handlers = (*handlers, *adopted)
+    return len(others)
@@ -0,0 +1,284 @@
+# metrics.py
+"""
+Prometheus text exposition without a client library.
+
+The worker's main process serves /metrics (`start_http_server`). Job
+processes can't: each serves one call and exits. They publish a snapshot
+of their metrics to METRICS_MULTIPROC_DIR every METRICS_FLUSH_SECONDS
+(`start_writer`), and the exporter merges those into its own output.
+Histograms of exited processes are kept, since they are cumulative; gauges
+only count while their process is alive, combined per Gauge
+`multiprocess` mode: "sum", "max", or "exporter" for values that only mean
+something in the exporting process.
+"""
+import atexit
+import bisect
+import glob
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger("metrics")
+
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9464"))
+# Set by the exporter for the job processes it starts; empty means single-process
+METRICS_MULTIPROC_DIR = os.getenv("METRICS_MULTIPROC_DIR", "")
+METRICS_FLUSH_SECONDS = float(os.getenv("METRICS_FLUSH_SECONDS", "1"))
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_registry = []
+_server = None
+_server_attempted = False
+_server_lock = threading.Lock()
+_exporter_pid = None
+_writer_pid = None
+_writer_path = None
+_retired = {}  # histogram name -> merged state of job processes that have exited
+_merge_lock = threading.Lock()
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in sorted(labels.items())) + "}"
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, seconds):
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += seconds
+
+    def state(self):
+        with self._lock:
+            return {"counts": list(self._counts), "sum": self._sum}
+
+    def render(self, others=()):
+        state = self.state()
+        counts, total = state["counts"], state["sum"]
+        for other in others:
+            if len(other["counts"]) == len(counts):
+                counts = [a + b for a, b in zip(counts, other["counts"])]
+                total += other["sum"]
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        cumulative = 0
+        for bound, count in zip(self.buckets, counts):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{{le="{bound}"}} {cumulative}')
+        cumulative += counts[-1]
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {cumulative}')
+        lines.append(f"{self.name}_sum {total}")
+        lines.append(f"{self.name}_count {cumulative}")
+        return lines
+
+
+class Gauge:
+    """
+    Value read at scrape time. `fn` returns a number, or a list of
+    (labels, value) pairs for a labelled family.
+    """
+
+    def __init__(self, name, help_text, fn, metric_type="gauge", multiprocess="sum"):
+        self.name = name
+        self.help_text = help_text
+        self.fn = fn
+        self.metric_type = metric_type
+        self.multiprocess = multiprocess
+        _registry.append(self)
+
+    def samples(self):
+        try:
+            value = self.fn()
+        except Exception as e:
+            logger.debug(f"Metric {self.name} error: {e}")
+            return []
+        if isinstance(value, (int, float)):
+            return [({}, value)]
+        return [(dict(labels), sample) for labels, sample in value]
+
+    def render(self, others=()):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.metric_type}"]
+        merged = {}
+        for samples in (self.samples(), *others):
+            for labels, value in samples:
+                key = tuple(sorted(labels.items()))
+                if key not in merged:
+                    merged[key] = value
+                elif self.multiprocess == "max":
+                    merged[key] = max(merged[key], value)
+                else:
+                    merged[key] += value
+        for key, value in merged.items():
+            lines.append(f"{self.name}{_format_labels(dict(key))} {value}")
+        return lines
+
+
+def _snapshot():
+    return {
+        "pid": os.getpid(),
+        "histograms": {m.name: m.state() for m in _registry if isinstance(m, Histogram)},
+        "gauges": {
+            m.name: m.samples() for m in _registry
+            if isinstance(m, Gauge) and m.multiprocess != "exporter"
+        },
+    }
+
+
+def _process_snapshots():
+    """Snapshots of live job processes; files of exited ones are folded into _retired and removed."""
+    if not METRICS_MULTIPROC_DIR:
+        return [], {}
+    live = []
+    with _merge_lock:
+        for path in glob.glob(os.path.join(METRICS_MULTIPROC_DIR, "*.json")):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if snapshot["pid"] == os.getpid():
+                continue
+            if _pid_alive(snapshot["pid"]):
+                live.append(snapshot)
+                continue
+            for name, state in snapshot["histograms"].items():
+                retired = _retired.setdefault(name, {"counts": [0] * len(state["counts"]), "sum": 0.0})
+                if len(retired["counts"]) == len(state["counts"]):
+                    retired["counts"] = [a + b for a, b in zip(retired["counts"], state["counts"])]
+                    retired["sum"] += state["sum"]
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        retired = {name: dict(state) for name, state in _retired.items()}
+    return live, retired
+
+
+def process_values(name):
+    """Samples of gauge `name` from live job processes (exporter side)."""
+    if not METRICS_MULTIPROC_DIR or _exporter_pid != os.getpid():
+        return []
+    live, _ = _process_snapshots()
+    return [sample for snapshot in live for sample in snapshot["gauges"].get(name, [])]
+
+
+def render_text():
+    live, retired = ([], {})
+    if METRICS_MULTIPROC_DIR and _exporter_pid == os.getpid():
+        live, retired = _process_snapshots()
+    lines = []
+    for metric in list(_registry):
+        if isinstance(metric, Histogram):
+            others = [snapshot["histograms"][metric.name] for snapshot in live if metric.name in snapshot["histograms"]]
+            if metric.name in retired:
+                others.append(retired[metric.name])
+        elif metric.multiprocess == "exporter":
+            others = []
+        else:
+            others = [snapshot["gauges"][metric.name] for snapshot in live if metric.name in snapshot["gauges"]]
+        lines.extend(metric.render(others))
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = render_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(port=METRICS_PORT, host=METRICS_HOST):
+    """
+    Serve /metrics from a daemon thread, once, in the worker's main process,
+    and have job processes started after this publish to a directory it
+    merges. Port 0 disables it.
+    """
+    global _server, _server_attempted, _exporter_pid, METRICS_MULTIPROC_DIR
+    with _server_lock:
+        if _server_attempted or not port:
+            return _server
+        _server_attempted = True
+        try:
+            _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+        except OSError as e:
+            logger.warning(f"Metrics endpoint not started on {host}:{port}: {e}")
+            return None
+        _exporter_pid = os.getpid()
+        if not METRICS_MULTIPROC_DIR:
+            METRICS_MULTIPROC_DIR = os.path.join(tempfile.gettempdir(), f"agent-metrics-{os.getpid()}")
+        os.makedirs(METRICS_MULTIPROC_DIR, exist_ok=True)
+        for path in glob.glob(os.path.join(METRICS_MULTIPROC_DIR, "*.json")):
+            # Left by a previous run of this worker
+            os.remove(path)
+        # Inherited by job processes, spawned or forked
+        os.environ["METRICS_MULTIPROC_DIR"] = METRICS_MULTIPROC_DIR
+        threading.Thread(target=_server.serve_forever, name="metrics-http", daemon=True).start()
+        logger.info(f"📈 Metrics on http://{host}:{port}/metrics")
+        return _server
+
+
+def write_snapshot():
+    """Publish this process's metrics to the exporter's directory."""
+    if not _writer_path:
+        return
+    temp_path = f"{_writer_path}.tmp"
+    try:
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(_snapshot(), f, default=str)
+        os.replace(temp_path, _writer_path)
+    except OSError as e:
+        logger.debug(f"Metrics snapshot not written: {e}")
+
+
+def start_writer(interval=METRICS_FLUSH_SECONDS):
+    """In a job process, publish metrics for the exporter every `interval` seconds (idempotent)."""
+    global _writer_pid, _writer_path
+    with _server_lock:
+        if not METRICS_MULTIPROC_DIR or _exporter_pid == os.getpid() or _writer_pid == os.getpid():
+            return
+        _writer_pid = os.getpid()
+        _writer_path = os.path.join(METRICS_MULTIPROC_DIR, f"{os.getpid()}-{uuid.uuid4().hex[:8]}.json")
+
+    def run():
+        while True:
+            time.sleep(interval)
+            write_snapshot()
+
+    threading.Thread(target=run, name="metrics-writer", daemon=True).start()
+    atexit.register(write_snapshot)
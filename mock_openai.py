@@ -0,0 +1,94 @@
+# mock_openai.py
+"""
+Local stand-in for the OpenAI chat completions endpoint, for exercising the
+summary pipeline without the real API:
+
+    python mock_openai.py
+    OPENAI_BASE_URL=http://127.0.0.1:8090/v1 python server.py dev
+
+Single-transcript prompts get one summary; batch prompts (summary_script's
+CONVERSATIONS block) get one summary per conversation id. Latency, error
+rate and dropped batch items are configurable to exercise the retries.
+"""
+import asyncio
+import json
+import os
+import random
+import time
+import uuid
+
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+
+from summary_script import BATCH_CONVERSATIONS_MARKER
+
+MOCK_OPENAI_HOST = os.getenv("MOCK_OPENAI_HOST", "127.0.0.1")
+MOCK_OPENAI_PORT = int(os.getenv("MOCK_OPENAI_PORT", "8090"))
+MOCK_OPENAI_LATENCY_SECONDS = float(os.getenv("MOCK_OPENAI_LATENCY_SECONDS", "0.5"))
+MOCK_OPENAI_ERROR_RATE = float(os.getenv("MOCK_OPENAI_ERROR_RATE", "0"))
+MOCK_OPENAI_DROP_RATE = float(os.getenv("MOCK_OPENAI_DROP_RATE", "0"))
+
+stats = {"requests": 0, "errors": 0, "conversations": 0, "dropped": 0}
+
+
+def mock_summary(conversation_id=None):
+    summary = {
+        "requestedData": "Pricing information",
+        "responseData": "Shared the premium plan pricing.",
+        "contactInfo": {"email": "Unknown", "phone": "None"},
+        "deliveryChannels": ["email"],
+    }
+    if conversation_id is not None:
+        summary = {"id": conversation_id, **summary}
+    return summary
+
+
+def mock_completion_content(messages, drop_rate=MOCK_OPENAI_DROP_RATE):
+    """JSON content the real model would return for these messages."""
+    prompt = messages[-1]["content"] if messages else ""
+    if BATCH_CONVERSATIONS_MARKER not in prompt:
+        stats["conversations"] += 1
+        return json.dumps(mock_summary())
+    conversations = json.loads(prompt.split(BATCH_CONVERSATIONS_MARKER, 1)[1])
+    summaries = []
+    for conversation in conversations:
+        if random.random() < drop_rate:
+            stats["dropped"] += 1
+            continue
+        summaries.append(mock_summary(conversation["id"]))
+    stats["conversations"] += len(summaries)
+    return json.dumps({"summaries": summaries})
+
+
+app = FastAPI()
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(body: dict):
+    stats["requests"] += 1
+    await asyncio.sleep(MOCK_OPENAI_LATENCY_SECONDS)
+    if random.random() < MOCK_OPENAI_ERROR_RATE:
+        stats["errors"] += 1
+        return JSONResponse(status_code=429, content={"error": {"message": "Rate limit (mock)", "type": "rate_limit"}})
+    return {
+        "id": f"chatcmpl-mock-{uuid.uuid4().hex[:12]}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "gpt-4o-mini"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": mock_completion_content(body.get("messages", []))},
+            "finish_reason": "stop",
+        }],
+        "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+    }
+
+
+@app.get("/stats")
+async def get_stats():
+    return stats
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host=MOCK_OPENAI_HOST, port=MOCK_OPENAI_PORT, access_log=False)
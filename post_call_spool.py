@@ -0,0 +1,370 @@
+# post_call_spool.py
+"""
+Durable post-call pipeline.
+
+Finalized calls are written to a local SQLite (WAL) spool and then move
+through stages, e.g. analytics -> summarize -> upload -> index. Any process
+can spool a job; the stages run in the one process that called `start()`,
+the worker's long-lived main process, which polls the spool for new jobs
+and for retries that have come due. Short-lived job processes only write
+rows, so nothing they leave behind depends on them staying up.
+
+A failed stage is retried with exponential backoff, recorded in the spool
+(next_attempt_at); a job that keeps failing is parked as dead-letter with
+its error instead of being dropped. Delivery is at-least-once and stage
+handlers must be idempotent.
+
+    python post_call_spool.py                 # counts per stage
+    python post_call_spool.py --dead          # list dead-letter jobs
+    python post_call_spool.py --requeue-dead  # retry dead-letter jobs on next start
+"""
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+
+from summary_queue import SummaryBatchQueue, SUMMARY_BATCH_SIZE, SUMMARY_BATCH_WINDOW_SECONDS, SUMMARY_DRAIN_TIMEOUT_SECONDS
+
+logger = logging.getLogger("post-call-spool")
+
+POST_CALL_SPOOL_PATH = os.getenv("POST_CALL_SPOOL_PATH", "./spool/post_call.db")
+POST_CALL_MAX_ATTEMPTS = int(os.getenv("POST_CALL_MAX_ATTEMPTS", "8"))
+POST_CALL_RETRY_BASE_SECONDS = float(os.getenv("POST_CALL_RETRY_BASE_SECONDS", "2"))
+POST_CALL_RETRY_MAX_SECONDS = float(os.getenv("POST_CALL_RETRY_MAX_SECONDS", "300"))
+# How often the running process looks for jobs spooled elsewhere and retries that are due
+POST_CALL_POLL_SECONDS = float(os.getenv("POST_CALL_POLL_SECONDS", "1"))
+
+DEAD = "dead"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    key TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    failed_stage TEXT,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    next_attempt_at REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS jobs_stage ON jobs (stage);
+"""
+
+
+class Spool:
+    """SQLite job table; every write is its own transaction, fsynced before returning."""
+
+    def __init__(self, path=POST_CALL_SPOOL_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        # Process-executor jobs share the file; wait out their write locks
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=FULL")
+        self._db.executescript(_SCHEMA)
+        self._migrate()
+
+    def _migrate(self):
+        # Spools written before retries were kept on disk
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(jobs)")}
+        if "next_attempt_at" not in columns:
+            try:
+                self._db.execute("ALTER TABLE jobs ADD COLUMN next_attempt_at REAL NOT NULL DEFAULT 0")
+            except sqlite3.OperationalError:
+                # Another process sharing the file added it first
+                pass
+
+    def add(self, key, stage, payload):
+        now = time.time()
+        with self._lock:
+            cursor = self._db.execute(
+                "INSERT INTO jobs (key, stage, payload, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (key, stage, json.dumps(payload, default=str), now, now),
+            )
+            return cursor.lastrowid
+
+    def load(self, job_ids):
+        """Rows of the given jobs that are still due to run: not finished, dead or waiting on a retry."""
+        marks = ",".join("?" * len(job_ids))
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT id, stage, payload, attempts FROM jobs WHERE id IN ({marks}) AND stage != ? AND next_attempt_at <= ?",
+                [*job_ids, DEAD, time.time()],
+            ).fetchall()
+        return [(job_id, stage, json.loads(payload), attempts) for job_id, stage, payload, attempts in rows]
+
+    def apply(self, advanced=(), finished=(), failed=()):
+        """
+        Record one batch of stage outcomes in a single transaction: advanced
+        (id, stage, payload), finished ids, failed (id, attempts, error, retry_at),
+        where a retry_at of None dead-letters the job.
+        """
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                for job_id, stage, payload in advanced:
+                    self._db.execute(
+                        "UPDATE jobs SET stage = ?, payload = ?, attempts = 0, last_error = NULL, updated_at = ? WHERE id = ?",
+                        (stage, json.dumps(payload, default=str), now, job_id),
+                    )
+                for job_id in finished:
+                    self._db.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+                for job_id, attempts, error, retry_at in failed:
+                    if retry_at is None:
+                        self._db.execute(
+                            "UPDATE jobs SET failed_stage = stage, stage = ?, attempts = ?, last_error = ?, updated_at = ? WHERE id = ?",
+                            (DEAD, attempts, error, now, job_id),
+                        )
+                    else:
+                        self._db.execute(
+                            "UPDATE jobs SET attempts = ?, last_error = ?, updated_at = ?, next_attempt_at = ? WHERE id = ?",
+                            (attempts, error, now, retry_at, job_id),
+                        )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def due(self, now=None):
+        """Ids of jobs that are not dead-lettered and not waiting out a retry delay."""
+        with self._lock:
+            return [row[0] for row in self._db.execute(
+                "SELECT id FROM jobs WHERE stage != ? AND next_attempt_at <= ? ORDER BY id", (DEAD, now or time.time())
+            )]
+
+    def dead(self):
+        with self._lock:
+            return self._db.execute(
+                "SELECT id, key, failed_stage, attempts, last_error, updated_at FROM jobs WHERE stage = ? ORDER BY id", (DEAD,)
+            ).fetchall()
+
+    def requeue_dead(self):
+        with self._lock:
+            cursor = self._db.execute(
+                "UPDATE jobs SET stage = failed_stage, failed_stage = NULL, attempts = 0, next_attempt_at = 0, updated_at = ? WHERE stage = ?",
+                (time.time(), DEAD),
+            )
+            return cursor.rowcount
+
+    def counts(self):
+        with self._lock:
+            return dict(self._db.execute("SELECT stage, COUNT(*) FROM jobs GROUP BY stage").fetchall())
+
+
+class Stage:
+    """
+    A pipeline step. `handler(payloads)` is a coroutine taking a list of job
+    payloads and returning one result per payload: the updated payload, or an
+    Exception to retry that job. `when(payload)` can skip the stage.
+    """
+
+    def __init__(self, name, handler, when=None):
+        self.name = name
+        self.handler = handler
+        self.when = when
+
+
+class PostCallPipeline:
+    """
+    Runs spooled jobs through `stages` on a SummaryBatchQueue (its own loop
+    thread, bounded concurrency, batching), in the process that called
+    `start()`. Jobs the queue can't take yet stay in the spool and are
+    offered again as batches complete.
+    """
+
+    def __init__(self, stages, spool=None, batch_size=SUMMARY_BATCH_SIZE, window=SUMMARY_BATCH_WINDOW_SECONDS,
+                 max_attempts=POST_CALL_MAX_ATTEMPTS, poll_interval=POST_CALL_POLL_SECONDS):
+        self.stages = {stage.name: stage for stage in stages}
+        self.order = [stage.name for stage in stages]
+        self._spool = spool
+        self._spool_lock = threading.Lock()
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.queue = SummaryBatchQueue(self._run_batch, batch_size=batch_size, window=window)
+        self._runner_pid = None
+        self._stopped = threading.Event()
+        self._active = set()  # queued, parked or running in this process
+        self._parked = set()
+        self._parked_lock = threading.Lock()
+        self.stats = {"enqueued": 0, "stage_failures": 0, "dead_lettered": 0}
+
+    @property
+    def spool(self):
+        # Opened on first use so importing server.py doesn't create files
+        with self._spool_lock:
+            if self._spool is None:
+                self._spool = Spool()
+        return self._spool
+
+    def next_stage(self, current, payload):
+        index = self.order.index(current) + 1 if current else 0
+        for name in self.order[index:]:
+            when = self.stages[name].when
+            if when is None or when(payload):
+                return name
+        return None
+
+    def enqueue(self, key, payload):
+        """
+        Blocking: returns once the job is on disk. Call from a worker thread.
+        In the running process the job is queued at once; anywhere else the
+        running process picks it up on its next poll.
+        """
+        stage = self.next_stage(None, payload)
+        if stage is None:
+            return None
+        job_id = self.spool.add(key, stage, payload)
+        self.stats["enqueued"] += 1
+        if self.runs_here():
+            self._offer(job_id)
+        return job_id
+
+    def runs_here(self):
+        return self._runner_pid == os.getpid()
+
+    def start(self):
+        """
+        Run stages in this process: queue everything due in the spool, then
+        keep polling for jobs other processes spool and for retries as they
+        come due. Call once, from the worker's long-lived main process.
+        """
+        if self.runs_here():
+            return 0
+        self._runner_pid = os.getpid()
+        resumed = self.poll()
+        if resumed:
+            logger.info(f"♻️ Resuming {len(self._active)} post-call jobs from {self.spool.path}")
+        threading.Thread(target=self._poll_loop, name="post-call-poll", daemon=True).start()
+        return resumed
+
+    def poll(self):
+        """Queue spooled jobs that are due and not already in this process; returns how many."""
+        return sum(1 for job_id in self.spool.due() if self._offer(job_id))
+
+    def _poll_loop(self):
+        while not self._stopped.wait(self.poll_interval):
+            try:
+                self.poll()
+            except Exception as e:
+                logger.warning(f"⚠️ Post-call spool poll failed: {e}")
+
+    def _offer(self, job_id, again=False):
+        """Hand a job to the queue unless it is already here; `again` re-offers one this process holds."""
+        with self._parked_lock:
+            if job_id in self._active and not again:
+                return False
+            self._active.add(job_id)
+        if not self.queue.submit(job_id):
+            with self._parked_lock:
+                self._parked.add(job_id)
+        return True
+
+    def _release(self, job_ids):
+        with self._parked_lock:
+            self._active.difference_update(job_ids)
+
+    def _offer_parked(self):
+        with self._parked_lock:
+            parked, self._parked = self._parked, set()
+        for job_id in sorted(parked):
+            self._offer(job_id, again=True)
+
+    def _retry_delay(self, attempts):
+        return random.uniform(0, min(POST_CALL_RETRY_MAX_SECONDS, POST_CALL_RETRY_BASE_SECONDS * 2 ** attempts))
+
+    async def _run_batch(self, jobs):
+        job_ids = [job_id for job_id, in jobs]
+        rows = self.spool.load(job_ids)
+        # Finished, dead-lettered or failed again since it was queued
+        self._release(set(job_ids) - {row[0] for row in rows})
+        by_stage = {}
+        for row in rows:
+            by_stage.setdefault(row[1], []).append(row)
+
+        advanced, finished, failed, results = [], [], [], []
+        for stage_name, stage_rows in by_stage.items():
+            stage = self.stages.get(stage_name)
+            payloads = [payload for _, _, payload, _ in stage_rows]
+            try:
+                if stage is None:
+                    raise RuntimeError(f"unknown stage {stage_name}")
+                outcomes = await stage.handler(payloads)
+            except Exception as e:
+                outcomes = [e] * len(stage_rows)
+            for (job_id, _, _, attempts), outcome in zip(stage_rows, outcomes):
+                results.append(outcome)
+                if isinstance(outcome, Exception):
+                    attempts += 1
+                    dead = attempts >= self.max_attempts
+                    retry_at = None if dead else time.time() + self._retry_delay(attempts)
+                    failed.append((job_id, attempts, f"{type(outcome).__name__}: {outcome}", retry_at))
+                    self.stats["stage_failures"] += 1
+                    if dead:
+                        self.stats["dead_lettered"] += 1
+                        logger.error(f"☠️ Post-call job {job_id} dead-lettered at {stage_name}: {outcome}")
+                    else:
+                        logger.warning(f"⚠️ Post-call job {job_id} failed at {stage_name} (attempt {attempts}): {outcome}")
+                    continue
+                following = self.next_stage(stage_name, outcome)
+                if following:
+                    advanced.append((job_id, following, outcome))
+                else:
+                    finished.append(job_id)
+
+        try:
+            self.spool.apply(advanced, finished, failed)
+        finally:
+            # Failed jobs come back through poll() once their retry is due
+            self._release(finished + [job_id for job_id, _, _, _ in failed])
+
+        for job_id, _, _ in advanced:
+            self._offer(job_id, again=True)
+        self._offer_parked()
+        return results
+
+    def backlog(self):
+        """Jobs queued, parked or running here; ones waiting out a retry delay don't count."""
+        with self._parked_lock:
+            return len(self._active)
+
+    def snapshot(self):
+        with self._parked_lock:
+            parked = len(self._parked)
+        return {**self.queue.snapshot(), **self.stats, "parked": parked}
+
+    async def drain(self, timeout=SUMMARY_DRAIN_TIMEOUT_SECONDS):
+        """Wait for queued stage work; jobs waiting on a retry stay in the spool."""
+        return await self.queue.drain(timeout)
+
+    async def close(self, timeout=SUMMARY_DRAIN_TIMEOUT_SECONDS):
+        self._stopped.set()
+        # Drain first: a closed queue would reject the next stage of jobs still in flight
+        await self.queue.drain(timeout)
+        return await self.queue.close(timeout)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--path", default=POST_CALL_SPOOL_PATH)
+    parser.add_argument("--dead", action="store_true", help="list dead-letter jobs")
+    parser.add_argument("--requeue-dead", action="store_true", help="move dead-letter jobs back to their failed stage")
+    args = parser.parse_args()
+
+    spool = Spool(args.path)
+    if args.requeue_dead:
+        print(f"Requeued {spool.requeue_dead()} dead-letter jobs")
+    if args.dead:
+        for job_id, key, stage, attempts, error, updated_at in spool.dead():
+            print(f"{job_id}\t{key}\t{stage}\t{attempts} attempts\t{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(updated_at))}\t{error}")
+    print(json.dumps(spool.counts(), indent=2))
@@ -0,0 +1,159 @@
+# record_codec.py
+"""
+Serialization for stored call records (summaries in S3, compact analytics).
+
+Records are wrapped in a schema-versioned envelope and encoded as compact
+JSON or msgpack, optionally gzip/zstd compressed. Blobs are
+self-describing: `decode` sniffs the compression and format, so readers
+don't need to know the writer's settings.
+"""
+import gzip
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime, timezone
+
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+logger = logging.getLogger("record-codec")
+
+SCHEMA_VERSION = 1
+RECORD_FORMAT = os.getenv("RECORD_FORMAT", "json")  # json | msgpack
+RECORD_COMPRESSION = os.getenv("RECORD_COMPRESSION", "gzip")  # none | gzip | zstd
+RECORD_COMPRESSION_LEVEL = int(os.getenv("RECORD_COMPRESSION_LEVEL", "6"))
+# legacy: summary_<agent>_<call>.json, plain JSON; partitioned: <kind>/dt=YYYY-MM-DD/agent=<id>/<sha256>.<ext>
+# in the codec envelope. Opt-in like ANALYTICS_LAYOUT: summaryUrl readers must handle `decode` first.
+S3_KEY_LAYOUT = os.getenv("S3_KEY_LAYOUT", "legacy")
+# v1: verbose call_analytics document; v2: typed timestamps + turns as one encoded blob
+ANALYTICS_LAYOUT = os.getenv("ANALYTICS_LAYOUT", "v1")
+
+_GZIP_MAGIC = b"\x1f\x8b"
+_ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+
+class RecordCodec:
+    def __init__(self, fmt=RECORD_FORMAT, compression=RECORD_COMPRESSION, level=RECORD_COMPRESSION_LEVEL):
+        if fmt == "msgpack" and not MSGPACK_AVAILABLE:
+            logger.warning("msgpack not installed, using json")
+            fmt = "json"
+        if compression == "zstd" and not ZSTD_AVAILABLE:
+            logger.warning("zstandard not installed, using gzip")
+            compression = "gzip"
+        self.format = fmt
+        self.compression = compression
+        self.level = level
+        self._zstd = zstandard.ZstdCompressor(level=level) if compression == "zstd" else None
+
+    @property
+    def extension(self):
+        suffix = {"gzip": ".gz", "zstd": ".zst"}.get(self.compression, "")
+        return (".msgpack" if self.format == "msgpack" else ".json") + suffix
+
+    @property
+    def content_type(self):
+        return "application/msgpack" if self.format == "msgpack" else "application/json"
+
+    @property
+    def content_encoding(self):
+        # HTTP clients transparently inflate gzip/zstd JSON served with this header
+        return {"gzip": "gzip", "zstd": "zstd"}.get(self.compression)
+
+    def serialize(self, value):
+        if self.format == "msgpack":
+            return msgpack.packb(value, default=str, use_bin_type=True)
+        return json.dumps(value, separators=(",", ":"), ensure_ascii=False, default=str).encode("utf-8")
+
+    def compress(self, raw):
+        if self.compression == "gzip":
+            # mtime=0 keeps the output, and so the content address, deterministic
+            return gzip.compress(raw, compresslevel=self.level, mtime=0)
+        if self.compression == "zstd":
+            return self._zstd.compress(raw)
+        return raw
+
+    def encode(self, kind, data, **fields):
+        """Envelope `data` as {"v", "kind", **fields, "data"} and encode it."""
+        return self.compress(self.serialize({"v": SCHEMA_VERSION, "kind": kind, **fields, "data": data}))
+
+    def encode_value(self, value):
+        return self.compress(self.serialize(value))
+
+
+def decode(blob):
+    if blob[:2] == _GZIP_MAGIC:
+        blob = gzip.decompress(blob)
+    elif blob[:4] == _ZSTD_MAGIC:
+        if not ZSTD_AVAILABLE:
+            raise ValueError("zstd record but zstandard is not installed")
+        blob = zstandard.ZstdDecompressor().decompressobj().decompress(blob)
+    if blob[:1] in (b"{", b"["):
+        return json.loads(blob)
+    if not MSGPACK_AVAILABLE:
+        raise ValueError("msgpack record but msgpack is not installed")
+    return msgpack.unpackb(blob, raw=False)
+
+
+def content_address(blob):
+    return hashlib.sha256(blob).hexdigest()[:32]
+
+
+def partition_date(timestamp=None):
+    """YYYY-MM-DD (UTC) from an ISO timestamp, defaulting to today."""
+    try:
+        moment = datetime.fromisoformat(timestamp)
+    except (TypeError, ValueError):
+        moment = datetime.now(timezone.utc)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.astimezone(timezone.utc).strftime("%Y-%m-%d")
+
+
+def record_key(kind, agent_id, blob, extension, timestamp=None):
+    """Date-partitioned, content-addressed key, so a day or an agent lists with one prefix."""
+    return f"{kind}/dt={partition_date(timestamp)}/agent={agent_id}/{content_address(blob)}{extension}"
+
+
+def _to_datetime(value):
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def compact_call_document(document, codec):
+    """
+    v2 call_analytics layout for a v1 `call_document` dict: timestamps become
+    native Firestore timestamps and the turns collapse into one encoded blob
+    of [speaker, ms since call start, text] (speaker 0 = user, 1 = agent).
+    """
+    start = _to_datetime(document.get("start_time_utc"))
+    turns = []
+    for speaker, key in ((0, "user_transcripts"), (1, "agent_transcripts")):
+        for record in document.get(key, []):
+            at = _to_datetime(record.get("timestamp_utc"))
+            offset = int((at - start).total_seconds() * 1000) if at and start else 0
+            turns.append([speaker, offset, record.get("text", "")])
+    turns.sort(key=lambda turn: turn[1])
+
+    compact = {
+        key: value for key, value in document.items()
+        if key not in ("user_transcripts", "agent_transcripts", "start_time_utc", "end_time_utc")
+    }
+    compact.update({
+        "schema_version": 2,
+        "start_time": start,
+        "end_time": _to_datetime(document.get("end_time_utc")),
+        "turns": codec.encode_value(turns),
+    })
+    return compact
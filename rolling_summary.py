@@ -0,0 +1,112 @@
+# rolling_summary.py
+"""
+Incremental call summaries.
+
+While a call runs, the turns since the last fold are merged into a running
+summary (requestedData, responseData, contactInfo, deliveryChannels) every
+ROLLING_SUMMARY_TURNS turns, or when the conversation goes quiet for
+ROLLING_SUMMARY_IDLE_SECONDS after an agent turn. At hangup the summarize
+stage only folds the tail, and no prompt ever holds more than one delta,
+however long the call.
+
+Folds run on their own summary loop thread, at most one in flight per call.
+A failed fold keeps the previous state; its turns go into the next delta.
+"""
+import logging
+import os
+import threading
+
+from inactivity import DeadlineScheduler
+from summary_queue import SummaryQueue
+from summary_script import fold_summary, get_async_clients, KB_SUMMARY_TOKEN_BUDGET
+
+logger = logging.getLogger("rolling-summary")
+
+# 0 disables rolling summaries: the whole transcript is summarized after hangup
+ROLLING_SUMMARY_TURNS = int(os.getenv("ROLLING_SUMMARY_TURNS", "0"))
+ROLLING_SUMMARY_IDLE_SECONDS = float(os.getenv("ROLLING_SUMMARY_IDLE_SECONDS", "8"))
+# An idle fold needs at least this many new turns to be worth a request
+ROLLING_SUMMARY_IDLE_MIN_TURNS = int(os.getenv("ROLLING_SUMMARY_IDLE_MIN_TURNS", "2"))
+ROLLING_SUMMARY_CONCURRENCY = int(os.getenv("ROLLING_SUMMARY_CONCURRENCY", "4"))
+
+ROLLING_SUMMARY_ENABLED = ROLLING_SUMMARY_TURNS > 0
+
+idle_scheduler = DeadlineScheduler()
+
+
+async def run_fold(rolling, delta, end):
+    knowledge_text = rolling.kb.select(delta, KB_SUMMARY_TOKEN_BUDGET) if rolling.kb is not None else ""
+    try:
+        state = await fold_summary(get_async_clients(), rolling.state, delta, knowledge_text, rolling.contact_info)
+    except Exception as e:
+        rolling.fold_failed(e)
+        return
+    rolling.fold_done(state, end)
+
+
+fold_queue = SummaryQueue(run_fold, concurrency=ROLLING_SUMMARY_CONCURRENCY)
+
+
+class RollingSummary:
+    """
+    Running summary of one call's TurnLog. The log is appended on the job's
+    event loop; folds read a snapshot of its lines taken when they are queued.
+    """
+
+    def __init__(self, session_id, log, contact_info, kb=None, every_turns=ROLLING_SUMMARY_TURNS):
+        self.session_id = session_id
+        self.log = log
+        self.contact_info = contact_info
+        self.kb = kb
+        self.every_turns = every_turns
+        self.state = None
+        self.folded = 0
+        self.folds = 0
+        self._running = False
+        self._lock = threading.Lock()
+
+    def on_turn(self, speaker_is_agent):
+        """Call after each recorded turn."""
+        idle_scheduler.cancel(self.session_id)
+        if len(self.log) - self.folded >= self.every_turns:
+            self.fold()
+        elif speaker_is_agent:
+            idle_scheduler.schedule(self.session_id, ROLLING_SUMMARY_IDLE_SECONDS, self.on_idle)
+
+    def on_idle(self):
+        if len(self.log) - self.folded >= ROLLING_SUMMARY_IDLE_MIN_TURNS:
+            self.fold()
+
+    def fold(self):
+        with self._lock:
+            if self._running:
+                return
+            end = len(self.log)
+            if end <= self.folded:
+                return
+            self._running = True
+            start = self.folded
+        delta = "\n".join(f"{turn.speaker.label}: {turn.text}" for turn in self.log.turns[start:end])
+        if not fold_queue.submit(self, delta, end):
+            with self._lock:
+                self._running = False
+
+    def fold_done(self, state, end):
+        with self._lock:
+            self.state = state
+            self.folded = end
+            self.folds += 1
+            self._running = False
+
+    def fold_failed(self, error):
+        with self._lock:
+            self._running = False
+        logger.warning(f"⚠️ Rolling summary fold failed for {self.session_id}: {error}")
+
+    def close(self):
+        """Stop idle folds; returns (state, transcript lines not folded into it)."""
+        idle_scheduler.cancel(self.session_id)
+        with self._lock:
+            state, folded = self.state, self.folded
+        tail = "\n".join(f"{turn.speaker.label}: {turn.text}" for turn in self.log.turns[folded:])
+        return state, tail
@@ -6,7 +6,7 @@ from dotenv import load_dotenv
 load_dotenv() 
 from datetime import datetime, timezone
 import json
-import threading
+import time
 
 logging.getLogger('pymongo').setLevel(logging.WARNING)
 logging.getLogger('pymongo.topology').setLevel(logging.WARNING)
@@ -14,312 +14,568 @@ logging.getLogger('pymongo.connection').setLevel(logging.WARNING)
 logging.getLogger('pymongo.serverSelection').setLevel(logging.WARNING)
 
 from livekit import agents, rtc
-from livekit.agents import Agent, AgentSession, JobContext, WorkerOptions, cli, llm
+from livekit.agents import Agent, AgentSession, JobContext, JobExecutorType, WorkerOptions, cli, llm, room_io
 from livekit.plugins import openai
 
 from openai.types.beta.realtime.session import TurnDetection
 
-from summary_script import generate_summary
+from summary_script import summarize_stage, upload_stage, index_stage, contact_info_for, KB_SUMMARY_TOKEN_BUDGET, FALLBACK_CLIENTS
+from post_call_spool import PostCallPipeline, Stage
+from rolling_summary import RollingSummary, ROLLING_SUMMARY_ENABLED
+from record_codec import RecordCodec, compact_call_document, ANALYTICS_LAYOUT
+from agent_cache import AgentCache
+from firestore_io import analytics_writer, firestore_read
+from greeting_audio import greeting_audio, pcm_frames, GreetingAudioCache, GREETING_AUDIO_ENABLED
+from kb_index import KnowledgeBase
+from shared_cache import shared_cache
+from instructions import instruction_compiler
+import metrics
+from inactivity import scheduler as inactivity_scheduler
+from worker_load import LoadMonitor, WORKER_LOAD_THRESHOLD
+from transcript import Speaker, TurnLog, call_document
+from transcript_journal import journal_writer, orphaned_journals, read_journal, claim_journal
+from log_pipeline import setup_queue_logging, bind_log_context, log_utterance
+import clients
+from clients import get_firestore
 
-try:
-    import firebase_admin
-    from firebase_admin import credentials, firestore
-    FIRESTORE_AVAILABLE = True
-except:
-    FIRESTORE_AVAILABLE = False
 
-
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# LOG_FORMAT=json writes one JSON object per record, with session_id / agent_id as keys
+setup_queue_logging(json_format=os.getenv("LOG_FORMAT", "text") == "json")
 logger = logging.getLogger("streaming-voice-assistant")
 
-LANGUAGE_METADATA = {
-    "en": {"label": "English", "trigger": "Hello!", "code": "en-US"},
-    "es": {"label": "Spanish", "trigger": "Hola!", "code": "es-ES"},
-    "fr": {"label": "French", "trigger": "Bonjour!", "code": "fr-FR"},
-    "de": {"label": "German", "trigger": "Hallo!", "code": "de-DE"},
-    "hi": {"label": "Hindi", "trigger": "Namaste!", "code": "hi-IN"},
-    "pt": {"label": "Portuguese", "trigger": "Ola!", "code": "pt-PT"},
-    "zh": {"label": "Chinese", "trigger": "Ni hao!", "code": "zh-CN"},
-    "ja": {"label": "Japanese", "trigger": "Konnichiwa!", "code": "ja-JP"},
-    "ko": {"label": "Korean", "trigger": "Annyeonghaseyo!", "code": "ko-KR"},
-    "ar": {"label": "Arabic", "trigger": "Marhaban!", "code": "ar-SA"},
-    "ru": {"label": "Russian", "trigger": "Privet!", "code": "ru-RU"},
-    "it": {"label": "Italian", "trigger": "Ciao!", "code": "it-IT"},
-    "nl": {"label": "Dutch", "trigger": "Hallo!", "code": "nl-NL"},
-    "pl": {"label": "Polish", "trigger": "Czesc!", "code": "pl-PL"},
-    "tr": {"label": "Turkish", "trigger": "Merhaba!", "code": "tr-TR"},
-}
-
-def get_language_metadata(language_code):
-    key = (language_code or "en").lower().split('-')[0]
-    return LANGUAGE_METADATA.get(key, LANGUAGE_METADATA["en"])
-
-def load_knowledge_base():
-    knowledge = {}
-    data_dir = os.path.join(os.path.dirname(__file__), 'data')
-    
-    for file_name, key in [
-        ('base_knowledge.json', 'base'),
-        ('faqs.json', 'faqs'),
-        ('use_cases.json', 'use_cases')
-    ]:
-        try:
-            with open(os.path.join(data_dir, file_name), 'r', encoding='utf-8') as f:
-                knowledge[key] = json.load(f)
-        except Exception as e:
-            logger.debug(f"Could not load {file_name}: {e}")
-            knowledge[key] = {}
-    
-    return knowledge
-
-def build_system_instructions():
-    kb = load_knowledge_base()
-    
-    instructions = (
-        "You are a helpful, concise, and professional AI assistant. "
-        "Keep responses natural and brief (1-3 sentences)."
-    )
-    
-    if kb.get('base'):
-        base = kb['base']
-        about_text = base.get('description', '')
-        if about_text:
-            instructions += f"\n\nABOUT: {about_text}"
-    
-    return instructions
-
-SYSTEM_INSTRUCTIONS = build_system_instructions()
-
-def init_firestore():
-    if not FIRESTORE_AVAILABLE:
-        logger.warning("Firestore not available")
-        return None
-    
-    try:
-        if not firebase_admin._apps:
-            cred_path = os.getenv('GOOGLE_APPLICATION_CREDENTIALS')
-            if cred_path:
-                cred = credentials.Certificate(cred_path)
-                firebase_admin.initialize_app(cred)
-                logger.info("✅ Firestore initialized")
-            else:
-                fb_private_key = os.getenv('FIREBASE_PRIVATE_KEY')
-                if fb_private_key:
-                    if fb_private_key.startswith('"') and fb_private_key.endswith('"'):
-                        fb_private_key = fb_private_key[1:-1]
-                    fb_private_key = fb_private_key.replace('\\\\n', '\n')
-                    
-                    cred_dict = {
-                        'type': os.getenv('FIREBASE_TYPE', 'service_account'),
-                        'project_id': os.getenv('FIREBASE_PROJECT_ID'),
-                        'private_key_id': os.getenv('FIREBASE_PRIVATE_KEY_ID'),
-                        'private_key': fb_private_key,
-                        'client_email': os.getenv('FIREBASE_CLIENT_EMAIL'),
-                        'client_id': os.getenv('FIREBASE_CLIENT_ID'),
-                        'auth_uri': os.getenv('FIREBASE_AUTH_URI', 'https://accounts.google.com/o/oauth2/auth'),
-                        'token_uri': os.getenv('FIREBASE_TOKEN_URI', 'https://oauth2.googleapis.com/token'),
-                        'auth_provider_x509_cert_url': os.getenv('FIREBASE_AUTH_PROVIDER_X509_CERT_URL', 'https://www.googleapis.com/oauth2/v1/certs'),
-                        'client_x509_cert_url': os.getenv('FIREBASE_CLIENT_X509_CERT_URL')
-                    }
-                    cred = credentials.Certificate(cred_dict)
-                    firebase_admin.initialize_app(cred)
-                    logger.info("✅ Firestore initialized from env")
-        
-        return firestore.client()
-    except Exception as e:
-        logger.warning(f"Firestore error: {e}")
-        return None
-
-db_client = init_firestore()
 call_sessions = {}
-agent_config_cache = {}
-CACHE_TTL_SECONDS = 300
+persist_tasks = set()
+held_calls = {}  # call_id -> session_id while waiting for the participant to rejoin
+AGENT_CONFIG_TTL_SECONDS = int(os.getenv("AGENT_CONFIG_TTL_SECONDS", "300"))
+AGENT_CONFIG_STALE_SECONDS = int(os.getenv("AGENT_CONFIG_STALE_SECONDS", "3600"))
+AGENT_CONFIG_CACHE_MAX_ENTRIES = int(os.getenv("AGENT_CONFIG_CACHE_MAX_ENTRIES", "2000"))
+AGENT_CONFIG_CACHE_MAX_BYTES = int(os.getenv("AGENT_CONFIG_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+KB_CACHE_TTL_SECONDS = int(os.getenv("KB_CACHE_TTL_SECONDS", "600"))
+KB_CACHE_MAX_BYTES = int(os.getenv("KB_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# "process" runs each call in its own short-lived process; "thread" runs calls in the worker process
+AGENT_JOB_EXECUTOR = os.getenv("AGENT_JOB_EXECUTOR", "process").lower()
+# A snapshot listener costs a read to open and only pays off in a process that serves many calls
+CACHE_WATCHES_ENABLED = AGENT_JOB_EXECUTOR == "thread"
 
 INACTIVITY_REMINDER_SECONDS = int(os.getenv("INACTIVITY_REMINDER_SECONDS", "20"))
 INACTIVITY_END_CALL_SECONDS = int(os.getenv("INACTIVITY_END_CALL_SECONDS", "40"))
+SESSION_READY_TIMEOUT_SECONDS = float(os.getenv("SESSION_READY_TIMEOUT_SECONDS", "2"))
+# A pre-dispatched job holds a Realtime connection until someone joins; 0 waits forever
+PARTICIPANT_WAIT_TIMEOUT_SECONDS = float(os.getenv("PARTICIPANT_WAIT_TIMEOUT_SECONDS", "60"))
+JOURNAL_DRAIN_TIMEOUT_SECONDS = float(os.getenv("JOURNAL_DRAIN_TIMEOUT_SECONDS", "5"))
+# A dropped participant can rejoin the same call within this window; 0 ends the call on disconnect
+RESUME_GRACE_SECONDS = float(os.getenv("RESUME_GRACE_SECONDS", "30"))
+# Drops a client comes back from; a hangup, a kick or any other reason ends the call at once
+RESUMABLE_DISCONNECT_REASONS = {
+    rtc.DisconnectReason.UNKNOWN_REASON,
+    rtc.DisconnectReason.SIGNAL_CLOSE,
+    rtc.DisconnectReason.CONNECTION_TIMEOUT,
+    rtc.DisconnectReason.MEDIA_FAILURE,
+    rtc.DisconnectReason.STATE_MISMATCH,
+    rtc.DisconnectReason.MIGRATION,
+    rtc.DisconnectReason.SERVER_SHUTDOWN,
+    rtc.DisconnectReason.DUPLICATE_IDENTITY,
+}
+
+CONFIG_LOAD_SECONDS = metrics.Histogram("agent_config_load_seconds", "Firestore agent config read time")
+KB_LOAD_SECONDS = metrics.Histogram("agent_kb_load_seconds", "Firestore knowledge base read time")
+SESSION_START_SECONDS = metrics.Histogram("session_start_seconds", "AgentSession.start duration")
+GREETING_LATENCY_SECONDS = metrics.Histogram("greeting_latency_seconds", "Greeting request to first agent audio")
+RESUME_SECONDS = metrics.Histogram("participant_resume_seconds", "Participant rejoin to call resumed")
+TURN_RESPONSE_SECONDS = metrics.Histogram("turn_response_seconds", "User turn completed to agent turn completed")
+metrics.Gauge("active_call_sessions", "Calls currently tracked in call_sessions", lambda: len(call_sessions))
+# Post-call stages only run in the main process
+metrics.Gauge("pending_summary_jobs", "Post-call stage jobs queued or running", lambda: post_call.snapshot()["pending"],
+              multiprocess="exporter")
+metrics.Gauge("analytics_writer", "call_analytics batch writer counters",
+              lambda: [({"stat": stat}, value) for stat, value in analytics_writer.snapshot().items()],
+              multiprocess="exporter")
+metrics.Gauge("held_calls", "Calls waiting for a dropped participant to rejoin", lambda: len(held_calls))
+metrics.Gauge("inactivity_timers", "Sessions with a pending inactivity deadline", lambda: len(inactivity_scheduler))
+metrics.Gauge("summary_queue_wait_seconds_avg", "Average time post-call stage jobs wait for a worker",
+              lambda: post_call.snapshot()["wait_seconds_avg"], multiprocess="exporter")
+metrics.Gauge("post_call_spool", "Spooled post-call jobs by stage (dead = dead-letter)",
+              lambda: [({"stage": stage}, count) for stage, count in post_call.spool.counts().items()],
+              multiprocess="exporter")
 
 class StreamingVoiceAssistant(Agent):
     def __init__(self, instructions: str, session_id: str):
         super().__init__(instructions=instructions)
         self.session_id = session_id
-        self.last_user_activity = datetime.now(timezone.utc)
         self.reminder_sent = False
-        self.inactivity_task = None
+        self.inactivity_armed = False
+        self.inactivity_action = None
+        self.journal_path = None
         self.session_ref = None
         self.is_active = True
+        self.user_turn_at = None
+        self.rolling_summary = None
+        self.held_since = None  # UTC time of the drop while the call is held for a rejoin
     
     async def on_user_turn_completed(self, chat_ctx, new_message):
-        self.last_user_activity = datetime.now(timezone.utc)
-        self.reminder_sent = False
+        if self.inactivity_armed and self.is_active:
+            self.arm_inactivity_timer()
+        self.user_turn_at = time.perf_counter()
         
         if new_message.text_content and self.session_id in call_sessions:
-            logger.info(f"👤 User: {new_message.text_content}")
-            call_sessions[self.session_id]["user_transcripts"].append({
-                "text": new_message.text_content,
-                "timestamp_utc": datetime.now(timezone.utc).isoformat(),
-                "source": "user"
-            })
-            call_sessions[self.session_id]["total_user_messages"] += 1
+            log_utterance(logger, Speaker.USER.label, new_message.text_content, icon="👤")
+            self.record_turn(Speaker.USER, new_message.text_content)
     
     async def on_agent_turn_completed(self, chat_ctx, new_message):
+        if self.user_turn_at is not None:
+            TURN_RESPONSE_SECONDS.observe(time.perf_counter() - self.user_turn_at)
+            self.user_turn_at = None
+        
         if new_message.text_content and self.session_id in call_sessions:
-            logger.info(f"🤖 Agent: {new_message.text_content}")
-            call_sessions[self.session_id]["agent_transcripts"].append({
-                "text": new_message.text_content,
-                "timestamp_utc": datetime.now(timezone.utc).isoformat(),
-                "source": "agent"
-            })
-            call_sessions[self.session_id]["total_agent_responses"] += 1
+            log_utterance(logger, Speaker.AGENT.label, new_message.text_content, icon="🤖")
+            self.record_turn(Speaker.AGENT, new_message.text_content)
+    
+    def record_turn(self, speaker, text):
+        log = call_sessions[self.session_id]["turns"]
+        turn = log.append(speaker, text)
+        journal_writer.append(self.journal_path, {"type": "turn", **log.record(turn)})
+        if self.rolling_summary:
+            self.rolling_summary.on_turn(speaker is Speaker.AGENT)
+    
+    def arm_inactivity_timer(self):
+        # Reminder fires first; the end-call deadline is scheduled once it has gone out
+        self.inactivity_armed = True
+        self.reminder_sent = False
+        inactivity_scheduler.schedule(self.session_id, INACTIVITY_REMINDER_SECONDS, self.on_inactivity_deadline)
+    
+    def on_inactivity_deadline(self):
+        if self.session_id not in call_sessions or not self.is_active:
+            return
+        
+        if not self.reminder_sent:
+            logger.info(f"⏰ Inactivity reminder")
+            self.reminder_sent = True
+            inactivity_scheduler.schedule(
+                self.session_id,
+                INACTIVITY_END_CALL_SECONDS - INACTIVITY_REMINDER_SECONDS,
+                self.on_inactivity_deadline,
+            )
+            if self.session_ref:
+                self.inactivity_action = asyncio.create_task(self.send_inactivity_reminder())
+        else:
+            logger.info(f"⏰ Disconnecting")
+            self.inactivity_action = asyncio.create_task(self.finalize_call())
     
-    async def check_inactivity(self):
+    async def send_inactivity_reminder(self):
         try:
-            while self.is_active:
-                await asyncio.sleep(1)
-                
-                if self.session_id not in call_sessions or not self.is_active:
-                    break
-                
-                elapsed = (datetime.now(timezone.utc) - self.last_user_activity).total_seconds()
-                
-                if elapsed > INACTIVITY_REMINDER_SECONDS and not self.reminder_sent and self.session_ref and self.is_active:
-                    logger.info(f"⏰ Inactivity reminder")
-                    self.reminder_sent = True
-                    try:
-                        await self.session_ref.generate_reply(
-                            instructions="Ask if the user is still there (one short sentence)."
-                        )
-                    except:
-                        pass
-                
-                if elapsed > INACTIVITY_END_CALL_SECONDS and self.is_active:
-                    logger.info(f"⏰ Disconnecting")
-                    await self.finalize_call()
-                    break
-                    
-        except asyncio.CancelledError:
+            await self.session_ref.generate_reply(
+                instructions="Ask if the user is still there (one short sentence)."
+            )
+        except:
             pass
-        except Exception as e:
-            logger.error(f"Inactivity error: {e}")
     
     async def finalize_call(self):
         self.is_active = False
+        inactivity_scheduler.cancel(self.session_id)
         
         if self.session_id not in call_sessions:
             return
         
-        session_data = call_sessions[self.session_id]
-        session_data["end_time_utc"] = datetime.now(timezone.utc).isoformat()
+        session_data = call_sessions.pop(self.session_id)
+        # A call whose participant never came back ended when they dropped, not when the hold expired
+        session_data["end_time_utc"] = (self.held_since or datetime.now(timezone.utc)).isoformat()
+        set_call_duration(session_data)
         
-        try:
-            start = datetime.fromisoformat(session_data["start_time_utc"])
-            end = datetime.fromisoformat(session_data["end_time_utc"])
-            session_data["duration_seconds"] = (end - start).total_seconds()
-        except:
-            pass
-        
-        async def firestore_write(data):
-            if db_client:
-                try:
-                    await asyncio.to_thread(
-                        lambda: db_client.collection('call_analytics').document(self.session_id).set(data)
-                    )
-                    logger.info(f"✅ Analytics saved")
-                except Exception as e:
-                    logger.error(f"Analytics error: {e}")
-        
-        asyncio.create_task(firestore_write(session_data))
-        
-        agent_id = session_data.get("agent_id")
-        call_id = session_data.get("call_id")
-        
-        if agent_id and call_id and db_client:
-            full_transcript = []
-            for ut in session_data.get("user_transcripts", []):
-                full_transcript.append(f"User: {ut['text']}")
-            for at in session_data.get("agent_transcripts", []):
-                full_transcript.append(f"Agent: {at['text']}")
-            
-            transcript_text = "\n".join(full_transcript)
-            
-            if transcript_text.strip():
-                threading.Thread(
-                    target=generate_summary,
-                    args=(agent_id, call_id, transcript_text, session_data.get('client_info', {}), db_client),
-                    daemon=True
-                ).start()
-                logger.info(f"🔄 Summary started")
-        
-        call_sessions.pop(self.session_id, None)
+        task = asyncio.create_task(persist_call(session_data, self.journal_path, self.rolling_summary))
+        persist_tasks.add(task)
+        task.add_done_callback(persist_tasks.discard)
+
+def set_call_duration(session_data):
+    try:
+        start = datetime.fromisoformat(session_data["start_time_utc"])
+        end = datetime.fromisoformat(session_data["end_time_utc"])
+        session_data["duration_seconds"] = (end - start).total_seconds()
+    except:
+        pass
+
+analytics_codec = RecordCodec()
+
+def analytics_document(document):
+    return compact_call_document(document, analytics_codec) if ANALYTICS_LAYOUT == "v2" else document
+
+async def write_analytics(payloads):
+    async def write(payload):
+        # Coalesced with other calls' documents into one batch commit
+        await analytics_writer.awrite(payload["session_id"], analytics_document(payload["analytics"]))
+        logger.info(f"✅ Analytics saved")
+        return {key: value for key, value in payload.items() if key != "analytics"}
+    
+    return await asyncio.gather(*(write(payload) for payload in payloads), return_exceptions=True)
+
+def wants_summary(payload):
+    return bool(not clients.firestore.is_disabled() and payload.get("agent_id") and payload.get("call_id") and payload["transcript"].strip())
+
+# Finalized calls are spooled to disk, then analytics -> summarize -> upload -> index.
+# Stages run in the worker's main process (post_call.start()); job processes only spool.
+# Stages are skipped only when a service isn't set up at all; while a configured client
+# is failing, its stage raises and the job is retried from the spool.
+post_call = PostCallPipeline([
+    Stage("analytics", write_analytics, when=lambda payload: not clients.firestore.is_disabled()),
+    Stage("summarize", lambda payloads: summarize_stage(payloads, get_firestore()), when=wants_summary),
+    Stage("upload", upload_stage, when=lambda payload: "summary" in payload),
+    Stage("index", index_stage, when=lambda payload: "summary_url" in payload),
+])
+
+async def persist_call(session_data, journal_path=None, rolling_summary=None):
+    """Spool the finished call for the post-call pipeline; the journal is dropped once it is on disk."""
+    session_id = session_data["session_id"]
+    agent_id = session_data.get("agent_id")
+    transcript_text = session_data["turns"].transcript_text()
+    
+    # Summarized during the call: only the turns after the last fold are left
+    summary_state, transcript_delta = rolling_summary.close() if rolling_summary else (None, None)
+    kb_query = transcript_delta if summary_state else transcript_text
+    
+    # Reuse the KB this call already loaded; None makes the summarize stage fetch it
+    kb = kb_cache.peek(agent_id) if agent_id else None
+    payload = {
+        "session_id": session_id,
+        "agent_id": agent_id,
+        "call_id": session_data.get("call_id"),
+        "start_time_utc": session_data.get("start_time_utc"),
+        "analytics": call_document(session_data),
+        "transcript": transcript_text,
+        "contact_info": contact_info_for(session_data.get("client_info", {})),
+        "knowledge_text": kb.select(kb_query, KB_SUMMARY_TOKEN_BUDGET) if kb is not None and kb_query.strip() else None,
+    }
+    if summary_state:
+        payload["summary_state"] = summary_state
+        payload["transcript_delta"] = transcript_delta
+    
+    try:
+        job_id = await asyncio.to_thread(post_call.enqueue, session_id, payload)
+    except Exception as e:
+        # The journal stays, so the next start recovers this call
+        logger.error(f"Post-call spool error: {e}")
+        return
+    
+    if job_id:
+        logger.info(f"🔄 Post-call job {job_id} spooled")
+    journal_writer.discard(journal_path)
+
+async def recover_transcripts():
+    """Persist calls whose worker process died before finalize_call ran."""
+    for path in orphaned_journals():
+        # Renaming under our instance id claims the journal; if we die too it is orphaned again
+        claimed = claim_journal(path)
+        if claimed is None:
+            continue
+        
+        session_data = read_journal(claimed)
+        if not session_data:
+            os.remove(claimed)
+            continue
+        
+        session_data["recovered"] = True
+        set_call_duration(session_data)
+        logger.info(f"♻️ Recovering transcript for {session_data['session_id']}")
+        await persist_call(session_data, claimed)
+
+async def fetch_agent_config(agent_id):
+    # In multi-process mode a sibling worker may already have read it
+    config = await shared_cache.get(f"config:{agent_id}")
+    if config is not None:
+        return config
+    
+    started = time.perf_counter()
+    doc = await firestore_read(lambda: get_firestore().collection('agents').document(agent_id).get())
+    CONFIG_LOAD_SECONDS.observe(time.perf_counter() - started)
+    if not doc.exists:
+        return None
+    logger.info(f"✅ Agent config loaded")
+    config = doc.to_dict()
+    await shared_cache.set(f"config:{agent_id}", config, AGENT_CONFIG_TTL_SECONDS)
+    return config
+
+agent_config_cache = AgentCache(
+    "Agent config",
+    fetch_agent_config,
+    ttl_seconds=AGENT_CONFIG_TTL_SECONDS,
+    stale_seconds=AGENT_CONFIG_STALE_SECONDS,
+    max_entries=AGENT_CONFIG_CACHE_MAX_ENTRIES,
+    max_bytes=AGENT_CONFIG_CACHE_MAX_BYTES,
+    sizeof=lambda config: len(json.dumps(config, default=str)),
+    watch_ref=(lambda agent_id: get_firestore().collection('agents').document(agent_id)) if CACHE_WATCHES_ENABLED else None,
+)
 
 async def load_agent_config_async(agent_id):
-    if not agent_id or not db_client:
+    if not agent_id or await clients.firestore.aget() is None:
         return None
     
-    cache_key = f"agent_{agent_id}"
-    if cache_key in agent_config_cache:
-        cached_data, cached_time = agent_config_cache[cache_key]
-        if (datetime.now(timezone.utc) - cached_time).total_seconds() < CACHE_TTL_SECONDS:
-            logger.info(f"✅ Agent config from cache")
-            return cached_data
-    
     try:
-        doc = await asyncio.to_thread(
-            lambda: db_client.collection('agents').document(agent_id).get()
-        )
-        if doc.exists:
-            config = doc.to_dict()
-            agent_config_cache[cache_key] = (config, datetime.now(timezone.utc))
-            logger.info(f"✅ Agent config loaded")
-            return config
+        return await agent_config_cache.get(agent_id)
     except Exception as e:
         logger.error(f"Agent load error: {e}")
     
     return None
 
+def knowledge_base_ref(agent_id):
+    # The agent's own subcollection: loads and listeners only ever touch that agent's documents
+    return get_firestore().collection('agents').document(agent_id).collection('knowledge_base')
+
+async def fetch_knowledge_base(agent_id):
+    contents = await shared_cache.get(f"kb:{agent_id}")
+    if contents is None:
+        started = time.perf_counter()
+        kb_ref = knowledge_base_ref(agent_id)
+        docs = await firestore_read(lambda: list(kb_ref.stream()))
+        KB_LOAD_SECONDS.observe(time.perf_counter() - started)
+        contents = [doc.to_dict().get('content', '') for doc in docs]
+        await shared_cache.set(f"kb:{agent_id}", contents, KB_CACHE_TTL_SECONDS)
+    # Chunking and indexing is CPU work; keep it off the event loop
+    kb = await asyncio.to_thread(KnowledgeBase, contents)
+    logger.info(f"✅ KB loaded ({len(contents)} items, {len(kb.chunks)} chunks, ~{kb.total_tokens} tokens)")
+    return kb
+
+kb_cache = AgentCache(
+    "KB",
+    fetch_knowledge_base,
+    ttl_seconds=KB_CACHE_TTL_SECONDS,
+    max_bytes=KB_CACHE_MAX_BYTES,
+    sizeof=lambda kb: kb.size_bytes,
+    watch_ref=knowledge_base_ref if CACHE_WATCHES_ENABLED else None,
+)
+
+load_monitor = LoadMonitor(
+    sessions_fn=lambda: len(call_sessions),
+    # Stages run in the main process, so this is the whole worker's post-call work
+    pending_summaries_fn=lambda: post_call.backlog(),
+    # Job processes publish their loops' lag through the metrics directory
+    remote_lag_fn=lambda: [value for _, value in metrics.process_values("event_loop_lag_seconds")],
+)
+
+metrics.Gauge("event_loop_lag_seconds", "Worst smoothed event-loop lag of this process's jobs",
+              load_monitor.loop_lag, multiprocess="max")
+
+def prewarm_clients(targets):
+    # Built in parallel, so startup waits for the slowest one, not the sum
+    timings = clients.prewarm(targets)
+    logger.info(f"🔥 Clients ready: {', '.join(f'{name} {seconds * 1000:.0f}ms' for name, seconds in timings.items())}")
+
+def prewarm_process(proc):
+    # Runs before the first job of each job process/thread. Calls only read agent config and
+    # KB from Firestore; the sync OpenAI client renders cached greetings. Post-call clients
+    # belong to the main process (see __main__).
+    # Job processes publish their metrics to the main process's exporter
+    metrics.start_writer()
+    prewarm_clients((clients.firestore, clients.openai) if GREETING_AUDIO_ENABLED else (clients.firestore,))
+
+def compute_worker_load(worker):
+    # Runs on a LiveKit executor thread of the main process. Job loops register their lag probes
+    # in entrypoint; with job processes their lag arrives through the metrics exporter (one flush
+    # behind) and active jobs stand in for call_sessions.
+    return load_monitor.compute(active_jobs=len(worker.active_jobs))
+
+metrics.Gauge(
+    "worker_load", "Load components reported to LiveKit dispatch (1.0 = at budget)",
+    lambda: [({"component": name}, value) for name, value in load_monitor.last.items()],
+    multiprocess="exporter",
+)
+
+def cache_stats():
+    samples = []
+    for cache in (agent_config_cache, kb_cache):
+        for event, value in cache.snapshot().items():
+            samples.append(({"cache": cache.name, "stat": event}, value))
+    return samples
+
+metrics.Gauge("agent_cache", "Agent config / KB cache counters and sizes", cache_stats)
+metrics.Gauge(
+    "greeting_audio_cache", "Pre-rendered greeting hits, misses and renders",
+    lambda: [({"stat": stat}, value) for stat, value in greeting_audio.snapshot().items()],
+)
+metrics.Gauge(
+    "prompt_tokens", "Estimated token count of compiled session instructions",
+    lambda: [({"agent_id": p.agent_id, "language": p.language}, p.token_count) for p in instruction_compiler.artifacts()],
+    multiprocess="max",
+)
+metrics.Gauge(
+    "instruction_cache", "Instruction compiler counters",
+    lambda: [({"stat": stat}, value) for stat, value in instruction_compiler.stats.items()],
+)
+
+def compile_prompt(agent_id, agent_config, kb, language):
+    """Session instructions, memoized while the config and KB are the ones the caches hold."""
+    config_version = agent_config_cache.version_of(agent_id, agent_config)
+    kb_version = kb_cache.version_of(agent_id, kb)
+    version = None if config_version is None or kb_version is None else (config_version, kb_version)
+    return instruction_compiler.compile(agent_id, agent_config, kb, language, version=version)
+
 async def load_knowledge_base_async(agent_id):
-    if not agent_id or not db_client:
-        return ""
+    if not agent_id or await clients.firestore.aget() is None:
+        return None
     
     try:
-        kb_ref = db_client.collection('agents').document(agent_id).collection('knowledge_base')
-        docs = await asyncio.to_thread(lambda: list(kb_ref.stream()))
-        
-        if docs:
-            knowledge_items = [doc.to_dict() for doc in docs]
-            knowledge_text = " ".join([item.get('content', '') for item in knowledge_items])
-            logger.info(f"✅ KB loaded ({len(knowledge_items)} items)")
-            return f"\n\nKNOWLEDGE:\n{knowledge_text}"
+        return await kb_cache.get(agent_id)
     except Exception as e:
         logger.debug(f"KB load error: {e}")
     
-    return ""
+    return None
+
+class StartupTimings:
+    """Milliseconds from job start to each startup stage."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+
+    def mark(self, stage):
+        if stage not in self.stages:
+            self.stages[stage] = round((time.perf_counter() - self.started) * 1000, 1)
+
+def parse_metadata(raw):
+    try:
+        if raw:
+            return json.loads(raw)
+    except:
+        pass
+    return {}
+
+def prefetch_agent(agent_id):
+    # Parallel loading
+    return asyncio.ensure_future(asyncio.gather(
+        load_agent_config_async(agent_id),
+        load_knowledge_base_async(agent_id),
+    ))
+
+def create_realtime_session(voice):
+    # ✅ FIX: Create NEW session with fresh RealtimeModel (critical for mobile)
+    return AgentSession(
+        llm=openai.realtime.RealtimeModel(
+            voice=voice,
+            temperature=0.7,
+            modalities=["text", "audio"],
+            turn_detection=TurnDetection(
+                type="server_vad",
+                threshold=0.5,
+                prefix_padding_ms=300,
+                silence_duration_ms=500,
+                create_response=True,
+            ),
+        ),
+    )
+
+def session_start_options():
+    # Held calls keep the Realtime session open while the participant is gone
+    return {"room_options": room_io.RoomOptions(close_on_disconnect=False)} if RESUME_GRACE_SECONDS > 0 else {}
 
 async def entrypoint(ctx: JobContext):
     session = None  # Track session for cleanup
     assistant = None  # Track assistant for cleanup
+    timings = StartupTimings()
+    session_id = ctx.room.name
+    log_context = bind_log_context(session_id=session_id)
     
     try:
         logger.info(f"🎙️ Room: {ctx.room.name}")
+        load_monitor.watch_current_loop()
+        
+        # Dispatch or room metadata can name the agent before anyone joins,
+        # so config/KB loading overlaps the connect and the participant wait.
+        # The token server creates the room with this metadata (prefetch hint),
+        # and the job carries a copy of the room, so no connect is needed to read it.
+        hint = parse_metadata(ctx.job.metadata) or parse_metadata(ctx.job.room.metadata)
+        prefetch = prefetch_agent(hint["agent_id"]) if hint.get("agent_id") else None
         
         await ctx.connect()
+        timings.mark("connected")
         logger.info("✅ Connected")
         
-        participant = await ctx.wait_for_participant()
-        logger.info(f"👤 Participant: {participant.identity}")
+        if prefetch is None:
+            hint = parse_metadata(ctx.room.metadata)
+            prefetch = prefetch_agent(hint["agent_id"]) if hint.get("agent_id") else None
+        
+        participant_task = asyncio.create_task(ctx.wait_for_participant())
+        session_ready = asyncio.Event()
+        session_closed = False
+        
+        def watch_session(watched):
+            @watched.on("conversation_item_added")
+            def on_conversation_item_added(ev):
+                # Agent has no framework hook for finished agent turns; route them here
+                if getattr(ev.item, "role", None) == "assistant":
+                    asyncio.ensure_future(assistant.on_agent_turn_completed(None, ev.item))
+            
+            @watched.on("agent_state_changed")
+            def on_agent_state_changed(ev):
+                if ev.new_state != "initializing":
+                    session_ready.set()
+                if ev.new_state == "speaking" and "first_audio" not in timings.stages:
+                    timings.mark("first_audio")
+                    if "greeting_requested" in timings.stages:
+                        GREETING_LATENCY_SECONDS.observe(
+                            (timings.stages["first_audio"] - timings.stages["greeting_requested"]) / 1000
+                        )
+                    logger.info(f"⏱️ Startup timings (ms): {timings.stages}")
+                    if session_id in call_sessions:
+                        call_sessions[session_id]["startup_timings_ms"] = dict(timings.stages)
+            
+            @watched.on("close")
+            def on_close(ev):
+                nonlocal session_closed
+                if watched is session:
+                    session_closed = True
+        
+        def start_session(agent_id, agent_config, kb, language):
+            nonlocal session, assistant
+            prompt = compile_prompt(agent_id, agent_config, kb, language)
+            instructions_text, voice = prompt.text, prompt.voice
+            logger.info(f"📝 Instructions ~{prompt.token_count} tokens")
+            
+            logger.info("🔧 Initializing OpenAI Realtime API...")
+            
+            # ✅ FIX: Create fresh assistant instance
+            assistant = StreamingVoiceAssistant(
+                instructions=instructions_text, 
+                session_id=session_id
+            )
+            session = create_realtime_session(voice)
+            assistant.session_ref = session
+            watch_session(session)
+            
+            async def run_start():
+                started = time.perf_counter()
+                await session.start(room=ctx.room, agent=assistant, **session_start_options())
+                SESSION_START_SECONDS.observe(time.perf_counter() - started)
+            
+            return asyncio.ensure_future(run_start())
+        
+        # With a prefetch hint the Realtime connection opens while we wait for the participant
+        session_start = None
+        if prefetch:
+            agent_config, kb = await prefetch
+            timings.mark("config_loaded")
+            session_start = start_session(hint["agent_id"], agent_config, kb, hint.get("language", "en"))
         
-        metadata = {}
         try:
-            if participant.metadata:
-                metadata = json.loads(participant.metadata)
-        except:
-            pass
+            participant = await asyncio.wait_for(participant_task, PARTICIPANT_WAIT_TIMEOUT_SECONDS or None)
+        except asyncio.TimeoutError:
+            logger.warning(f"⌛ Nobody joined {session_id} within {PARTICIPANT_WAIT_TIMEOUT_SECONDS:.0f}s, ending job")
+            if session_start:
+                session_start.cancel()
+            if session:
+                try:
+                    await session.aclose()
+                except Exception:
+                    pass
+            if assistant:
+                assistant.is_active = False
+            ctx.shutdown("participant wait timeout")
+            return
+        timings.mark("participant_joined")
+        logger.info(f"👤 Participant: {participant.identity}")
+        
+        metadata = parse_metadata(participant.metadata)
         
         language = metadata.get("language", "en")
         agent_id = metadata.get("agent_id")
         call_id = metadata.get("call_id") or ctx.room.name
+        log_context.update(agent_id=agent_id, call_id=call_id)
         
         logger.info(f"Lang: {language}, Agent: {agent_id}")
         
@@ -329,30 +585,29 @@ async def entrypoint(ctx: JobContext):
             "user_agent": metadata.get("user_agent", ""),
         }
         
-        # Parallel loading
-        config_task = asyncio.create_task(load_agent_config_async(agent_id))
-        kb_task = asyncio.create_task(load_knowledge_base_async(agent_id))
-        
-        agent_config, kb_text = await asyncio.gather(config_task, kb_task)
-        
-        instructions_text = SYSTEM_INSTRUCTIONS
-        voice = "sage"
-        
-        if agent_config:
-            voice = agent_config.get('voice', voice)
-            if agent_config.get('custom_instructions'):
-                instructions_text = agent_config['custom_instructions']
-            
-            instructions_text += kb_text
-            
-            gender = agent_config.get('gender', '').lower()
-            if gender in ['male', 'female', 'neutral']:
-                instructions_text += f"\n\nYou are a {gender} AI agent."
+        if session_start and agent_id != hint.get("agent_id"):
+            logger.warning("⚠️ Prefetched agent does not match participant, rebuilding session")
+            session_start.cancel()
+            await session.aclose()
+            session_start = None
+        
+        if session_start is None:
+            agent_config, kb = await prefetch_agent(agent_id)
+            timings.mark("config_loaded")
+            session_start = start_session(agent_id, agent_config, kb, language)
+        elif language != hint.get("language", "en"):
+            prompt = compile_prompt(agent_id, agent_config, kb, language)
+            await assistant.update_instructions(prompt.text)
+        
+        # Disk-tier reads overlap the rest of session startup
+        greeting = agent_config.get('greeting_message') if agent_config else None
+        greeting_lookup = None
+        if greeting and GREETING_AUDIO_ENABLED:
+            voice = compile_prompt(agent_id, agent_config, kb, language).voice
+            greeting_lookup = asyncio.ensure_future(
+                greeting_audio.lookup(GreetingAudioCache.key(agent_id, greeting, voice, language))
+            )
         
-        lang_meta = get_language_metadata(language)
-        instructions_text += f"\n\nRespond in {lang_meta['label']}."
-        
-        session_id = ctx.room.name
         call_sessions[session_id] = {
             "session_id": session_id,
             "room_name": ctx.room.name,
@@ -361,48 +616,21 @@ async def entrypoint(ctx: JobContext):
             "start_time_utc": datetime.now(timezone.utc).isoformat(),
             "language": language,
             "client_info": client_info,
-            "user_transcripts": [],
-            "agent_transcripts": [],
-            "total_user_messages": 0,
-            "total_agent_responses": 0,
         }
-        
-        logger.info("🔧 Initializing OpenAI Realtime API...")
-        
-        # ✅ FIX: Create fresh assistant instance
-        assistant = StreamingVoiceAssistant(
-            instructions=instructions_text, 
-            session_id=session_id
-        )
-        
-        # ✅ FIX: Create NEW session with fresh RealtimeModel (critical for mobile)
-        session = AgentSession(
-            llm=openai.realtime.RealtimeModel(
-                voice=voice,
-                temperature=0.7,
-                modalities=["text", "audio"],
-                turn_detection=TurnDetection(
-                    type="server_vad",
-                    threshold=0.5,
-                    prefix_padding_ms=300,
-                    silence_duration_ms=500,
-                    create_response=True,
-                ),
-            ),
-        )
-        
-        assistant.session_ref = session
+        assistant.journal_path = journal_writer.open(session_id, call_sessions[session_id])
+        call_sessions[session_id]["turns"] = TurnLog()
+        if ROLLING_SUMMARY_ENABLED:
+            assistant.rolling_summary = RollingSummary(
+                session_id, call_sessions[session_id]["turns"], contact_info_for(client_info), kb
+            )
         
         # ✅ FIX: Add explicit session cleanup on disconnect
         async def cleanup_session():
             logger.info("🧹 Cleaning up OpenAI session...")
             assistant.is_active = False
-            if assistant.inactivity_task:
-                assistant.inactivity_task.cancel()
-                try:
-                    await assistant.inactivity_task
-                except:
-                    pass
+            inactivity_scheduler.cancel(session_id)
+            inactivity_scheduler.cancel(f"resume:{session_id}")
+            held_calls.pop(call_id, None)
             
             # ✅ CRITICAL: Properly close the OpenAI session
             if session:
@@ -414,23 +642,127 @@ async def entrypoint(ctx: JobContext):
             
             await assistant.finalize_call()
         
-        ctx.add_shutdown_callback(cleanup_session)
+        async def drain_summaries():
+            # Jobs may run on separate loops; each waits for its own persist task
+            loop = asyncio.get_running_loop()
+            own_tasks = [task for task in persist_tasks if task.get_loop() is loop]
+            if own_tasks:
+                await asyncio.gather(*own_tasks, return_exceptions=True)
+            # Last call out waits for queued summaries so uploads aren't cut off
+            # (thread executor; job processes only spool, and the main process keeps running them)
+            if not call_sessions and post_call.runs_here():
+                await post_call.drain()
+                await asyncio.to_thread(journal_writer.flush, JOURNAL_DRAIN_TIMEOUT_SECONDS)
         
-        # Start session
-        await session.start(room=ctx.room, agent=assistant)
+        ctx.add_shutdown_callback(cleanup_session)
+        ctx.add_shutdown_callback(drain_summaries)
+        
+        # A participant that drops (mobile network change, app switch) can rejoin
+        # with a new token for the same call_id: the call is held for
+        # RESUME_GRACE_SECONDS with its transcript, instructions and Realtime
+        # session intact, and the newcomer is linked to it without a greeting.
+        linked_identity = participant.identity
+        left_at = None
+        resume_tasks = set()
+        
+        def on_participant_disconnected(left):
+            nonlocal left_at
+            if left.identity != linked_identity or not assistant.is_active:
+                return
+            reason = left.disconnect_reason
+            if reason in (rtc.DisconnectReason.ROOM_DELETED, rtc.DisconnectReason.ROOM_CLOSED):
+                return
+            if reason is not None and reason not in RESUMABLE_DISCONNECT_REASONS:
+                logger.info(f"📴 Participant left ({rtc.DisconnectReason.Name(reason)}), ending call {call_id}")
+                ctx.shutdown("participant left")
+                return
+            left_at = time.perf_counter()
+            assistant.held_since = datetime.now(timezone.utc)
+            held_calls[call_id] = session_id
+            inactivity_scheduler.cancel(session_id)
+            inactivity_scheduler.schedule(f"resume:{session_id}", RESUME_GRACE_SECONDS, end_held_call)
+            logger.info(f"📴 Participant left, holding call {call_id} for {RESUME_GRACE_SECONDS:.0f}s")
+        
+        def end_held_call():
+            held_calls.pop(call_id, None)
+            logger.info(f"⌛ Participant did not return, ending call {call_id}")
+            ctx.shutdown("participant did not return")
+        
+        def on_participant_connected(joined):
+            if left_at is None or not assistant.is_active:
+                return
+            if (parse_metadata(joined.metadata).get("call_id") or ctx.room.name) != call_id:
+                return
+            inactivity_scheduler.cancel(f"resume:{session_id}")
+            held_calls.pop(call_id, None)
+            task = asyncio.create_task(resume_call(joined))
+            resume_tasks.add(task)
+            task.add_done_callback(resume_tasks.discard)
+        
+        async def resume_call(joined):
+            nonlocal session, session_closed, linked_identity, left_at
+            rejoined_at = time.perf_counter()
+            offline = rejoined_at - left_at
+            linked_identity, left_at = joined.identity, None
+            assistant.held_since = None
+            try:
+                if session_closed:
+                    # Only the Realtime connection is rebuilt; config, KB and instructions are cached
+                    prompt = compile_prompt(agent_id, agent_config, kb, language)
+                    session = create_realtime_session(prompt.voice)
+                    session_closed = False
+                    assistant.session_ref = session
+                    watch_session(session)
+                    await session.start(room=ctx.room, agent=assistant, **session_start_options())
+                else:
+                    session.room_io.set_participant(joined.identity)
+            except Exception as e:
+                logger.error(f"❌ Resume failed: {e}", exc_info=True)
+                ctx.shutdown("resume failed")
+                return
+            resumed = time.perf_counter() - rejoined_at
+            RESUME_SECONDS.observe(resumed)
+            if session_id in call_sessions:
+                call_sessions[session_id]["reconnects"] = call_sessions[session_id].get("reconnects", 0) + 1
+            assistant.arm_inactivity_timer()
+            logger.info(f"🔁 Call {call_id} resumed after {offline:.1f}s offline ({resumed * 1000:.0f}ms to relink)")
+        
+        if RESUME_GRACE_SECONDS > 0:
+            ctx.room.on("participant_disconnected", on_participant_disconnected)
+            ctx.room.on("participant_connected", on_participant_connected)
+        
+        await session_start
+        timings.mark("session_started")
         
         logger.info("✅ Realtime API Initialized")
         
-        await asyncio.sleep(0.3)
+        # Wait for the agent to leave "initializing" instead of a fixed sleep
+        try:
+            await asyncio.wait_for(session_ready.wait(), SESSION_READY_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            logger.warning("⚠️ Session readiness timed out, greeting anyway")
+        timings.mark("session_ready")
         
         # Generate greeting
-        if agent_config and agent_config.get('greeting_message'):
-            greeting = agent_config.get('greeting_message')
+        timings.mark("greeting_requested")
+        greeting_pcm = await greeting_lookup if greeting_lookup else None
+        if greeting_pcm:
+            # Cached render goes straight to the agent's audio track, no model round trip
+            await session.say(greeting, audio=pcm_frames(greeting_pcm))
+            # say(audio=...) only adds the greeting to the local chat context; push it to the
+            # Realtime conversation so the model doesn't greet again on the first user turn
+            try:
+                await assistant.update_chat_ctx(assistant.chat_ctx)
+            except Exception as e:
+                logger.warning(f"⚠️ Greeting not synced to the Realtime conversation: {e}")
+        elif greeting:
             await session.generate_reply(instructions=f"Say: {greeting}")
         else:
             await session.generate_reply(instructions="Give a warm, brief greeting.")
+        timings.mark("greeting_done")
         
-        assistant.inactivity_task = asyncio.create_task(assistant.check_inactivity())
+        if left_at is None:
+            assistant.arm_inactivity_timer()
         
         logger.info("🎉 Ready - REALTIME API ENABLED!")
         
@@ -462,9 +794,27 @@ if __name__ == "__main__":
     print(f"API Key: {os.getenv('LIVEKIT_API_KEY', 'NOT SET')[:20]}...")
     print("=" * 60)
     
+    if sys.argv[1] in ("start", "dev"):
+        # One exporter per worker; job processes started from here publish to it
+        metrics.start_http_server()
+        # Post-call stages and their retries run here, for jobs spooled by every job process
+        prewarm_clients((clients.firestore, *FALLBACK_CLIENTS))
+        post_call.start()
+        asyncio.run(recover_transcripts())
+    
+    worker_options = {}
+    if os.getenv("AGENT_HTTP_PORT"):
+        # Set per process by supervisor.py so N workers on one node don't collide
+        worker_options["port"] = int(os.getenv("AGENT_HTTP_PORT"))
+    
     cli.run_app(
         WorkerOptions(
             entrypoint_fnc=entrypoint,
-            ws_url=livekit_url
+            prewarm_fnc=prewarm_process,
+            ws_url=livekit_url,
+            load_fnc=compute_worker_load,
+            load_threshold=WORKER_LOAD_THRESHOLD,
+            job_executor_type=JobExecutorType.THREAD if AGENT_JOB_EXECUTOR == "thread" else JobExecutorType.PROCESS,
+            **worker_options,
         )
     )
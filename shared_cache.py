@@ -0,0 +1,286 @@
+# shared_cache.py
+import asyncio
+import logging
+import os
+import struct
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
+
+logger = logging.getLogger("shared-cache")
+
+SHARED_CACHE_SOCKET = os.getenv("SHARED_CACHE_SOCKET", "")
+SHARED_CACHE_MAX_BYTES = int(os.getenv("SHARED_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+SHARED_CACHE_TIMEOUT_SECONDS = float(os.getenv("SHARED_CACHE_TIMEOUT_SECONDS", "0.2"))
+# Firestore listeners per client; each costs a stream, and past ~100 they slow every read
+SHARED_CACHE_MAX_WATCHES = int(os.getenv("SHARED_CACHE_MAX_WATCHES", "80"))
+# Whole KBs travel as one frame
+MAX_FRAME_BYTES = 64 * 1024 * 1024
+
+_HEADER = struct.Struct("!I")
+_DATETIME_EXT = 1
+
+
+def _pack_default(value):
+    if isinstance(value, datetime):
+        # Firestore timestamps; isoformat keeps the timezone and microseconds
+        return msgpack.ExtType(_DATETIME_EXT, value.isoformat().encode("utf-8"))
+    return str(value)
+
+
+def _ext_hook(code, data):
+    if code == _DATETIME_EXT:
+        return datetime.fromisoformat(data.decode("utf-8"))
+    return msgpack.ExtType(code, data)
+
+
+def pack_value(value):
+    return msgpack.packb(value, default=_pack_default, use_bin_type=True)
+
+
+def unpack_value(data):
+    return msgpack.unpackb(data, ext_hook=_ext_hook, raw=False)
+
+
+def _frame(message):
+    body = msgpack.packb(message, use_bin_type=True)
+    return _HEADER.pack(len(body)) + body
+
+
+async def _read_frame(reader):
+    length, = _HEADER.unpack(await reader.readexactly(_HEADER.size))
+    if length > MAX_FRAME_BYTES:
+        raise ValueError(f"frame of {length} bytes")
+    return msgpack.unpackb(await reader.readexactly(length), raw=False)
+
+
+def _unsubscribe(watch):
+    try:
+        watch.unsubscribe()
+    except Exception:
+        pass
+
+
+class SharedCacheServer:
+    """
+    Node-local cache daemon for worker processes, on a Unix socket.
+
+    Length-prefixed msgpack frames: one request ({"op": "get"|"set"|"delete",
+    ...}), one response. Entries carry a TTL and are LRU-evicted under a byte
+    budget. Values are stored as the msgpack bytes the client sent.
+
+    With `watch_ref(key)` returning a Firestore document or query, the daemon
+    listens on entries it holds (up to `max_watches`, least recently set
+    first out) and drops them when the source changes, so every worker's
+    next read goes back to Firestore.
+    """
+
+    def __init__(self, path, max_bytes=SHARED_CACHE_MAX_BYTES, watch_ref=None, max_watches=SHARED_CACHE_MAX_WATCHES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.watch_ref = watch_ref
+        self.max_watches = max_watches
+        self.total_bytes = 0
+        self._entries = OrderedDict()
+        self._watches = OrderedDict()  # key -> Firestore watch, None while subscribing
+        self._server = None
+        self._loop = None
+        self.stats = {"hits": 0, "misses": 0, "sets": 0, "deletes": 0, "evictions": 0,
+                      "invalidations": 0, "watch_evictions": 0}
+
+    async def start(self):
+        if not MSGPACK_AVAILABLE:
+            raise RuntimeError("shared cache needs msgpack")
+        self._loop = asyncio.get_running_loop()
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+        self._server = await asyncio.start_unix_server(self._handle, path=self.path)
+        os.chmod(self.path, 0o600)
+        logger.info(f"🗄️ Shared cache on {self.path}")
+
+    async def close(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+        watches, self._watches = [watch for watch in self._watches.values() if watch], OrderedDict()
+        for watch in watches:
+            _unsubscribe(watch)
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await _read_frame(reader)
+                except asyncio.IncompleteReadError:
+                    break
+                try:
+                    response = self._apply(request)
+                except Exception as e:
+                    response = {"ok": False, "error": str(e)}
+                writer.write(_frame(response))
+                await writer.drain()
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    def _apply(self, request):
+        op = request.get("op")
+        key = request.get("key")
+        if op == "get":
+            entry = self._entries.get(key)
+            if entry and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return {"ok": True, "value": entry[1]}
+            self._delete(key)
+            self.stats["misses"] += 1
+            return {"ok": True, "value": None}
+        if op == "set":
+            value = request["value"]
+            self._delete(key, unwatch=False)
+            if len(value) <= self.max_bytes:
+                self._entries[key] = (time.monotonic() + float(request.get("ttl", 300)), value)
+                self.total_bytes += len(value)
+                self.stats["sets"] += 1
+                while self.total_bytes > self.max_bytes:
+                    self._delete(next(iter(self._entries)))
+                    self.stats["evictions"] += 1
+                if key in self._entries:
+                    self._watch(key)
+            else:
+                self._unwatch(key)
+            return {"ok": True}
+        if op == "delete":
+            self._delete(key)
+            self.stats["deletes"] += 1
+            return {"ok": True}
+        if op == "stats":
+            return {"ok": True, "value": {**self.stats, "entries": len(self._entries), "bytes": self.total_bytes,
+                                          "watches": len(self._watches)}}
+        return {"ok": False, "error": f"unknown op {op}"}
+
+    def _delete(self, key, unwatch=True):
+        entry = self._entries.pop(key, None)
+        if entry:
+            self.total_bytes -= len(entry[1])
+        if unwatch:
+            self._unwatch(key)
+
+    def _watch(self, key):
+        if not self.watch_ref or not self.max_watches or self._loop is None:
+            return
+        if key in self._watches:
+            self._watches.move_to_end(key)
+            return
+        if len(self._watches) >= self.max_watches:
+            # The entry stays; its TTL bounds how stale it can get
+            _, released = self._watches.popitem(last=False)
+            self.stats["watch_evictions"] += 1
+            self._release(released)
+        self._watches[key] = None
+        self._loop.run_in_executor(None, self._subscribe, key)
+
+    def _subscribe(self, key):
+        # Executor thread: building the ref and opening the listener block on Firestore
+        initial = [True]
+
+        def on_snapshot(*_):
+            # Firestore delivers the current state once on subscribe
+            if initial[0]:
+                initial[0] = False
+                return
+            self._loop.call_soon_threadsafe(self._changed, key)
+
+        try:
+            ref = self.watch_ref(key)
+            watch = ref.on_snapshot(on_snapshot) if ref is not None else None
+        except Exception as e:
+            logger.debug(f"Shared cache watch error for {key}: {e}")
+            watch = None
+        try:
+            self._loop.call_soon_threadsafe(self._subscribed, key, watch)
+        except RuntimeError:
+            # The daemon's loop has closed
+            if watch:
+                _unsubscribe(watch)
+
+    def _subscribed(self, key, watch):
+        if key in self._watches and self._watches[key] is None:
+            if watch:
+                self._watches[key] = watch
+                return
+            del self._watches[key]
+        elif watch:
+            # Deleted or evicted while subscribing
+            self._release(watch)
+
+    def _changed(self, key):
+        if key in self._entries:
+            logger.info(f"🔄 {key} changed, dropping it from the shared cache")
+            self.stats["invalidations"] += 1
+        self._delete(key)
+
+    def _unwatch(self, key):
+        if key in self._watches:
+            self._release(self._watches.pop(key))
+
+    def _release(self, watch):
+        # None: still subscribing; _subscribed releases it when it arrives
+        if watch:
+            self._loop.run_in_executor(None, _unsubscribe, watch)
+
+
+class SharedCacheClient:
+    """
+    Client for SharedCacheServer. Every call degrades to a miss/no-op when
+    the daemon is unreachable, so workers fall back to Firestore.
+    """
+
+    def __init__(self, path=SHARED_CACHE_SOCKET, timeout=SHARED_CACHE_TIMEOUT_SECONDS):
+        self.path = path if MSGPACK_AVAILABLE else ""
+        self.timeout = timeout
+        if path and not MSGPACK_AVAILABLE:
+            logger.warning("msgpack not installed, shared cache disabled")
+
+    def __bool__(self):
+        return bool(self.path)
+
+    async def _request(self, request):
+        if not self.path:
+            return None
+        try:
+            reader, writer = await asyncio.wait_for(asyncio.open_unix_connection(self.path), self.timeout)
+            try:
+                writer.write(_frame(request))
+                await writer.drain()
+                return await asyncio.wait_for(_read_frame(reader), self.timeout)
+            finally:
+                writer.close()
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError) as e:
+            logger.debug(f"Shared cache unavailable: {e}")
+            return None
+
+    async def get(self, key):
+        response = await self._request({"op": "get", "key": key})
+        if response and response.get("value") is not None:
+            return unpack_value(response["value"])
+        return None
+
+    async def set(self, key, value, ttl):
+        await self._request({"op": "set", "key": key, "value": pack_value(value), "ttl": ttl})
+
+
+shared_cache = SharedCacheClient()
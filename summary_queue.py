@@ -0,0 +1,202 @@
+# summary_queue.py
+import asyncio
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger("summary-queue")
+
+SUMMARY_CONCURRENCY = int(os.getenv("SUMMARY_CONCURRENCY", "4"))
+SUMMARY_QUEUE_MAX = int(os.getenv("SUMMARY_QUEUE_MAX", "1000"))
+SUMMARY_DRAIN_TIMEOUT_SECONDS = float(os.getenv("SUMMARY_DRAIN_TIMEOUT_SECONDS", "30"))
+# Batching mode is on when the batch size is above 1
+SUMMARY_BATCH_SIZE = int(os.getenv("SUMMARY_BATCH_SIZE", "1"))
+SUMMARY_BATCH_WINDOW_SECONDS = float(os.getenv("SUMMARY_BATCH_WINDOW_SECONDS", "2"))
+
+
+class SummaryQueue:
+    """
+    Bounded job queue for post-call summaries.
+
+    Jobs run on a dedicated event loop thread with at most `concurrency`
+    in flight, so summary I/O never competes with the realtime audio loop.
+    Coroutine handlers are awaited on that loop; plain functions go to a
+    thread pool of the same size.
+    """
+
+    def __init__(self, handler, concurrency=SUMMARY_CONCURRENCY, max_size=SUMMARY_QUEUE_MAX):
+        self.handler = handler
+        self.is_async = asyncio.iscoroutinefunction(handler)
+        self.concurrency = max(1, concurrency)
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._loop = None
+        self._queue = None
+        self._executor = None
+        self._thread = None
+        self._closed = False
+        self._pending = 0
+        self.stats = {
+            "submitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "rejected": 0,
+            "in_flight": 0,
+            "wait_seconds_total": 0.0,
+            "wait_seconds_max": 0.0,
+        }
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread:
+                return
+            ready = threading.Event()
+            if not self.is_async:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.concurrency, thread_name_prefix="summary"
+                )
+            self._thread = threading.Thread(
+                target=self._run, args=(ready,), name="summary-loop", daemon=True
+            )
+            self._thread.start()
+            ready.wait()
+
+    def _run(self, ready):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._queue = asyncio.Queue()
+        for i in range(self.concurrency):
+            self._loop.create_task(self._worker(i))
+        ready.set()
+        self._loop.run_forever()
+
+    async def _worker(self, index):
+        while True:
+            enqueued_at, args = await self._queue.get()
+            wait = time.monotonic() - enqueued_at
+            self.stats["wait_seconds_total"] += wait
+            self.stats["wait_seconds_max"] = max(self.stats["wait_seconds_max"], wait)
+            self.stats["in_flight"] += 1
+            try:
+                if self.is_async:
+                    await self.handler(*args)
+                else:
+                    await self._loop.run_in_executor(self._executor, self.handler, *args)
+                self.stats["completed"] += 1
+            except Exception as e:
+                self.stats["failed"] += 1
+                logger.error(f"Summary job error: {e}", exc_info=True)
+            finally:
+                self.stats["in_flight"] -= 1
+                with self._lock:
+                    self._pending -= 1
+                self._queue.task_done()
+
+    def submit(self, *args):
+        """Queue a summary job; returns False when the queue is full or closed."""
+        with self._lock:
+            if self._closed or self._pending >= self.max_size:
+                self.stats["rejected"] += 1
+                logger.warning(f"⚠️ Summary queue full ({self._pending}), job rejected")
+                return False
+            self._pending += 1
+            self.stats["submitted"] += 1
+        self._ensure_started()
+        if threading.current_thread() is self._thread:
+            # From a running job: enqueue before it finishes, so drain() can't slip in between
+            self._queue.put_nowait((time.monotonic(), args))
+        else:
+            self._loop.call_soon_threadsafe(self._queue.put_nowait, (time.monotonic(), args))
+        return True
+
+    def snapshot(self):
+        with self._lock:
+            pending = self._pending
+        waited = self.stats["completed"] + self.stats["failed"]
+        return {
+            **self.stats,
+            "pending": pending,
+            "queue_depth": pending - self.stats["in_flight"],
+            "wait_seconds_avg": self.stats["wait_seconds_total"] / waited if waited else 0.0,
+        }
+
+    async def drain(self, timeout=SUMMARY_DRAIN_TIMEOUT_SECONDS):
+        """Wait (from any event loop) for queued and running jobs to finish."""
+        if not self._thread:
+            return True
+        future = asyncio.run_coroutine_threadsafe(self._queue.join(), self._loop)
+        try:
+            await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+            return True
+        except asyncio.TimeoutError:
+            logger.warning(f"⚠️ Summary drain timed out, {self.snapshot()['pending']} jobs pending")
+            return False
+
+    async def close(self, timeout=SUMMARY_DRAIN_TIMEOUT_SECONDS):
+        with self._lock:
+            self._closed = True
+        drained = await self.drain(timeout)
+        if self._executor:
+            self._executor.shutdown(wait=drained)
+        return drained
+
+
+class SummaryBatchQueue(SummaryQueue):
+    """
+    SummaryQueue whose workers hand the handler a list of jobs: each worker
+    takes the first waiting job, then keeps collecting until `batch_size`
+    jobs or `window` seconds, whichever comes first.
+
+    The handler receives a list of argument tuples and returns one result per
+    job; an Exception in that list counts the job as failed.
+    """
+
+    def __init__(self, handler, batch_size=SUMMARY_BATCH_SIZE, window=SUMMARY_BATCH_WINDOW_SECONDS,
+                 concurrency=SUMMARY_CONCURRENCY, max_size=SUMMARY_QUEUE_MAX):
+        super().__init__(handler, concurrency=concurrency, max_size=max_size)
+        self.batch_size = max(1, batch_size)
+        self.window = window
+        self.stats["batches"] = 0
+
+    async def _collect(self):
+        batch = [await self._queue.get()]
+        deadline = self._loop.time() + self.window
+        while len(batch) < self.batch_size:
+            remaining = deadline - self._loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _worker(self, index):
+        while True:
+            batch = await self._collect()
+            now = time.monotonic()
+            for enqueued_at, _ in batch:
+                wait = now - enqueued_at
+                self.stats["wait_seconds_total"] += wait
+                self.stats["wait_seconds_max"] = max(self.stats["wait_seconds_max"], wait)
+            self.stats["in_flight"] += len(batch)
+            self.stats["batches"] += 1
+            jobs = [args for _, args in batch]
+            try:
+                if self.is_async:
+                    results = await self.handler(jobs)
+                else:
+                    results = await self._loop.run_in_executor(self._executor, self.handler, jobs)
+                failed = sum(1 for result in results if isinstance(result, Exception))
+            except Exception as e:
+                failed = len(batch)
+                logger.error(f"Summary batch error: {e}", exc_info=True)
+            self.stats["failed"] += failed
+            self.stats["completed"] += len(batch) - failed
+            self.stats["in_flight"] -= len(batch)
+            with self._lock:
+                self._pending -= len(batch)
+            for _ in batch:
+                self._queue.task_done()
@@ -1,53 +1,118 @@
 # summary_script.py
 import os
 import json
-import boto3
+import asyncio
+import threading
+import weakref
+from collections import Counter
 from datetime import datetime
-from openai import OpenAI
-from pymongo import MongoClient
+from openai import AsyncOpenAI
 from dotenv import load_dotenv
 load_dotenv()
+from kb_index import KnowledgeBase
+from clients import mongo as mongo_client, s3 as s3_client, require_summary_collection, MONGO_MAX_POOL_SIZE
+from record_codec import RecordCodec, record_key, S3_KEY_LAYOUT
+from firestore_io import firestore_read
 import logging
 logging.getLogger('pymongo').setLevel(logging.WARNING)
 logging.getLogger('pymongo.topology').setLevel(logging.WARNING)
 logging.getLogger('pymongo.connection').setLevel(logging.WARNING)
 logging.getLogger('pymongo.serverSelection').setLevel(logging.WARNING)
-# Initialize OpenAI
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
-# Initialize MongoDB
-mongo_client = MongoClient(os.getenv("MONGO_URI"))
-mongo_db = mongo_client["test"]
-summary_collection = mongo_db["summaries"]
-
-# Initialize S3
-s3_client = boto3.client(
-    "s3",
-    aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
-    aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
-    region_name=os.getenv("AWS_REGION")
-)
+logger = logging.getLogger("summary-script")
+
+# MongoDB and S3 clients are created on first use (clients.py)
 BUCKET_NAME = os.getenv("S3_BUCKET_NAME")
 
-def generate_summary(agent_id: str, call_id: str, transcript: str, user_info: dict, db):
-    """
-    Generate a structured summary JSON using AI and Firestore knowledge base.
-    """
-    print(f"Generating summary for agent {agent_id}, call {call_id}")
-    
-    contact_info = {
-    "email": user_info.get("email", "Unknown"),
-    "phone": user_info.get("phone", "None")
-}
+try:
+    from motor.motor_asyncio import AsyncIOMotorClient
+    MOTOR_AVAILABLE = True
+except ImportError:
+    MOTOR_AVAILABLE = False
+
+try:
+    import aioboto3
+    AIOBOTO3_AVAILABLE = True
+except ImportError:
+    AIOBOTO3_AVAILABLE = False
+
+# Sync clients used in place of Motor / aioboto3 when those aren't installed
+FALLBACK_CLIENTS = tuple(
+    client for client, available in ((mongo_client, MOTOR_AVAILABLE), (s3_client, AIOBOTO3_AVAILABLE)) if not available
+)
+
+S3_MAX_POOL_CONNECTIONS = int(os.getenv("S3_MAX_POOL_CONNECTIONS", "50"))
+KB_SUMMARY_TOKEN_BUDGET = int(os.getenv("KB_SUMMARY_TOKEN_BUDGET", "1000"))
+SUMMARY_MODEL = os.getenv("SUMMARY_MODEL", "gpt-4o-mini")
+# Batching mode: transcripts per chat completion
+SUMMARY_ITEMS_PER_REQUEST = int(os.getenv("SUMMARY_ITEMS_PER_REQUEST", "5"))
+# The batch prompt ends with this line followed by the conversations as JSON
+BATCH_CONVERSATIONS_MARKER = "CONVERSATIONS:"
+
+
+class _AsyncClients:
+    """Pooled async clients bound to the event loop that created them."""
+
+    def __init__(self):
+        self.openai = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        self.summary_collection = None
+        self._motor = None
+        if MOTOR_AVAILABLE:
+            self._motor = AsyncIOMotorClient(os.getenv("MONGO_URI"), maxPoolSize=MONGO_MAX_POOL_SIZE)
+            self.summary_collection = self._motor["test"]["summaries"]
+        self._s3_context = None
+        self._s3 = None
+        self._s3_lock = asyncio.Lock()
+
+    async def s3(self):
+        if not AIOBOTO3_AVAILABLE:
+            return None
+        async with self._s3_lock:
+            if self._s3 is None:
+                from botocore.config import Config
+                session = aioboto3.Session(
+                    aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
+                    aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
+                    region_name=os.getenv("AWS_REGION")
+                )
+                self._s3_context = session.client("s3", config=Config(max_pool_connections=S3_MAX_POOL_CONNECTIONS))
+                self._s3 = await self._s3_context.__aenter__()
+        return self._s3
+
+    async def aclose(self):
+        """Close the S3 session, the OpenAI HTTP client and the Motor pool."""
+        async with self._s3_lock:
+            if self._s3_context is not None:
+                context, self._s3_context, self._s3 = self._s3_context, None, None
+                await context.__aexit__(None, None, None)
+        await self.openai.close()
+        if self._motor is not None:
+            self._motor.close()
 
-    # Use the passed db client
-    kb_ref = db.collection("agents").document(agent_id).collection("knowledge_base")
-    docs = kb_ref.stream()
-    knowledge_base = [doc.to_dict() for doc in docs]
-    knowledge_text = " ".join([item.get("content", "") for item in knowledge_base])
 
-    # Use AI to generate summary
-    prompt = f"""
+# One set per loop: the post-call queue and the rolling-summary queue each run their own
+_async_clients = weakref.WeakKeyDictionary()
+_async_clients_lock = threading.Lock()
+
+
+def get_async_clients():
+    loop = asyncio.get_running_loop()
+    with _async_clients_lock:
+        clients = _async_clients.get(loop)
+        if clients is None:
+            clients = _async_clients[loop] = _AsyncClients()
+    return clients
+
+
+async def close_async_clients():
+    """Close the running loop's client set, for loops that end (asyncio.run) rather than live on."""
+    loop = asyncio.get_running_loop()
+    with _async_clients_lock:
+        clients = _async_clients.pop(loop, None)
+    if clients is not None:
+        await clients.aclose()
+
+def build_summary_prompt(transcript: str, knowledge_text: str, contact_info: dict) -> str:
+    return f"""
     You are an intelligent assistant. A customer just finished a conversation with an AI agent.
     Here is the full transcript:
     {transcript}
@@ -76,53 +141,363 @@ def generate_summary(agent_id: str, call_id: str, transcript: str, user_info: di
     requestedData, responseData, contactInfo, and deliveryChannels.
     """
 
-    completion = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": "You are a helpful assistant that generates structured JSON summaries."},
-            {"role": "user", "content": prompt}
-        ],
-        temperature=0.4,
-        response_format={"type": "json_object"}
-    )
-
-    ai_output = completion.choices[0].message.content
 
+def parse_summary(ai_output: str, contact_info: dict) -> dict:
     # Parse AI JSON safely
     try:
-        summary_data = json.loads(ai_output)
-    except json.JSONDecodeError:
-        summary_data = {
+        return json.loads(ai_output)
+    except (json.JSONDecodeError, TypeError):
+        return {
             "requestedData": "N/A",
             "responseData": "Unable to parse AI response.",
             "contactInfo": contact_info,
             "deliveryChannels": ["email"]
         }
 
-    # Upload summary to S3
-    file_name = f"summary_{agent_id}_{call_id}.json"
-    s3_client.put_object(
-        Bucket=BUCKET_NAME,
-        Key=file_name,
-        Body=json.dumps(summary_data, indent=2),
-        ContentType="application/json"
-    )
-    s3_url = f"https://{BUCKET_NAME}.s3.amazonaws.com/{file_name}"
 
-    # Save metadata to MongoDB
-    summary_collection.insert_one({
+async def upload_summary_async(clients, stored: dict):
+    extra = {"ContentEncoding": stored["content_encoding"]} if stored["content_encoding"] else {}
+    s3 = await clients.s3()
+    if s3 is not None:
+        await s3.put_object(Bucket=BUCKET_NAME, Key=stored["key"], Body=stored["body"],
+                            ContentType=stored["content_type"], **extra)
+    else:
+        await asyncio.to_thread(
+            lambda: s3_client.require().put_object(Bucket=BUCKET_NAME, Key=stored["key"], Body=stored["body"],
+            ContentType=stored["content_type"], **extra)
+        )
+
+
+async def insert_summary_metadata_async(clients, document: dict):
+    if clients.summary_collection is not None:
+        await clients.summary_collection.insert_one(document)
+    else:
+        await asyncio.to_thread(lambda: require_summary_collection().insert_one(document))
+
+
+async def resolve_knowledge_text(db, agent_id: str, transcript: str, knowledge_text: str = None) -> str:
+    if knowledge_text is not None:
+        return knowledge_text
+    if db is None:
+        raise RuntimeError("Firestore unavailable")
+    kb_ref = db.collection("agents").document(agent_id).collection("knowledge_base")
+    docs = await firestore_read(lambda: list(kb_ref.stream()))
+    kb = KnowledgeBase([doc.to_dict().get("content", "") for doc in docs])
+    return kb.select(transcript, KB_SUMMARY_TOKEN_BUDGET)
+
+
+def contact_info_for(user_info: dict) -> dict:
+    return {
+        "email": user_info.get("email", "Unknown"),
+        "phone": user_info.get("phone", "None")
+    }
+
+
+summary_codec = RecordCodec()
+
+
+def encode_summary(agent_id: str, call_id: str, summary_data: dict, started_at: str = None) -> dict:
+    """S3 key, body and headers for a summary under the configured S3_KEY_LAYOUT and record codec."""
+    if S3_KEY_LAYOUT == "legacy":
+        key = f"summary_{agent_id}_{call_id}.json"
+        body, content_type, content_encoding = json.dumps(summary_data, indent=2), "application/json", None
+    else:
+        body = summary_codec.encode("summary", summary_data, agentId=agent_id, callId=call_id, callStartedAt=started_at)
+        key = record_key("summaries", agent_id, body, summary_codec.extension, started_at)
+        content_type, content_encoding = summary_codec.content_type, summary_codec.content_encoding
+    return {
+        "key": key,
+        "body": body,
+        "content_type": content_type,
+        "content_encoding": content_encoding,
+        "url": f"https://{BUCKET_NAME}.s3.amazonaws.com/{key}",
+    }
+
+
+def summary_metadata(agent_id: str, call_id: str, s3_url: str) -> dict:
+    return {
         "agentId": agent_id,
         "callId": call_id,
         "summaryUrl": s3_url,
         "createdAt": datetime.utcnow()
-    })
+    }
+
+
+async def summarize_transcript(clients, transcript: str, knowledge_text: str, contact_info: dict) -> dict:
+    completion = await clients.openai.chat.completions.create(
+        model=SUMMARY_MODEL,
+        messages=[
+            {"role": "system", "content": "You are a helpful assistant that generates structured JSON summaries."},
+            {"role": "user", "content": build_summary_prompt(transcript, knowledge_text, contact_info)}
+        ],
+        temperature=0.4,
+        response_format={"type": "json_object"}
+    )
+    return parse_summary(completion.choices[0].message.content, contact_info)
+
+
+def build_fold_prompt(state: dict, delta: str, knowledge_text: str, contact_info: dict) -> str:
+    return f"""
+    You are an intelligent assistant keeping a running summary of a conversation
+    between a customer and an AI agent that is still in progress.
+
+    Summary so far:
+    {json.dumps(state, ensure_ascii=False) if state else "(none yet)"}
+
+    New turns since that summary:
+    {delta}
+
+    Agent knowledge base:
+    {knowledge_text}
 
-    print(f"✅ Summary generated and stored at {s3_url}")
+    IMPORTANT: You MUST return a JSON object with EXACTLY this structure:
+{{
+  "requestedData": "string describing what the user requested",
+  "responseData": "string with the response/answer provided",
+  "contactInfo": {{
+    "email": "extract from transcript or 'Unknown'",
+    "phone": "extract from transcript or 'None'"
+  }},
+  "deliveryChannels": ["array", "of", "strings"]
+}}
+
+    Update the summary with the new turns: keep what still holds, revise what the new
+    turns change, and add anything new. Start contactInfo from {json.dumps(contact_info)}
+    and infer delivery channels (email, whatsapp) if mentioned.
+    """
+
+
+async def fold_summary(clients, state: dict, delta: str, knowledge_text: str, contact_info: dict) -> dict:
+    """Merge new transcript lines into a running summary; raises instead of returning a placeholder."""
+    completion = await clients.openai.chat.completions.create(
+        model=SUMMARY_MODEL,
+        messages=[
+            {"role": "system", "content": "You are a helpful assistant that generates structured JSON summaries."},
+            {"role": "user", "content": build_fold_prompt(state, delta, knowledge_text, contact_info)}
+        ],
+        temperature=0.4,
+        response_format={"type": "json_object"}
+    )
+    summary = json.loads(completion.choices[0].message.content)
+    if not isinstance(summary, dict) or "requestedData" not in summary:
+        raise ValueError("fold response is not a summary object")
+    return summary
+
+
+async def generate_summary_async(agent_id: str, call_id: str, transcript: str, user_info: dict, db, knowledge_text: str = None):
+    """
+    Async variant of generate_summary: pooled async clients, with the S3 upload
+    and the MongoDB metadata insert running concurrently. Pass `knowledge_text`
+    when the caller already has the relevant KB excerpt to skip the Firestore read.
+    """
+    logger.info(f"Generating summary for agent {agent_id}, call {call_id}", extra={"agent_id": agent_id, "call_id": call_id})
+    clients = get_async_clients()
+
+    contact_info = contact_info_for(user_info)
+    knowledge_text = await resolve_knowledge_text(db, agent_id, transcript, knowledge_text)
+    summary_data = await summarize_transcript(clients, transcript, knowledge_text, contact_info)
+
+    stored = encode_summary(agent_id, call_id, summary_data)
+
+    # The metadata only needs the deterministic URL, so both writes go out together
+    await asyncio.gather(
+        upload_summary_async(clients, stored),
+        insert_summary_metadata_async(clients, summary_metadata(agent_id, call_id, stored["url"]))
+    )
+
+    logger.info(f"✅ Summary generated and stored at {stored['url']}")
     return summary_data
 
 
+# ---------------------------------------------------------------- batching mode
+
+def build_batch_summary_prompt(items: list) -> str:
+    conversations = [
+        {"id": item["call_id"], "transcript": item["transcript"],
+         "knowledgeBase": item["knowledge_text"], "contactInfo": item["contact_info"]}
+        for item in items
+    ]
+    return f"""
+    You are an intelligent assistant. Customers just finished conversations with the same AI agent.
+    Summarize EACH conversation below independently.
+
+    IMPORTANT: You MUST return a JSON object with EXACTLY this structure:
+{{
+  "summaries": [
+    {{
+      "id": "the conversation id, copied exactly",
+      "requestedData": "string describing what the user requested",
+      "responseData": "string with the response/answer provided",
+      "contactInfo": {{"email": "extract from transcript or 'Unknown'", "phone": "extract from transcript or 'None'"}},
+      "deliveryChannels": ["array", "of", "strings"]
+    }}
+  ]
+}}
 
+    For each conversation use its own knowledgeBase for responseData, start from its
+    contactInfo, and infer delivery channels (email, whatsapp) if mentioned.
+    Return exactly one summary per conversation id.
 
+{BATCH_CONVERSATIONS_MARKER}
+{json.dumps(conversations, ensure_ascii=False)}
+"""
 
 
+async def summarize_batch(clients, items: list) -> list:
+    """
+    One chat completion for several transcripts of one agent. Returns a
+    summary per item, or None where the response can't be tied to that
+    item's call_id: missing, repeated, or a call_id shared by two items.
+    """
+    if len({item["agent_id"] for item in items}) > 1:
+        raise ValueError("a summary batch must not mix agents")
+    completion = await clients.openai.chat.completions.create(
+        model=SUMMARY_MODEL,
+        messages=[
+            {"role": "system", "content": "You are a helpful assistant that generates structured JSON summaries."},
+            {"role": "user", "content": build_batch_summary_prompt(items)}
+        ],
+        temperature=0.4,
+        response_format={"type": "json_object"}
+    )
+    try:
+        summaries = json.loads(completion.choices[0].message.content).get("summaries", [])
+    except (json.JSONDecodeError, TypeError, AttributeError):
+        return [None] * len(items)
+    summaries = [summary for summary in summaries if isinstance(summary, dict)]
+    answered = Counter(summary.get("id") for summary in summaries)
+    asked = Counter(item["call_id"] for item in items)
+    by_id = {
+        summary["id"]: {key: value for key, value in summary.items() if key != "id"}
+        for summary in summaries if answered[summary.get("id")] == 1
+    }
+    return [by_id.get(item["call_id"]) if asked[item["call_id"]] == 1 else None for item in items]
+
+
+async def summarize_items(clients, items: list) -> list:
+    """
+    Summaries for items with agent_id/call_id/transcript/knowledge_text/contact_info,
+    several transcripts of the same agent per request, so a prompt never
+    carries another tenant's transcripts, KB or contact details. Items a batch
+    response didn't answer unambiguously, or whose request failed, get one
+    single-transcript attempt; a summary or an Exception is returned per item.
+    """
+    results = [None] * len(items)
+    if SUMMARY_ITEMS_PER_REQUEST > 1:
+        by_agent = {}
+        for index, item in enumerate(items):
+            by_agent.setdefault(item["agent_id"], []).append(index)
+        groups = [
+            indexes[i:i + SUMMARY_ITEMS_PER_REQUEST]
+            for indexes in by_agent.values() for i in range(0, len(indexes), SUMMARY_ITEMS_PER_REQUEST)
+        ]
+        groups = [group for group in groups if len(group) > 1]
+        batch_results = await asyncio.gather(
+            *(summarize_batch(clients, [items[index] for index in group]) for group in groups), return_exceptions=True
+        )
+        for group, result in zip(groups, batch_results):
+            if isinstance(result, Exception):
+                logger.warning(f"⚠️ Batch summary request failed ({result}), falling back to {len(group)} single requests")
+                continue
+            for index, summary in zip(group, result):
+                results[index] = summary
+    missing = [index for index, summary in enumerate(results) if summary is None]
+    singles = await asyncio.gather(
+        *(summarize_transcript(clients, items[i]["transcript"], items[i]["knowledge_text"], items[i]["contact_info"]) for i in missing),
+        return_exceptions=True,
+    )
+    for index, summary in zip(missing, singles):
+        results[index] = summary
+    return results
+
+
+# ------------------------------------------------------ post-call pipeline stages
+# Handlers for post_call_spool stages: each takes job payloads (dicts with
+# agent_id, call_id, transcript, contact_info, knowledge_text) and returns the
+# updated payload or an Exception per job. They are safe to repeat.
+# Calls summarized during the call (rolling_summary.py) also carry
+# summary_state and transcript_delta, the turns not folded into it yet.
+
+async def finish_rolling_summary(clients, payload: dict, db) -> dict:
+    if not payload["transcript_delta"].strip():
+        return payload["summary_state"]
+    knowledge_text = await resolve_knowledge_text(db, payload["agent_id"], payload["transcript_delta"], payload.get("knowledge_text"))
+    return await fold_summary(clients, payload["summary_state"], payload["transcript_delta"], knowledge_text, payload["contact_info"])
+
+
+async def summarize_stage(payloads: list, db) -> list:
+    clients = get_async_clients()
+    results = [None] * len(payloads)
+    rolling = [index for index, p in enumerate(payloads) if p.get("summary_state")]
+    full = [index for index, p in enumerate(payloads) if not p.get("summary_state")]
+
+    folded = await asyncio.gather(
+        *(finish_rolling_summary(clients, payloads[index], db) for index in rolling),
+        return_exceptions=True,
+    )
+    for index, summary in zip(rolling, folded):
+        results[index] = summary if isinstance(summary, Exception) else {**payloads[index], "summary": summary}
+
+    knowledge = await asyncio.gather(
+        *(resolve_knowledge_text(db, payloads[i]["agent_id"], payloads[i]["transcript"], payloads[i].get("knowledge_text")) for i in full),
+        return_exceptions=True,
+    )
+    items = []
+    for index, knowledge_text in zip(full, knowledge):
+        if isinstance(knowledge_text, Exception):
+            results[index] = knowledge_text
+        else:
+            items.append({**payloads[index], "index": index, "knowledge_text": knowledge_text})
+    for item, summary in zip(items, await summarize_items(clients, items)):
+        results[item["index"]] = summary if isinstance(summary, Exception) else {**payloads[item["index"]], "summary": summary}
+    return results
+
+
+async def upload_stage(payloads: list) -> list:
+    clients = get_async_clients()
+
+    async def upload(payload):
+        # Same summary and call start -> same content-addressed key, so a replay overwrites in place
+        stored = encode_summary(payload["agent_id"], payload["call_id"], payload["summary"], payload.get("start_time_utc"))
+        await upload_summary_async(clients, stored)
+        return {**payload, "summary_url": stored["url"]}
+
+    return await asyncio.gather(*(upload(payload) for payload in payloads), return_exceptions=True)
+
+
+async def index_stage(payloads: list) -> list:
+    """One bulk upsert keyed by agentId/callId, so a replayed job doesn't duplicate metadata."""
+    from pymongo import UpdateOne
+
+    clients = get_async_clients()
+    operations = [
+        UpdateOne(
+            {"agentId": p["agent_id"], "callId": p["call_id"]},
+            {"$setOnInsert": summary_metadata(p["agent_id"], p["call_id"], p["summary_url"])},
+            upsert=True,
+        )
+        for p in payloads
+    ]
+    try:
+        if clients.summary_collection is not None:
+            await clients.summary_collection.bulk_write(operations, ordered=False)
+        else:
+            await asyncio.to_thread(lambda: require_summary_collection().bulk_write(operations, ordered=False))
+    except Exception as e:
+        return [e] * len(payloads)
+    logger.info(f"✅ {len(payloads)} summaries indexed")
+    return payloads
+
+
+def generate_summary(agent_id: str, call_id: str, transcript: str, user_info: dict, db, knowledge_text: str = None):
+    """
+    Generate a structured summary JSON using AI and Firestore knowledge base.
+    """
+    async def run():
+        try:
+            return await generate_summary_async(agent_id, call_id, transcript, user_info, db, knowledge_text)
+        finally:
+            # The loop ends with this call; its clients would otherwise leak their connections
+            await close_async_clients()
 
+    return asyncio.run(run())
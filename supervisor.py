@@ -0,0 +1,123 @@
+# supervisor.py
+import asyncio
+import logging
+import os
+import signal
+import sys
+import tempfile
+from dotenv import load_dotenv
+load_dotenv()
+
+import clients
+from shared_cache import SharedCacheServer, SHARED_CACHE_MAX_BYTES
+from post_call_spool import POST_CALL_SPOOL_PATH
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger("worker-supervisor")
+
+AGENT_WORKER_PROCESSES = int(os.getenv("AGENT_WORKER_PROCESSES", str(os.cpu_count() or 1)))
+AGENT_HTTP_BASE_PORT = int(os.getenv("AGENT_HTTP_BASE_PORT", "8081"))
+METRICS_BASE_PORT = int(os.getenv("METRICS_PORT", "9464"))
+KB_CACHE_NODE_MAX_BYTES = int(os.getenv("KB_CACHE_NODE_MAX_BYTES", str(256 * 1024 * 1024)))
+RESTART_BACKOFF_MAX_SECONDS = 30
+
+
+def loop_time():
+    return asyncio.get_running_loop().time()
+
+
+def cache_watch_ref(key):
+    """Firestore source of a shared cache key written by server.py (config:<agent>, kb:<agent>)."""
+    kind, _, agent_id = key.partition(":")
+    db = clients.get_firestore()
+    if db is None or not agent_id:
+        return None
+    agent = db.collection('agents').document(agent_id)
+    if kind == "config":
+        return agent
+    if kind == "kb":
+        return agent.collection('knowledge_base')
+    return None
+
+
+class WorkerSupervisor:
+    """
+    Runs N `server.py start` processes on one node and a shared cache daemon
+    they all read through; the daemon listens on Firestore for the entries it
+    holds, since the job processes that load them don't live long enough to.
+    Crashed workers are restarted with backoff; SIGTERM/SIGINT are forwarded
+    so every worker drains its calls.
+    """
+
+    def __init__(self, processes=AGENT_WORKER_PROCESSES, command="start"):
+        self.processes = max(1, processes)
+        self.command = command
+        self.socket_path = os.getenv(
+            "SHARED_CACHE_SOCKET", os.path.join(tempfile.gettempdir(), f"agent-cache-{os.getpid()}.sock")
+        )
+        self.cache_server = SharedCacheServer(self.socket_path, SHARED_CACHE_MAX_BYTES, watch_ref=cache_watch_ref)
+        self.children = {}
+        self.stopping = False
+
+    def child_env(self, index):
+        env = dict(os.environ)
+        env["SHARED_CACHE_SOCKET"] = self.socket_path
+        env["WORKER_INDEX"] = str(index)
+        env["AGENT_HTTP_PORT"] = str(AGENT_HTTP_BASE_PORT + index)
+        env["METRICS_PORT"] = str(METRICS_BASE_PORT + index) if METRICS_BASE_PORT else "0"
+        # Each worker's local KB cache gets a slice of the node budget; the daemon holds the rest
+        env.setdefault("KB_CACHE_MAX_BYTES", str(KB_CACHE_NODE_MAX_BYTES // self.processes))
+        # One post-call spool per worker slot; a restarted worker resumes its own
+        base, ext = os.path.splitext(POST_CALL_SPOOL_PATH)
+        env["POST_CALL_SPOOL_PATH"] = f"{base}.{index}{ext}"
+        return env
+
+    async def run_worker(self, index):
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "server.py")
+        backoff = 1
+        while not self.stopping:
+            proc = await asyncio.create_subprocess_exec(
+                sys.executable, script, self.command, env=self.child_env(index)
+            )
+            self.children[index] = proc
+            logger.info(f"🚀 Worker {index} started (pid {proc.pid})")
+            started = loop_time()
+            code = await proc.wait()
+            self.children.pop(index, None)
+            if self.stopping:
+                break
+            if loop_time() - started > RESTART_BACKOFF_MAX_SECONDS:
+                backoff = 1
+            logger.warning(f"⚠️ Worker {index} exited with {code}, restarting in {backoff}s")
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, RESTART_BACKOFF_MAX_SECONDS)
+
+    def stop(self, sig):
+        if self.stopping:
+            return
+        self.stopping = True
+        logger.info(f"🛑 Stopping {len(self.children)} workers")
+        for proc in self.children.values():
+            if proc.returncode is None:
+                proc.send_signal(sig)
+
+    async def run(self):
+        await self.cache_server.start()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, self.stop, sig)
+        try:
+            await asyncio.gather(*(self.run_worker(i) for i in range(self.processes)))
+        finally:
+            await self.cache_server.close()
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "start"
+    print("=" * 60)
+    print(f"🚀 Starting {AGENT_WORKER_PROCESSES} LiveKit agent workers")
+    print("=" * 60)
+    asyncio.run(WorkerSupervisor(AGENT_WORKER_PROCESSES, command).run())
@@ -0,0 +1,144 @@
+import asyncio
+
+import pytest
+
+from agent_cache import AgentCache
+
+
+class Watch:
+    def __init__(self, key, watches):
+        self.key = key
+        self.watches = watches
+        self.callback = None
+
+    def on_snapshot(self, callback):
+        self.callback = callback
+        self.watches[self.key] = self
+        return self
+
+    def unsubscribe(self):
+        self.watches.pop(self.key, None)
+
+
+def make_cache(loader, **options):
+    return AgentCache("Test", loader, ttl_seconds=60, max_bytes=1024 * 1024, **options)
+
+
+def test_concurrent_misses_share_one_load():
+    calls = []
+
+    async def loader(key):
+        calls.append(key)
+        await asyncio.sleep(0.01)
+        return {"key": key}
+
+    async def run():
+        cache = make_cache(loader)
+        values = await asyncio.gather(*(cache.get("a") for _ in range(5)))
+        return cache, values
+
+    cache, values = asyncio.run(run())
+    assert calls == ["a"]
+    assert all(value is values[0] for value in values)
+    assert cache.stats["misses"] == 1
+    assert cache.stats["coalesced"] == 4
+
+
+def test_cancelled_owner_hands_the_load_to_a_waiter():
+    calls = []
+
+    async def loader(key):
+        calls.append(key)
+        await asyncio.sleep(0.05)
+        return len(calls)
+
+    async def run():
+        cache = make_cache(loader)
+        owner = asyncio.create_task(cache.get("a"))
+        await asyncio.sleep(0.01)
+        waiter = asyncio.create_task(cache.get("a"))
+        await asyncio.sleep(0.01)
+        owner.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await owner
+        return await waiter
+
+    assert asyncio.run(run()) == 2
+    assert calls == ["a", "a"]
+
+
+def test_load_error_reaches_waiters_and_is_retried():
+    attempts = []
+
+    async def loader(key):
+        attempts.append(key)
+        await asyncio.sleep(0.01)
+        if len(attempts) == 1:
+            raise ConnectionError("down")
+        return "ok"
+
+    async def run():
+        cache = make_cache(loader)
+        first = await asyncio.gather(cache.get("a"), cache.get("a"), return_exceptions=True)
+        return cache, first, await cache.get("a")
+
+    cache, first, retried = asyncio.run(run())
+    assert all(isinstance(result, ConnectionError) for result in first)
+    assert retried == "ok"
+    assert cache.stats["load_errors"] == 1
+
+
+def test_invalidation_during_load_is_not_cached():
+    async def loader(key):
+        await asyncio.sleep(0.02)
+        return object()
+
+    async def run():
+        cache = make_cache(loader)
+        load = asyncio.create_task(cache.get("a"))
+        await asyncio.sleep(0.01)
+        cache.invalidate("a")
+        first = await load
+        return first, await cache.get("a")
+
+    first, second = asyncio.run(run())
+    assert first is not second
+
+
+def test_watches_are_capped_least_recently_used_first():
+    watches = {}
+
+    async def loader(key):
+        return key
+
+    async def run():
+        cache = make_cache(loader, watch_ref=lambda key: Watch(key, watches), max_watches=2)
+        for key in ("a", "b", "c"):
+            await cache.get(key)
+        return cache
+
+    cache = asyncio.run(run())
+    assert sorted(watches) == ["b", "c"]
+    assert cache.snapshot()["watches"] == 2
+    assert cache.stats["watch_evictions"] == 1
+
+
+def test_snapshot_after_subscribe_invalidates():
+    watches = {}
+    invalidated = []
+
+    async def loader(key):
+        return object()
+
+    async def run():
+        cache = make_cache(loader, watch_ref=lambda key: Watch(key, watches), on_invalidate=invalidated.append)
+        first = await cache.get("a")
+        watches["a"].callback()  # initial state, delivered on subscribe
+        cached = await cache.get("a")
+        watches["a"].callback()
+        return first, cached, await cache.get("a")
+
+    first, cached, reloaded = asyncio.run(run())
+    assert cached is first
+    assert reloaded is not first
+    assert invalidated == ["a"]
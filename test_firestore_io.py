@@ -0,0 +1,104 @@
+import threading
+
+import pytest
+
+import firestore_io
+from clients import LazyClient
+from firestore_io import RETRYABLE_ERRORS, AnalyticsWriter
+
+
+class FakeDocument:
+    def __init__(self, db, doc_id):
+        self.db = db
+        self.doc_id = doc_id
+
+    def set(self, document):
+        self.db.check(document)
+        self.db.store[self.doc_id] = document
+
+
+class FakeBatch:
+    def __init__(self, db):
+        self.db = db
+        self.writes = []
+
+    def set(self, ref, document):
+        self.writes.append((ref, document))
+
+    def commit(self):
+        self.db.commits.append(len(self.writes))
+        for _, document in self.writes:
+            self.db.check(document)
+        for ref, document in self.writes:
+            self.db.store[ref.doc_id] = document
+
+
+class FakeDB:
+    def __init__(self, unavailable=0):
+        self.store = {}
+        self.commits = []
+        self.unavailable = unavailable
+        self.lock = threading.Lock()
+
+    def check(self, document):
+        with self.lock:
+            if self.unavailable:
+                self.unavailable -= 1
+                raise RETRYABLE_ERRORS[0]("try again")
+        if document.get("bad"):
+            raise ValueError("invalid document")
+
+    def collection(self, name):
+        return self
+
+    def document(self, doc_id):
+        return FakeDocument(self, doc_id)
+
+    def batch(self):
+        return FakeBatch(self)
+
+
+@pytest.fixture
+def db(monkeypatch):
+    db = FakeDB()
+    client = LazyClient("Firestore", lambda: None)
+    client.set(db)
+    monkeypatch.setattr(firestore_io, "firestore", client)
+    monkeypatch.setattr(firestore_io, "ANALYTICS_RETRY_BASE_SECONDS", 0)
+    return db
+
+
+def write_all(writer, documents):
+    futures = {doc_id: writer.write(doc_id, document) for doc_id, document in documents.items()}
+    errors = {}
+    for doc_id, future in futures.items():
+        try:
+            future.result(5)
+        except Exception as e:
+            errors[doc_id] = e
+    return errors
+
+
+def test_rejected_batch_is_split_so_only_the_bad_document_fails(db):
+    writer = AnalyticsWriter(flush_size=3, flush_interval=1, threads=1)
+    errors = write_all(writer, {"a": {"n": 1}, "b": {"bad": True}, "c": {"n": 3}})
+
+    assert list(errors) == ["b"] and isinstance(errors["b"], ValueError)
+    assert sorted(db.store) == ["a", "c"]
+    assert db.commits == [3]
+    stats = writer.snapshot()
+    assert (stats["split_batches"], stats["written"], stats["failed"]) == (1, 2, 1)
+
+
+def test_unavailable_commits_are_retried_as_a_batch(db):
+    db.unavailable = 2
+    writer = AnalyticsWriter(flush_size=2, flush_interval=1, threads=1, attempts=3)
+    assert write_all(writer, {"a": {"n": 1}, "b": {"n": 2}}) == {}
+    assert db.commits == [2, 2, 2]
+    assert writer.snapshot()["retries"] == 2
+
+
+def test_zero_attempts_still_commits(db):
+    writer = AnalyticsWriter(flush_size=1, threads=1, attempts=0)
+    assert write_all(writer, {"a": {"n": 1}}) == {}
+    assert db.store == {"a": {"n": 1}}
@@ -0,0 +1,60 @@
+import asyncio
+
+from inactivity import DeadlineScheduler
+
+
+def test_deadlines_fire_in_order_on_the_scheduling_loop():
+    scheduler = DeadlineScheduler()
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        fired = []
+        done = asyncio.Event()
+
+        def callback(key):
+            assert asyncio.get_running_loop() is loop
+            fired.append(key)
+            if len(fired) == 3:
+                done.set()
+
+        for key, delay in (("c", 0.06), ("a", 0.02), ("b", 0.04)):
+            scheduler.schedule(key, delay, lambda key=key: callback(key))
+        await asyncio.wait_for(done.wait(), 5)
+        return fired
+
+    assert asyncio.run(run()) == ["a", "b", "c"]
+    assert len(scheduler) == 0
+
+
+def test_rescheduling_replaces_and_cancel_drops_a_deadline():
+    scheduler = DeadlineScheduler()
+
+    async def run():
+        fired = []
+        scheduler.schedule("moved", 0.02, lambda: fired.append("moved-early"))
+        scheduler.schedule("moved", 0.08, lambda: fired.append("moved"))
+        scheduler.schedule("cancelled", 0.02, lambda: fired.append("cancelled"))
+        scheduler.cancel("cancelled")
+        assert len(scheduler) == 1
+        await asyncio.sleep(0.04)
+        assert fired == []
+        await asyncio.sleep(0.1)
+        return fired
+
+    assert asyncio.run(run()) == ["moved"]
+
+
+def test_a_closed_loop_does_not_stop_the_scheduler():
+    scheduler = DeadlineScheduler()
+
+    async def schedule_and_leave():
+        scheduler.schedule("orphan", 0.01, lambda: None)
+
+    asyncio.run(schedule_and_leave())
+
+    async def run():
+        fired = asyncio.Event()
+        scheduler.schedule("live", 0.05, fired.set)
+        await asyncio.wait_for(fired.wait(), 5)
+
+    asyncio.run(run())
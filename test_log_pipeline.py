@@ -0,0 +1,60 @@
+import asyncio
+import io
+import logging
+import sys
+
+import pytest
+
+import log_pipeline
+from log_pipeline import LogQueueHandler, bind_log_context, setup_queue_logging, stop_queue_logging
+
+
+class Forwarder(LogQueueHandler):
+    """LogQueueHandler without the IPC duplex: keeps what it would send to the main process."""
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    root = logging.getLogger()
+    saved = list(root.handlers)
+    monkeypatch.setattr(log_pipeline, "_listener", None)
+    monkeypatch.setattr(log_pipeline, "_queue_handler", None)
+    monkeypatch.setattr(log_pipeline, "_console_handler", None)
+    root.handlers = []
+    console = io.StringIO()
+    setup_queue_logging(json_format=False, handler=logging.StreamHandler(console))
+    yield console
+    stop_queue_logging()
+    root.handlers = saved
+
+
+def test_cli_console_handler_is_dropped(pipeline):
+    logging.getLogger().addHandler(logging.StreamHandler(sys.stdout))
+    logging.getLogger("test").warning("once")
+    stop_queue_logging()
+    assert pipeline.getvalue().count("once") == 1
+    assert logging.getLogger().handlers == [log_pipeline._queue_handler]
+
+
+def test_job_process_forwarder_replaces_the_console(pipeline):
+    forwarder = Forwarder()
+    logging.getLogger().addHandler(forwarder)
+
+    async def job():
+        bind_log_context(session_id="room-1")
+        logging.getLogger("test").warning("from the job")
+
+    asyncio.run(job())
+    stop_queue_logging()
+
+    assert pipeline.getvalue() == ""
+    record, = [record for record in forwarder.records if record.name == "test"]
+    assert record.getMessage() == "from the job"
+    assert record.session_id == "room-1"
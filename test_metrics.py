@@ -0,0 +1,57 @@
+import json
+import os
+import subprocess
+
+import pytest
+
+import metrics
+
+
+@pytest.fixture
+def exporter(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_MULTIPROC_DIR", str(tmp_path))
+    monkeypatch.setattr(metrics, "_exporter_pid", os.getpid())
+    monkeypatch.setattr(metrics, "_retired", {})
+    return tmp_path
+
+
+def exited_pid():
+    proc = subprocess.Popen(["true"])
+    proc.wait()
+    return proc.pid
+
+
+def write(directory, pid, histograms, gauges):
+    path = directory / f"{pid}-test.json"
+    path.write_text(json.dumps({"pid": pid, "histograms": histograms, "gauges": gauges}))
+    return path
+
+
+def test_job_process_metrics_are_merged(exporter):
+    histogram = metrics.Histogram("test_merge_seconds", "test", buckets=(1.0,))
+    gauge = metrics.Gauge("test_merge_sessions", "test", lambda: 1)
+    peak = metrics.Gauge("test_merge_peak", "test", lambda: 3, multiprocess="max")
+    local = metrics.Gauge("test_merge_local", "test", lambda: 7, multiprocess="exporter")
+    histogram.observe(0.5)
+
+    live = os.getppid()
+    write(exporter, live, {histogram.name: {"counts": [2, 1], "sum": 4.0}},
+          {gauge.name: [[{}, 2]], peak.name: [[{}, 5]], local.name: [[{}, 100]]})
+    dead = write(exporter, exited_pid(), {histogram.name: {"counts": [1, 0], "sum": 0.5}}, {gauge.name: [[{}, 50]]})
+
+    text = metrics.render_text()
+    assert 'test_merge_seconds_bucket{le="1.0"} 4' in text
+    assert "test_merge_seconds_count 5" in text
+    assert "test_merge_sessions 3" in text
+    assert "test_merge_peak 5" in text
+    assert "test_merge_local 7" in text
+    assert not dead.exists()
+
+    # The exited process's histogram counts survive the removal of its file
+    assert "test_merge_seconds_count 5" in metrics.render_text()
+
+
+def test_process_values_reads_live_processes_only(exporter):
+    write(exporter, os.getppid(), {}, {"test_lag": [[{}, 0.2]]})
+    write(exporter, exited_pid(), {}, {"test_lag": [[{}, 9.0]]})
+    assert metrics.process_values("test_lag") == [[{}, 0.2]]
@@ -0,0 +1,147 @@
+import asyncio
+import sqlite3
+import time
+
+import pytest
+
+from post_call_spool import DEAD, PostCallPipeline, Spool, Stage
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def recording_stage(name, seen, fail=lambda payload: False, when=None):
+    async def handler(payloads):
+        seen.extend((name, payload["n"]) for payload in payloads)
+        return [RuntimeError(f"{name} down") if fail(payload) else {**payload, name: True} for payload in payloads]
+    return Stage(name, handler, when=when)
+
+
+@pytest.fixture
+def spool(tmp_path):
+    return Spool(str(tmp_path / "spool.db"))
+
+
+def pipeline_for(spool, stages, **kwargs):
+    kwargs.setdefault("max_attempts", 3)
+    pipeline = PostCallPipeline(stages, spool=spool, batch_size=4, window=0.01, poll_interval=0.02, **kwargs)
+    pipeline._retry_delay = lambda attempts: 0.05
+    return pipeline
+
+
+def test_jobs_advance_through_stages_and_are_removed(spool):
+    seen = []
+    pipeline = pipeline_for(spool, [
+        recording_stage("first", seen),
+        recording_stage("skipped", seen, when=lambda payload: False),
+        recording_stage("last", seen),
+    ])
+    pipeline.start()
+    for n in range(3):
+        pipeline.enqueue(f"call-{n}", {"n": n})
+
+    assert wait_for(lambda: spool.counts() == {})
+    asyncio.run(pipeline.close(5))
+    assert sorted(seen) == [("first", 0), ("first", 1), ("first", 2), ("last", 0), ("last", 1), ("last", 2)]
+
+
+def test_failed_stage_is_retried_from_the_spool(spool):
+    seen = []
+    failures = {"left": 2}
+
+    def fail(payload):
+        failures["left"] -= 1
+        return failures["left"] >= 0
+
+    pipeline = pipeline_for(spool, [recording_stage("upload", seen, fail=fail)])
+    pipeline.start()
+    pipeline.enqueue("call", {"n": 1})
+
+    assert wait_for(lambda: spool.counts() == {})
+    asyncio.run(pipeline.close(5))
+    assert seen == [("upload", 1)] * 3
+    assert pipeline.snapshot()["stage_failures"] == 2
+
+
+def test_retry_waits_for_its_delay(spool):
+    seen = []
+    pipeline = pipeline_for(spool, [recording_stage("upload", seen, fail=lambda payload: True)])
+    pipeline._retry_delay = lambda attempts: 60
+    pipeline.start()
+    job_id = pipeline.enqueue("call", {"n": 1})
+
+    assert wait_for(lambda: seen)
+    asyncio.run(pipeline.drain(5))
+    assert pipeline.poll() == 0
+    assert spool.due() == []
+    assert spool.due(now=time.time() + 120) == [job_id]
+    asyncio.run(pipeline.close(5))
+
+
+def test_job_is_dead_lettered_after_max_attempts_and_can_be_requeued(spool):
+    pipeline = pipeline_for(spool, [recording_stage("index", [], fail=lambda payload: True)])
+    pipeline.start()
+    job_id = pipeline.enqueue("call", {"n": 1})
+
+    assert wait_for(lambda: spool.counts() == {DEAD: 1})
+    asyncio.run(pipeline.close(5))
+    (dead_id, key, stage, attempts, error, _), = spool.dead()
+    assert (dead_id, key, stage, attempts) == (job_id, "call", "index", 3)
+    assert "index down" in error
+
+    assert spool.requeue_dead() == 1
+    assert spool.counts() == {"index": 1}
+    assert spool.due() == [job_id]
+
+
+def test_jobs_spooled_elsewhere_run_where_the_pipeline_started(spool):
+    seen = []
+    # A job process: spools, never runs stages
+    writer = pipeline_for(spool, [recording_stage("upload", seen)])
+    writer.enqueue("before-start", {"n": 1})
+    assert not writer.runs_here()
+    time.sleep(0.05)
+    assert seen == [] and spool.counts() == {"upload": 1}
+
+    runner = pipeline_for(spool, [recording_stage("upload", seen)])
+    assert runner.start() == 1
+    writer.enqueue("after-start", {"n": 2})
+
+    assert wait_for(lambda: spool.counts() == {})
+    asyncio.run(runner.close(5))
+    assert sorted(seen) == [("upload", 1), ("upload", 2)]
+
+
+def test_spool_from_before_persistent_retries_is_migrated(tmp_path):
+    path = str(tmp_path / "old.db")
+    db = sqlite3.connect(path)
+    db.executescript("""
+        CREATE TABLE jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, key TEXT NOT NULL, stage TEXT NOT NULL,
+            payload TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, last_error TEXT,
+            failed_stage TEXT, created_at REAL NOT NULL, updated_at REAL NOT NULL
+        );
+        INSERT INTO jobs (key, stage, payload, created_at, updated_at) VALUES ('call', 'upload', '{}', 0, 0);
+    """)
+    db.commit()
+    db.close()
+
+    assert Spool(path).due() == [1]
+
+
+def test_backlog_leaves_out_jobs_waiting_on_a_retry(spool):
+    pipeline = pipeline_for(spool, [recording_stage("upload", [], fail=lambda payload: True)])
+    pipeline._retry_delay = lambda attempts: 60
+    pipeline.start()
+    pipeline.enqueue("call", {"n": 1})
+
+    assert wait_for(lambda: pipeline.snapshot()["stage_failures"] == 1)
+    assert wait_for(lambda: pipeline.backlog() == 0)
+    assert spool.counts() == {"upload": 1}
+    asyncio.run(pipeline.close(5))
@@ -0,0 +1,110 @@
+import asyncio
+import os
+import tempfile
+from datetime import datetime, timezone
+
+import pytest
+
+from shared_cache import SharedCacheClient, SharedCacheServer
+
+
+class FakeRef:
+    def __init__(self, key, refs):
+        self.key = key
+        self.refs = refs
+        self.callback = None
+        self.unsubscribed = False
+
+    def on_snapshot(self, callback):
+        self.callback = callback
+        self.refs[self.key] = self
+        callback()  # current state, as Firestore delivers on subscribe
+        return self
+
+    def unsubscribe(self):
+        self.unsubscribed = True
+
+
+@pytest.fixture
+def socket_path():
+    # Unix socket paths are short; tmp_path can be too long
+    directory = tempfile.mkdtemp(prefix="cache-")
+    yield os.path.join(directory, "cache.sock")
+
+
+def run_with_server(socket_path, test, **kwargs):
+    async def run():
+        server = SharedCacheServer(socket_path, **kwargs)
+        await server.start()
+        try:
+            return await test(server, SharedCacheClient(socket_path, timeout=2))
+        finally:
+            await server.close()
+    return asyncio.run(run())
+
+
+async def settle(condition, timeout=2):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline
+        await asyncio.sleep(0.01)
+
+
+def test_values_round_trip_with_timestamps(socket_path):
+    updated = datetime(2026, 5, 1, 12, 30, 15, 250000, tzinfo=timezone.utc)
+
+    async def test(server, client):
+        await client.set("config:a", {"updatedAt": updated, "voice": "alloy", "tags": ["x"]}, ttl=60)
+        return await client.get("config:a"), await client.get("config:missing")
+
+    value, missing = run_with_server(socket_path, test)
+    assert value == {"updatedAt": updated, "voice": "alloy", "tags": ["x"]}
+    assert isinstance(value["updatedAt"], datetime)
+    assert missing is None
+
+
+def test_source_change_drops_the_entry(socket_path):
+    refs = {}
+
+    async def test(server, client):
+        await client.set("config:a", {"voice": "alloy"}, ttl=60)
+        await settle(lambda: "config:a" in refs and server._watches.get("config:a"))
+        assert await client.get("config:a") == {"voice": "alloy"}
+
+        refs["config:a"].callback()
+        await settle(lambda: "config:a" not in server._entries)
+        assert await client.get("config:a") is None
+        return server.stats
+
+    stats = run_with_server(socket_path, test, watch_ref=lambda key: FakeRef(key, refs))
+    assert stats["invalidations"] == 1
+    assert refs["config:a"].unsubscribed
+
+
+def test_watches_are_capped_and_released_with_their_entries(socket_path):
+    refs = {}
+
+    async def test(server, client):
+        for agent in "abc":
+            await client.set(f"kb:{agent}", ["doc"], ttl=60)
+        await settle(lambda: len(refs) == 3 and all(server._watches.values()))
+        assert list(server._watches) == ["kb:b", "kb:c"]
+        await settle(lambda: refs["kb:a"].unsubscribed)
+        # Still cached, now only bounded by its TTL
+        assert await client.get("kb:a") == ["doc"]
+
+        await client._request({"op": "delete", "key": "kb:b"})
+        await settle(lambda: refs["kb:b"].unsubscribed)
+        return server.stats
+
+    stats = run_with_server(socket_path, test, watch_ref=lambda key: FakeRef(key, refs), max_watches=2)
+    assert stats["watch_evictions"] == 1
+
+
+def test_unreachable_daemon_is_a_miss(socket_path):
+    async def test():
+        client = SharedCacheClient(socket_path, timeout=0.2)
+        await client.set("config:a", {"voice": "alloy"}, ttl=60)
+        return await client.get("config:a")
+
+    assert asyncio.run(test()) is None
@@ -0,0 +1,80 @@
+import asyncio
+import threading
+import time
+
+from summary_queue import SummaryBatchQueue, SummaryQueue
+
+
+def test_batches_fill_up_to_the_size_limit():
+    batches = []
+
+    async def handler(jobs):
+        batches.append([job for job, in jobs])
+        return [None] * len(jobs)
+
+    queue = SummaryBatchQueue(handler, batch_size=3, window=0.2, concurrency=1)
+    for job in range(7):
+        assert queue.submit(job)
+    assert asyncio.run(queue.drain(5))
+    assert [len(batch) for batch in batches] == [3, 3, 1]
+    assert sorted(job for batch in batches for job in batch) == list(range(7))
+    assert queue.snapshot()["completed"] == 7
+
+
+def test_window_closes_a_partial_batch():
+    batches = []
+
+    async def handler(jobs):
+        batches.append(len(jobs))
+        return [None] * len(jobs)
+
+    queue = SummaryBatchQueue(handler, batch_size=10, window=0.05, concurrency=1)
+    started = time.monotonic()
+    queue.submit("a")
+    assert asyncio.run(queue.drain(5))
+    assert batches == [1]
+    assert time.monotonic() - started < 1
+
+
+def test_exceptions_in_results_count_as_failures():
+    async def handler(jobs):
+        return [ValueError("bad") if job == "bad" else None for job, in jobs]
+
+    queue = SummaryBatchQueue(handler, batch_size=5, window=0.05, concurrency=1)
+    for job in ("ok", "bad", "ok"):
+        queue.submit(job)
+    asyncio.run(queue.drain(5))
+    snapshot = queue.snapshot()
+    assert snapshot["completed"] == 2
+    assert snapshot["failed"] == 1
+    assert snapshot["pending"] == 0
+
+
+def test_a_raising_handler_fails_its_whole_batch():
+    async def handler(jobs):
+        raise RuntimeError("down")
+
+    queue = SummaryBatchQueue(handler, batch_size=5, window=0.05, concurrency=1)
+    queue.submit(1)
+    queue.submit(2)
+    asyncio.run(queue.drain(5))
+    assert queue.snapshot()["failed"] == 2
+
+
+def test_full_and_closed_queues_reject():
+    release = threading.Event()
+
+    def handler(job):
+        release.wait(5)
+
+    queue = SummaryQueue(handler, concurrency=1, max_size=2)
+    assert queue.submit(1) and queue.submit(2)
+    assert not queue.submit(3)
+    release.set()
+
+    async def close():
+        return await queue.close(5)
+
+    assert asyncio.run(close())
+    assert not queue.submit(4)
+    assert queue.snapshot()["rejected"] == 2
@@ -0,0 +1,75 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+import summary_script
+from summary_script import BATCH_CONVERSATIONS_MARKER, summarize_batch, summarize_items
+
+
+class FakeOpenAI:
+    """Answers batch prompts with `answer(conversations)` and single prompts with a fixed summary."""
+
+    def __init__(self, answer=None):
+        self.answer = answer or (lambda conversations: [{"id": c["id"], "requestedData": c["id"]} for c in conversations])
+        self.batches = []
+        self.singles = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, messages, **kwargs):
+        prompt = messages[-1]["content"]
+        if BATCH_CONVERSATIONS_MARKER in prompt:
+            conversations = json.loads(prompt.split(BATCH_CONVERSATIONS_MARKER, 1)[1])
+            self.batches.append(conversations)
+            content = json.dumps({"summaries": self.answer(conversations)})
+        else:
+            self.singles += 1
+            content = json.dumps({"requestedData": "single"})
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+def item(agent_id, call_id):
+    return {"agent_id": agent_id, "call_id": call_id, "transcript": f"{agent_id} {call_id}",
+            "knowledge_text": f"kb of {agent_id}", "contact_info": {"email": f"{call_id}@{agent_id}"}}
+
+
+@pytest.fixture(autouse=True)
+def batch_size(monkeypatch):
+    monkeypatch.setattr(summary_script, "SUMMARY_ITEMS_PER_REQUEST", 5)
+
+
+def test_batches_never_mix_agents():
+    openai = FakeOpenAI()
+    items = [item("a", "1"), item("b", "2"), item("a", "3"), item("b", "4"), item("c", "5")]
+    results = asyncio.run(summarize_items(SimpleNamespace(openai=openai), items))
+
+    for conversations in openai.batches:
+        assert len({c["knowledgeBase"] for c in conversations}) == 1
+    assert sorted(len(conversations) for conversations in openai.batches) == [2, 2]
+    assert openai.singles == 1  # agent c is alone
+    assert [r["requestedData"] for r in results] == ["1", "2", "3", "4", "single"]
+
+
+def test_ambiguous_batch_answers_fall_back_to_single_requests():
+    def answer(conversations):
+        # "1" answered twice, "2" skipped, an id nobody asked for, "3" fine
+        return [{"id": "1", "requestedData": "x"}, {"id": "1", "requestedData": "y"},
+                {"id": "9", "requestedData": "stray"}, {"id": "3", "requestedData": "3"}]
+
+    openai = FakeOpenAI(answer)
+    results = asyncio.run(summarize_items(SimpleNamespace(openai=openai), [item("a", "1"), item("a", "2"), item("a", "3")]))
+    assert [r["requestedData"] for r in results] == ["single", "single", "3"]
+    assert "id" not in results[2]
+
+
+def test_repeated_call_id_is_not_matched_from_a_batch():
+    openai = FakeOpenAI()
+    results = asyncio.run(summarize_batch(SimpleNamespace(openai=openai), [item("a", "1"), item("a", "1"), item("a", "2")]))
+    assert results[0] is None and results[1] is None
+    assert results[2]["requestedData"] == "2"
+
+
+def test_summarize_batch_rejects_mixed_agents():
+    with pytest.raises(ValueError):
+        asyncio.run(summarize_batch(SimpleNamespace(openai=FakeOpenAI()), [item("a", "1"), item("b", "2")]))
@@ -0,0 +1,67 @@
+import os
+import subprocess
+
+import transcript_journal
+from transcript import Speaker, TurnLog
+from transcript_journal import (
+    JournalWriter, claim_journal, instance_id, journal_name, journal_path, orphaned_journals, process_started,
+    read_journal,
+)
+
+
+def exited_pid():
+    proc = subprocess.Popen(["true"])
+    proc.wait()
+    return proc.pid
+
+
+def write_journal(path, session_id="room-1", turns=("hello", "hi there")):
+    log = TurnLog()
+    writer = JournalWriter(os.path.dirname(path), flush_interval=0.01)
+    writer._ensure_started()
+    writer.append(path, {"type": "session", "session_id": session_id, "start_time_utc": "2026-01-01T00:00:00+00:00"})
+    for speaker, text in zip((Speaker.USER, Speaker.AGENT), turns):
+        writer.append(path, {"type": "turn", **log.record(log.append(speaker, text))})
+    assert writer.flush(5)
+
+
+def test_journal_name_cannot_escape_the_directory():
+    name = journal_name("../../etc/passwd")
+    assert "/" not in name and ".." not in name
+    assert journal_name("../../etc/passwd") != journal_name("__etc_passwd")
+
+
+def test_orphans_are_journals_of_dead_or_replaced_processes(tmp_path):
+    parent = os.getppid()
+    live = journal_path(tmp_path, "live", f"{parent}-{process_started(parent)}-aaaaaaaa")
+    reused = journal_path(tmp_path, "reused", f"{parent}-{process_started(parent) - 1}-bbbbbbbb")
+    dead = journal_path(tmp_path, "dead", f"{exited_pid()}-1-cccccccc")
+    legacy = journal_path(tmp_path, "legacy", f"{exited_pid()}-0123456789ab")
+    ours = journal_path(tmp_path, "ours", instance_id())
+    for path in (live, reused, dead, legacy, ours):
+        write_journal(path)
+
+    assert sorted(orphaned_journals(str(tmp_path))) == sorted([reused, dead, legacy])
+
+
+def test_claimed_journal_is_recovered_once(tmp_path):
+    orphan = journal_path(tmp_path, journal_name("room-1"), f"{exited_pid()}-1-dddddddd")
+    write_journal(orphan)
+    with open(orphan, "a", encoding="utf-8") as f:
+        f.write('{"type": "turn", "speak')  # torn by the crash
+
+    claimed = claim_journal(orphan)
+    assert claimed == journal_path(tmp_path, journal_name("room-1"))
+    assert claim_journal(orphan) is None
+    assert orphaned_journals(str(tmp_path)) == []
+
+    session = read_journal(claimed)
+    assert session["session_id"] == "room-1"
+    assert [record["text"] for record in session["turns"].iter_records()] == ["hello", "hi there"]
+
+
+def test_instance_id_changes_in_a_forked_child(monkeypatch):
+    parent_id = instance_id()
+    monkeypatch.setattr(transcript_journal, "_instance", transcript_journal._instance)
+    monkeypatch.setattr(transcript_journal.os, "getpid", lambda: os.getppid())
+    assert instance_id() != parent_id
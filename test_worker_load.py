@@ -0,0 +1,23 @@
+from worker_load import LoadMonitor
+
+
+def monitor(**kwargs):
+    return LoadMonitor(sessions_fn=lambda: 0, pending_summaries_fn=lambda: 0,
+                       max_sessions=10, max_pending_summaries=10, lag_budget=0.1, **kwargs)
+
+
+def test_job_process_lag_counts_toward_load(monkeypatch):
+    monkeypatch.setattr(LoadMonitor, "cpu", staticmethod(lambda: 0.0))
+    load = monitor(remote_lag_fn=lambda: [0.02, 0.05])
+    assert load.compute(active_jobs=1) == 0.5
+    assert load.last["loop_lag"] == 0.5
+
+
+def test_unavailable_remote_lag_falls_back_to_local(monkeypatch):
+    monkeypatch.setattr(LoadMonitor, "cpu", staticmethod(lambda: 0.0))
+
+    def broken():
+        raise OSError("metrics dir gone")
+
+    assert monitor(remote_lag_fn=broken).compute(active_jobs=2) == 0.2
+    assert monitor(remote_lag_fn=lambda: []).compute(active_jobs=2) == 0.2
@@ -1,15 +1,110 @@
+import asyncio
 import os
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from livekit import api
+import jwt
+import logging
+import time
 import uuid
 import json
 
+from log_pipeline import setup_queue_logging
+
 # Load .env file
 load_dotenv()
 
-app = FastAPI()
+setup_queue_logging(json_format=os.getenv("LOG_FORMAT", "text") == "json")
+logger = logging.getLogger("token-server")
+
+# ✅ Credentials and settings are read and validated once, not per request
+LIVEKIT_API_KEY = os.getenv("LIVEKIT_API_KEY")
+LIVEKIT_API_SECRET = os.getenv("LIVEKIT_API_SECRET")
+LIVEKIT_PUBLIC_URL = os.getenv("LIVEKIT_PUBLIC_URL", "wss://livekit.callshivai.com")
+TOKEN_SIGNING_THREADS = int(os.getenv("TOKEN_SIGNING_THREADS", "0"))
+TOKEN_TTL_SECONDS = int(os.getenv("TOKEN_TTL_SECONDS", "21600"))
+# Creating the room up front dispatches the agent job before the browser connects
+TOKEN_PREFETCH_HINTS = os.getenv("TOKEN_PREFETCH_HINTS", "1") == "1"
+LIVEKIT_API_URL = os.getenv("LIVEKIT_URL", LIVEKIT_PUBLIC_URL)
+ROOM_EMPTY_TIMEOUT_SECONDS = int(os.getenv("ROOM_EMPTY_TIMEOUT_SECONDS", "120"))
+# Each hint dispatches a job that opens a Realtime session; cap how many rooms one process
+# pre-creates per ROOM_EMPTY_TIMEOUT_SECONDS window (tokens are still issued past it)
+TOKEN_HINT_MAX_ROOMS = int(os.getenv("TOKEN_HINT_MAX_ROOMS", "500"))
+TOKEN_SERVER_HOST = os.getenv("TOKEN_SERVER_HOST", "0.0.0.0")
+TOKEN_SERVER_PORT = int(os.getenv("TOKEN_SERVER_PORT", "3000"))
+TOKEN_SERVER_WORKERS = int(os.getenv("TOKEN_SERVER_WORKERS", "1"))
+
+CREDENTIALS_OK = bool(LIVEKIT_API_KEY and LIVEKIT_API_SECRET)
+CREDENTIALS_ERROR = {"error": "LIVEKIT_API_KEY or LIVEKIT_API_SECRET not found in .env file"}
+
+# Every participant gets the same permissions; only the room differs
+GRANT_TEMPLATE = dict(
+    room_join=True,
+    can_publish=True,
+    can_subscribe=True,
+    can_publish_data=True,
+    can_update_own_metadata=True
+)
+# Serialized once through the SDK so claim names match what LiveKit expects
+VIDEO_CLAIMS = api.AccessToken("template", "template").with_grants(
+    api.VideoGrants(**GRANT_TEMPLATE)
+).claims.asdict()["video"]
+
+# Signing inline is ~30µs; a thread pool only adds GIL hand-offs, so it is opt-in.
+# Scale out with TOKEN_SERVER_WORKERS instead.
+signing_executor = ThreadPoolExecutor(max_workers=TOKEN_SIGNING_THREADS, thread_name_prefix="token-sign") if TOKEN_SIGNING_THREADS else None
+
+livekit_api = None
+hint_tasks = set()
+hinted_rooms = OrderedDict()  # room -> monotonic time of its hint
+
+def claim_hint(room):
+    """True if `room` should get a prefetch hint: not hinted recently and under the cap."""
+    now = time.monotonic()
+    while hinted_rooms and now - next(iter(hinted_rooms.values())) > ROOM_EMPTY_TIMEOUT_SECONDS:
+        hinted_rooms.popitem(last=False)
+    if room in hinted_rooms or len(hinted_rooms) >= TOKEN_HINT_MAX_ROOMS:
+        return False
+    hinted_rooms[room] = now
+    return True
+
+async def send_prefetch_hint(room, metadata):
+    """
+    Create the room with the call's metadata so the worker is dispatched now
+    and reads agent_id/language from the job, before the participant joins.
+    """
+    try:
+        await livekit_api.room.create_room(api.CreateRoomRequest(
+            name=room,
+            metadata=metadata,
+            empty_timeout=ROOM_EMPTY_TIMEOUT_SECONDS,
+        ))
+    except Exception as e:
+        # Only a latency optimization: the worker still falls back to participant metadata
+        logger.warning("Prefetch hint failed", extra={"room": room, "error": str(e)})
+
+@asynccontextmanager
+async def lifespan(app):
+    global livekit_api
+    if CREDENTIALS_OK and TOKEN_PREFETCH_HINTS:
+        livekit_api = api.LiveKitAPI(LIVEKIT_API_URL, LIVEKIT_API_KEY, LIVEKIT_API_SECRET)
+    if not CREDENTIALS_OK:
+        logger.error("LIVEKIT_API_KEY or LIVEKIT_API_SECRET not set; /token will return errors")
+    else:
+        logger.info("Token server ready", extra={"livekit_url": LIVEKIT_PUBLIC_URL, "signing_threads": TOKEN_SIGNING_THREADS})
+    yield
+    if hint_tasks:
+        await asyncio.wait(hint_tasks, timeout=5)
+    if livekit_api:
+        await livekit_api.aclose()
+    if signing_executor:
+        signing_executor.shutdown(wait=False)
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -18,72 +113,72 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+def sign_token(room, identity, metadata):
+    """Same claims as api.AccessToken.to_jwt(), without rebuilding the grants per call."""
+    now = int(time.time())
+    claims = {
+        "video": {**VIDEO_CLAIMS, "room": room},
+        "metadata": metadata,
+        "sub": identity,
+        "iss": LIVEKIT_API_KEY,
+        "nbf": now,
+        "exp": now + TOKEN_TTL_SECONDS,
+    }
+    return jwt.encode(claims, LIVEKIT_API_SECRET, algorithm="HS256")
+
 @app.post("/token")
 async def get_token(data: dict):
+    if not CREDENTIALS_OK:
+        return CREDENTIALS_ERROR
+
     room = data.get("call_id", f"room_{uuid.uuid4().hex[:8]}")
     identity = f"user_{uuid.uuid4().hex[:8]}"
-    
-    # ✅ Get API keys from environment
-    api_key = os.getenv("LIVEKIT_API_KEY")
-    api_secret = os.getenv("LIVEKIT_API_SECRET")
-    
-    # Validate keys are loaded
-    if not api_key or not api_secret:
-        return {
-            "error": "LIVEKIT_API_KEY or LIVEKIT_API_SECRET not found in .env file"
-        }
-    
-    # Create token
-    token = api.AccessToken(api_key, api_secret)
-    token.with_identity(identity)
-    
-    # Add grants
-    grants = api.VideoGrants(
-        room_join=True,
-        room=room,
-        can_publish=True,
-        can_subscribe=True,
-        can_publish_data=True,
-        can_update_own_metadata=True
-    )
-    
-    token.with_grants(grants)
-    
-    # Add metadata
-    token.with_metadata(json.dumps({
+
+    metadata = json.dumps({
         "language": data.get("language", "en"),
         "agent_id": data.get("agent_id"),
         "call_id": data.get("call_id")
-    }))
-    
-    jwt = token.to_jwt()
-    
-    # Debug: print to console (remove in production)
-    print(f"✅ Token generated for room: {room}")
-    print(f"   Identity: {identity}")
-    print(f"   Language: {data.get('language', 'en')}")
-    
+    })
+
+    if livekit_api and data.get("agent_id") and claim_hint(room):
+        task = asyncio.create_task(send_prefetch_hint(room, metadata))
+        hint_tasks.add(task)
+        task.add_done_callback(hint_tasks.discard)
+
+    if signing_executor:
+        access_token = await asyncio.get_running_loop().run_in_executor(signing_executor, sign_token, room, identity, metadata)
+    else:
+        access_token = sign_token(room, identity, metadata)
+
+    logger.info("Token generated", extra={"room": room, "identity": identity, "language": data.get("language", "en")})
+
     return {
-        "token": jwt,
-        "url": "wss://livekit.callshivai.com"
+        "token": access_token,
+        "url": LIVEKIT_PUBLIC_URL
     }
 
 if __name__ == "__main__":
     import uvicorn
-    
+
     # Verify .env is loaded
     print("=" * 50)
     print("Starting Token Server")
     print("=" * 50)
-    if os.getenv("LIVEKIT_API_KEY"):
-        print(f"✅ API Key loaded: {os.getenv('LIVEKIT_API_KEY')[:10]}...")
+    if LIVEKIT_API_KEY:
+        print(f"✅ API Key loaded: {LIVEKIT_API_KEY[:10]}...")
     else:
         print("❌ API Key NOT loaded - check .env file!")
-    
-    if os.getenv("LIVEKIT_API_SECRET"):
-        print(f"✅ API Secret loaded: {os.getenv('LIVEKIT_API_SECRET')[:10]}...")
+
+    if LIVEKIT_API_SECRET:
+        print(f"✅ API Secret loaded: {LIVEKIT_API_SECRET[:10]}...")
     else:
         print("❌ API Secret NOT loaded - check .env file!")
+    print(f"Workers: {TOKEN_SERVER_WORKERS}, URL: {LIVEKIT_PUBLIC_URL}")
     print("=" * 50)
-    
-    uvicorn.run(app, host="0.0.0.0", port=3000)
+
+    if TOKEN_SERVER_WORKERS > 1:
+        # Multiple workers need an import string so each process loads its own app
+        uvicorn.run("token_server:app", host=TOKEN_SERVER_HOST, port=TOKEN_SERVER_PORT,
+                    workers=TOKEN_SERVER_WORKERS, access_log=False)
+    else:
+        uvicorn.run(app, host=TOKEN_SERVER_HOST, port=TOKEN_SERVER_PORT, access_log=False)
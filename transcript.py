@@ -0,0 +1,102 @@
+# transcript.py
+import time
+from datetime import datetime, timezone
+from enum import IntEnum
+
+
+class Speaker(IntEnum):
+    USER = 0
+    AGENT = 1
+
+    @property
+    def source(self):
+        return "user" if self is Speaker.USER else "agent"
+
+    @property
+    def label(self):
+        return "User" if self is Speaker.USER else "Agent"
+
+
+class Turn:
+    __slots__ = ("speaker", "text", "t_ns")
+
+    def __init__(self, speaker, text, t_ns):
+        self.speaker = speaker
+        self.text = text
+        self.t_ns = t_ns
+
+
+class TurnLog:
+    """
+    Ordered turns of one call. Timestamps are monotonic ns, converted to
+    wall-clock time only when serialized.
+    """
+
+    __slots__ = ("turns", "user_count", "agent_count", "_wall_anchor_ns", "_mono_anchor_ns")
+
+    def __init__(self):
+        self.turns = []
+        self.user_count = 0
+        self.agent_count = 0
+        self._wall_anchor_ns = time.time_ns()
+        self._mono_anchor_ns = time.monotonic_ns()
+
+    def __len__(self):
+        return len(self.turns)
+
+    def __iter__(self):
+        return iter(self.turns)
+
+    def append(self, speaker, text, t_ns=None):
+        turn = Turn(speaker, text, time.monotonic_ns() if t_ns is None else t_ns)
+        self.turns.append(turn)
+        if speaker is Speaker.USER:
+            self.user_count += 1
+        else:
+            self.agent_count += 1
+        return turn
+
+    def timestamp_utc(self, turn):
+        wall_ns = self._wall_anchor_ns + (turn.t_ns - self._mono_anchor_ns)
+        return datetime.fromtimestamp(wall_ns / 1e9, tz=timezone.utc).isoformat()
+
+    def record(self, turn):
+        return {"text": turn.text, "timestamp_utc": self.timestamp_utc(turn), "source": turn.speaker.source}
+
+    def iter_records(self, speaker=None):
+        for turn in self.turns:
+            if speaker is None or turn.speaker is speaker:
+                yield self.record(turn)
+
+    def iter_transcript_lines(self):
+        for turn in self.turns:
+            yield f"{turn.speaker.label}: {turn.text}"
+
+    def transcript_text(self):
+        return "\n".join(self.iter_transcript_lines())
+
+    @classmethod
+    def from_records(cls, records):
+        """Rebuild a log from serialized records (wall-clock ISO timestamps)."""
+        log = cls()
+        log._wall_anchor_ns = 0
+        log._mono_anchor_ns = 0
+        for record in records:
+            try:
+                t_ns = int(datetime.fromisoformat(record["timestamp_utc"]).timestamp() * 1e9)
+            except (KeyError, TypeError, ValueError):
+                t_ns = log.turns[-1].t_ns if log.turns else 0
+            speaker = Speaker.USER if record.get("source") == "user" else Speaker.AGENT
+            log.append(speaker, record.get("text", ""), t_ns)
+        return log
+
+
+def call_document(session_data):
+    """Firestore call_analytics document for a session holding a TurnLog under "turns"."""
+    log = session_data["turns"]
+    document = {key: value for key, value in session_data.items() if key != "turns"}
+    document["user_transcripts"] = list(log.iter_records(Speaker.USER))
+    document["agent_transcripts"] = list(log.iter_records(Speaker.AGENT))
+    document["total_user_messages"] = log.user_count
+    document["total_agent_responses"] = log.agent_count
+    return document
@@ -0,0 +1,238 @@
+# transcript_journal.py
+import glob
+import hashlib
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import time
+import uuid
+
+from transcript import TurnLog
+
+try:
+    import psutil
+    PSUTIL_AVAILABLE = True
+except ImportError:
+    PSUTIL_AVAILABLE = False
+
+logger = logging.getLogger("transcript-journal")
+
+TRANSCRIPT_JOURNAL_DIR = os.getenv(
+    "TRANSCRIPT_JOURNAL_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "journal")
+)
+JOURNAL_FLUSH_INTERVAL_SECONDS = float(os.getenv("JOURNAL_FLUSH_INTERVAL_SECONDS", "1.0"))
+JOURNAL_FLUSH_MAX_EVENTS = int(os.getenv("JOURNAL_FLUSH_MAX_EVENTS", "500"))
+
+_instance = (None, None)
+
+
+def process_started(pid):
+    """Start time of `pid` as an integer, or None if it is gone or can't be read."""
+    if PSUTIL_AVAILABLE:
+        try:
+            return int(psutil.Process(pid).create_time() * 100)
+        except psutil.Error:
+            return None
+    try:
+        with open(f"/proc/{pid}/stat", encoding="ascii") as f:
+            # Field 22 (starttime), counted after the parenthesized command name
+            return int(f.read().rsplit(")", 1)[1].split()[19])
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def instance_id():
+    """
+    <pid>-<start time>-<random>, unique per process run: a restarted
+    container worker is often pid 1 again, and the start time tells a
+    reused pid from the process that wrote the journal.
+    """
+    global _instance
+    pid = os.getpid()
+    # Regenerated after a fork, so job processes never share their parent's id
+    if _instance[0] != pid:
+        _instance = (pid, f"{pid}-{process_started(pid) or 0}-{uuid.uuid4().hex[:8]}")
+    return _instance[1]
+
+
+def journal_name(session_id):
+    """
+    File-safe name for a session: the room name comes from the client's
+    call_id, so it is reduced to [A-Za-z0-9_-] and suffixed with a hash.
+    """
+    safe = re.sub(r"[^A-Za-z0-9_-]", "_", str(session_id))[:64]
+    digest = hashlib.sha256(str(session_id).encode("utf-8")).hexdigest()[:12]
+    return f"{safe}-{digest}"
+
+
+def journal_path(directory, name, owner=None):
+    return os.path.join(directory, f"{name}.{owner or instance_id()}.jsonl")
+
+
+class JournalWriter:
+    """
+    Append-only JSONL journal per live call.
+
+    Callers only enqueue; one background thread batches events and appends
+    them (with fsync) every flush interval, so the event loop never touches
+    the disk. Files are named <journal_name>.<instance_id>.jsonl so recovery
+    can tell journals of dead processes from ones still being written.
+    """
+
+    def __init__(self, directory=TRANSCRIPT_JOURNAL_DIR,
+                 flush_interval=JOURNAL_FLUSH_INTERVAL_SECONDS, max_events=JOURNAL_FLUSH_MAX_EVENTS):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.max_events = max_events
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._idle = threading.Event()
+        self._idle.set()
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None:
+                os.makedirs(self.directory, exist_ok=True)
+                self._thread = threading.Thread(target=self._run, name="transcript-journal", daemon=True)
+                self._thread.start()
+
+    def open(self, session_id, header):
+        self._ensure_started()
+        path = journal_path(self.directory, journal_name(session_id))
+        self._put(("append", path, {"type": "session", **header}))
+        return path
+
+    def append(self, path, record):
+        if path:
+            self._put(("append", path, record))
+
+    def discard(self, path):
+        if path:
+            self._put(("discard", path, None))
+
+    def _put(self, item):
+        with self._lock:
+            self._pending += 1
+            self._idle.clear()
+        self._queue.put(item)
+
+    def flush(self, timeout=None):
+        """Block until everything queued so far has reached disk."""
+        return self._idle.wait(timeout)
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.max_events:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+            except Exception as e:
+                logger.error(f"Journal write error: {e}")
+            with self._lock:
+                self._pending -= len(batch)
+                if not self._pending:
+                    self._idle.set()
+
+    def _write(self, batch):
+        pending = {}
+        for action, path, record in batch:
+            if action == "append":
+                pending.setdefault(path, []).append(json.dumps(record, default=str))
+            else:
+                pending.pop(path, None)
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+        for path, lines in pending.items():
+            with open(path, "a", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _owner_alive(owner):
+    parts = owner.split("-")
+    pid = int(parts[0])
+    # Another run with our pid can only be a previous incarnation of this process
+    if pid == os.getpid():
+        return False
+    if len(parts) == 3 and parts[1] != "0":
+        return process_started(pid) == int(parts[1])
+    # Names from before start times were recorded
+    return _pid_alive(pid)
+
+
+def read_journal(path):
+    """Rebuild a call_sessions-style dict (with a TurnLog) from a journal file."""
+    session_data = None
+    records = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A torn last line from a crash mid-append
+                continue
+            kind = record.pop("type", None)
+            if kind == "session":
+                session_data = record
+            elif kind == "turn":
+                records.append(record)
+    if session_data is None:
+        return None
+    session_data["turns"] = TurnLog.from_records(records)
+    if records:
+        session_data["end_time_utc"] = records[-1].get("timestamp_utc")
+    return session_data
+
+
+def orphaned_journals(directory=TRANSCRIPT_JOURNAL_DIR):
+    """Journal files whose writing process is gone."""
+    paths = []
+    for path in glob.glob(os.path.join(directory, "*.jsonl")):
+        try:
+            owner = os.path.basename(path).rsplit(".", 2)[1]
+            if owner == instance_id() or _owner_alive(owner):
+                continue
+        except (IndexError, ValueError):
+            continue
+        paths.append(path)
+    return paths
+
+
+def claim_journal(path):
+    """Rename an orphaned journal under this process; None if another process claimed it first."""
+    name = os.path.basename(path).rsplit(".", 2)[0]
+    claimed = journal_path(os.path.dirname(path), name)
+    try:
+        os.rename(path, claimed)
+    except OSError:
+        return None
+    return claimed
+
+
+journal_writer = JournalWriter()
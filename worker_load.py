@@ -0,0 +1,100 @@
+# worker_load.py
+import asyncio
+import logging
+import os
+import threading
+import time
+
+try:
+    import psutil
+    PSUTIL_AVAILABLE = True
+except ImportError:
+    PSUTIL_AVAILABLE = False
+
+logger = logging.getLogger("worker-load")
+
+WORKER_MAX_SESSIONS = int(os.getenv("WORKER_MAX_SESSIONS", "25"))
+WORKER_MAX_PENDING_SUMMARIES = int(os.getenv("WORKER_MAX_PENDING_SUMMARIES", "200"))
+WORKER_LAG_BUDGET_SECONDS = float(os.getenv("WORKER_LAG_BUDGET_SECONDS", "0.1"))
+WORKER_LOAD_THRESHOLD = float(os.getenv("WORKER_LOAD_THRESHOLD", "0.75"))
+LAG_PROBE_INTERVAL_SECONDS = 0.5
+
+
+class LoadMonitor:
+    """
+    Folds event-loop lag, CPU, active sessions and pending summary jobs into
+    one 0..1 load figure. Each component is normalized against its budget
+    and the worst one wins, so any single bottleneck takes the worker out of
+    dispatch. `remote_lag_fn` returns the lags measured in job processes,
+    whose loops this process can't probe.
+    """
+
+    def __init__(self, sessions_fn, pending_summaries_fn, remote_lag_fn=None,
+                 max_sessions=WORKER_MAX_SESSIONS,
+                 max_pending_summaries=WORKER_MAX_PENDING_SUMMARIES,
+                 lag_budget=WORKER_LAG_BUDGET_SECONDS):
+        self.sessions_fn = sessions_fn
+        self.pending_summaries_fn = pending_summaries_fn
+        self.remote_lag_fn = remote_lag_fn
+        self.max_sessions = max_sessions
+        self.max_pending_summaries = max_pending_summaries
+        self.lag_budget = lag_budget
+        self._lags = {}
+        self._lock = threading.Lock()
+        self.last = {}
+        if PSUTIL_AVAILABLE:
+            psutil.cpu_percent(None)
+
+    def watch_current_loop(self):
+        """Start measuring lag on the running loop (idempotent per loop)."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if loop in self._lags:
+                return
+            self._lags[loop] = 0.0
+
+        def probe(scheduled_at):
+            if loop.is_closed():
+                return
+            lag = max(0.0, time.monotonic() - scheduled_at - LAG_PROBE_INTERVAL_SECONDS)
+            with self._lock:
+                # Exponential moving average so one slow tick doesn't flap availability
+                self._lags[loop] = 0.7 * self._lags.get(loop, 0.0) + 0.3 * lag
+            loop.call_later(LAG_PROBE_INTERVAL_SECONDS, probe, time.monotonic())
+
+        loop.call_later(LAG_PROBE_INTERVAL_SECONDS, probe, time.monotonic())
+
+    def loop_lag(self):
+        with self._lock:
+            for loop in [loop for loop in self._lags if loop.is_closed()]:
+                del self._lags[loop]
+            return max(self._lags.values(), default=0.0)
+
+    def worst_lag(self):
+        lag = self.loop_lag()
+        if self.remote_lag_fn:
+            try:
+                lag = max(lag, *self.remote_lag_fn())
+            except Exception as e:
+                logger.debug(f"Remote loop lag unavailable: {e}")
+        return lag
+
+    @staticmethod
+    def cpu():
+        if PSUTIL_AVAILABLE:
+            return psutil.cpu_percent(None) / 100
+        try:
+            return os.getloadavg()[0] / (os.cpu_count() or 1)
+        except (AttributeError, OSError):
+            return 0.0
+
+    def compute(self, active_jobs=0):
+        sessions = max(active_jobs, self.sessions_fn())
+        components = {
+            "cpu": self.cpu(),
+            "loop_lag": self.worst_lag() / self.lag_budget if self.lag_budget else 0.0,
+            "sessions": sessions / self.max_sessions if self.max_sessions else 0.0,
+            "summaries": self.pending_summaries_fn() / self.max_pending_summaries if self.max_pending_summaries else 0.0,
+        }
+        self.last = components
+        return min(1.0, max(components.values()))